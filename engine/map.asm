@@ -12,19 +12,45 @@
 
 ;
 ; Represents a background layer in the map
+; A dense background stores the whole tilemap as words, laid out exactly as
+; VRAM expects it, so it can be uploaded with a single DMA. It is at most one
+; 32x32 screen (2 KB), the size of a BG tilemap in docs/vram-layout.md.
 ;
+.define BG_LAYER_ID_MASK    $00FF ; Low byte of the id is the layer
+.define BG_LAYER_DENSE      $0100 ; Set when data is a full tilemap
+.define BG_LAYER_METATILE   $0200 ; Set when data is a metatile index grid
+
+.define MAP_VERSION_METATILE 3    ; Map version when backgrounds are metatile grids
+
 .struct Background
-    id          dw    ; 8-bit ID of the background layer (1..4)
-    num_tiles   dw    ; Number of tiles in the background
+    id          dw    ; 8-bit ID of the background layer (1..4) and flags
+    num_tiles   dw    ; Number of tiles (or tilemap words when dense)
     data        db    ; Where all the tile data starts
 .endst
 
+;
+; Dictionary of metatiles shared by every metatile background. It follows the
+; last background. Each metatile is size * size tilemap words, row-major, and
+; metatile 0 is always empty. Metatile backgrounds store a row-major grid of
+; index_bytes wide indices into this dictionary.
+; The loader does not expand metatile backgrounds. Map_Init rejects maps of
+; version MAP_VERSION_METATILE and Map_LoadBackgrounds stops at the first
+; metatile layer, since its size depends on index_bytes.
+;
+.struct MetatileSet
+    magic           ds 3  ; "MTS"
+    size            db    ; Width and height of a metatile in tiles
+    index_bytes     db    ; Bytes per index in the background grids (1 or 2)
+    num_metatiles   dw    ; Number of metatiles in the dictionary
+    data            db    ; Where the metatile words start
+.endst
+
 ;
 ; Expects a packed tileset in the following format:
 ;
 .struct SpriteSheet
     magic       ds 3  ; "SPR"
-    bpp         db ; Bits per pixel
+    bpp         db ; Bits per pixel (2, 4 or 8), the depth of the BGs it is for
     size        dw ; Total number of bytes in this sheet
     width       db ; Width in pixels per tile
     height      db ; Height in pixels per tile
@@ -38,7 +64,7 @@
 ;
 .struct Palette
     magic       ds 3  ; "PAL"
-    num_colors  db ; Number of colors in the palette
+    num_colors  db ; Number of colors in the palette (1 << bpp, 0 for 256)
     size        dw ; Total number of bytes in this palette
     data        db ; Where the palette data starts
 .endst
@@ -219,6 +245,12 @@ Map_Init:
         bcc @Error_BadMagic
         iny
 
+    @CheckVersion:
+        ; Metatile backgrounds are not expanded by the loader
+        lda map.version, X
+        cmp #MAP_VERSION_METATILE
+        beq @Error_Unsupported
+
     @MagicSuccess:
         A16
         lda 3, S
@@ -226,6 +258,7 @@ Map_Init:
         jsr Map_Load
 
     @Error_BadMagic:
+    @Error_Unsupported:
         nop
 
     A16
@@ -400,7 +433,13 @@ Map_LoadBackgrounds:
         cpy #$00
         beq @Done
 
+        ; Metatile grids are not expanded, skip the remaining layers
         lda bg_layer.id, X
+        and #BG_LAYER_METATILE
+        bne @Done
+
+        lda bg_layer.id, X
+        and #BG_LAYER_ID_MASK
         cmp #$01
         beq @BG1
         bra @BG2
@@ -428,7 +467,7 @@ Map_LoadBackgrounds:
 ; Read all the tiles data from the map into bgmap
 ; Expects that A register points to the background tilemap VRAM
 ; Expects that X register points to the background layer object
-; Does not need to preserve any register.
+; Leaves X pointing at the next background layer object.
 ;
 Map_LoadTiles:
     phy
@@ -440,6 +479,15 @@ Map_LoadTiles:
     sta VMAIN
 
     A16
+    ; Dense backgrounds are uploaded with a single DMA
+    lda bg_layer.id, X
+    and #BG_LAYER_DENSE
+    beq @LoadSparse
+    lda 1, S                    ; Restore the tilemap base
+    jsr Map_LoadDenseTiles
+    bra @Done
+
+    @LoadSparse:
     ; Put the number of tiles on the stack
     lda bg_layer.num_tiles, X
     tay
@@ -474,11 +522,59 @@ Map_LoadTiles:
         dey
         bne @LoadTile
 
+    @Done:
     ; Restore the stack
     pla
     ply
 
     rts
 
+;
+; DMA a dense background tilemap into VRAM. Must run during forced blank.
+; Expects that A register points to the background tilemap VRAM
+; Expects that X register points to the background layer object
+; Leaves X pointing at the next background layer object.
+;
+Map_LoadDenseTiles:
+    ; Tilemap words are written starting at the tilemap base
+    sta VMADDL
+
+    ; Two bytes are transferred per tilemap word
+    lda bg_layer.num_tiles, X
+    asl
+    sta DAS0L
+    pha
+
+    ; The tilemap words follow the background header
+    txa
+    clc
+    adc #bg_layer.data
+    sta A1T0L
+
+    ; Advance X past the tilemap to the next background
+    clc
+    adc 1, S
+    tax
+    pla
+
+    A8
+    ; The map data lives in the current data bank
+    phb
+    pla
+    sta A1B0
+
+    ; Incrementing source, WORD to $2118/9
+    lda #%00000001
+    sta DMAP0
+    lda #$18
+    sta BBAD0
+
+    ; Start DMA transfer on channel 0
+    lda #$01
+    sta MDMAEN
+
+    A16
+    rts
+
 .8bit
 .ends
\ No newline at end of file
@@ -2,6 +2,9 @@
 .define SPRITE_SIZE $1000
 .define MAX_SPRITE_OBJECTS 10
 
+; The top bits of TileHeader.oam_size hold the flip, like the OAM attributes
+.define TILE_OAM_SIZE_MASK $3F
+
 ;
 ; A Tile is a single SNES object that makes up a larger sprite.
 ; This is the fundamental unit of a sprite. It is either large or small.
@@ -15,7 +18,7 @@
 .struct TileHeader
     magic          ds  3 ; Magic string "TIL"
     prog_ram_addr  db ; Address of tile data in program RAM
-    oam_size       db ; Size of OAM entry (small or large)
+    oam_size       db ; Size of OAM entry (small or large), bit 6/7 H/V flip
     rx             db ; Relative X position of tile to the layer
     ry             db ; Relative Y position of tile to the layer
 .endst
@@ -1132,8 +1135,24 @@ Sprite_SetFrame:
 
                 A8
                 lda tile_hdr.oam_size.w, X
+                and #TILE_OAM_SIZE_MASK
                 sta oam_object.size
 
+                ; Shift the flip bits down to 000000VH
+                lda tile_hdr.oam_size.w, X
+                lsr
+                lsr
+                lsr
+                lsr
+                lsr
+                lsr
+                pha
+                and #$01
+                sta oam_object.flip_h
+                pla
+                lsr
+                sta oam_object.flip_v
+
                 lda tile_hdr.rx.w, X
                 sta oam_object.x
 
@@ -12,6 +12,49 @@ sprite's directory. The directory should contain the following files:
     {directory_name}.bin
     {directory_name}.pal
 
+Many sprites can be converted at once by repeating -i or by passing --all
+with a root such as resources/sprites. The sprites are then converted across
+a process pool and a single summary is printed at the end. When -b is not
+given, the bank is read from the sprite's previously generated .i file.
+
+With -t optimal every cel is covered with the fewest objects of the small
+and large sizes given by -s (8,32 by default, as set in OBSEL), skipping
+cells that are fully transparent. The default size-group tiling picks a
+single object size per layer.
+
+With --dma-schedule a table of the characters every frame needs is appended
+after the tags, as contiguous runs of the sheet to DMA into a small VRAM slot
+at Sprite_{Name}@DMA, and the tiles address that slot instead of the sheet.
+Frames that upload more than --dma-budget bytes are reported, and
+Sprite_{Name}@DMASlot holds the slot size in words.
+
+With --delta-frames every frame after the first one played only stores the
+tiles (TID records in LYD layers of an FRD frame) and, with --dma-schedule,
+the character uploads that changed since the frame shown before it. Reverse
+tags compare with the next frame and ping-pong tags with both neighbors. A
+complete frame is kept every --keyframe-interval frames.
+
+With --oam-table every frame is also written to {name}.oam as a contiguous
+array of 4 byte OAM low table entries (X, Y, character, flips relative to the
+sprite) followed by its packed high table size bits. The frames of a tag are
+reached through the offsets at Sprite_{Name}@OAM@{Tag}, so the engine only
+adds the sprite position, VRAM name, palette and priority, then copies.
+
+With --format release the records are written without their magic strings
+and implied offsets. A single SPC magic and format version lead the file, the
+sections follow each other, and a frame packs its layer count and delta flag
+into one byte. Both formats are decoded and compared before the release file
+is written, and the bytes saved are reported.
+
+With --profile the wall time of every stage (JSON load, OAM sizing, palette,
+sheet, tags, serialization, file writes) and counters of the tags, frames,
+layers, tiles and bytes per section are printed as JSON, or written to the
+given file. --cprofile DIR also writes {name}.pstats for every sprite.
+
+With -d the sheet is rewritten to only hold the objects the tiles use, with
+identical and mirrored objects stored once. The flip of each tile is stored
+in bits 6 (H) and 7 (V) of its oam_size, matching the OAM attribute byte.
+
 Exporting from Aseprite
 =======================
 When exporting from Aseprite, the following options should be selected:
@@ -117,17 +160,24 @@ import struct
 import json
 import logging
 import pprint
-import cv2
 import numpy as np
+import pngsheet
+import snespal
+import snesgfx
+import warmcache
+
+from assetinspect import read_sprite_bank
+from profiling import Profiler
 
 from collections import defaultdict
+from collections.abc import Sequence
 from pathlib import Path
 from dataclasses import dataclass
 from typing import List
 
 import struct
-from dataclasses import dataclass, field
-from typing import List, Tuple
+from dataclasses import astuple, dataclass, field
+from typing import Dict, List, Optional, Tuple
 
 
 logger_build = logging.getLogger('build')
@@ -152,76 +202,201 @@ class Helpers:
 
     OAM_GROUP_TO_PROG = { 'small': OAM_SIZE_SMALL_PROG, 'big': OAM_SIZE_LARGE_PROG }
 
+    OAM_SIZE_MASK = 0x3F
+    """Bits of TileHeader.oam_size that hold the size (0 small, 1 large)."""
+
+    OAM_FLIP_H = 0x40
+    OAM_FLIP_V = 0x80
+    """Flip bits of TileHeader.oam_size, in the same place as the OAM attributes."""
+
+    OAM_SIZE_PAIRS = ((8, 16), (8, 32), (8, 64), (16, 32), (16, 64), (32, 64))
+    """Small and large object sizes selectable with OBSEL."""
+
+    SHEET_CHARS_PER_ROW = 16
+    """Number of 8x8 characters per row of a 128 pixel wide sheet."""
+
+    DMA_VBLANK_BUDGET = 4096
+    """Default bytes a frame may upload during vblank, leaving room for OAM."""
+
+    trace_build = False
+    trace_serialize = False
+    """Whether records log while they are written. Refreshed by serialize(), so
+    disabled logging costs one attribute lookup per record."""
+
     @staticmethod
     def rgb_to_bgr555(rgbpal: bytearray) -> bytearray:
         """
         Converts a byte array of RGB data to BGR555 bytearray.
+        See snespal.py for the channel order.
         """
-        array = np.array([np.reshape(np.frombuffer(rgbpal, dtype=np.uint8), (-1, 3))])
-        return cv2.cvtColor(array, cv2.COLOR_BGR2BGR555).flatten()
-
+        return snespal.rgb_to_bgr555(rgbpal)
 
     @staticmethod
-    def to_bytes(data: List[any]) -> bytes:
+    def sheet_colors(sheet_data: bytes) -> int:
         """
-        :param data: List of data to serialize.
+        :param sheet_data: 4bpp characters of a sprite sheet.
+        :return: Number of colors up to the highest color index used.
         """
-        return b"".join(_.to_bytes() for _ in data)
+        chars = snesgfx.decode_planar(sheet_data, snesgfx.OBJ_BPP)
+        return int(chars.max(initial=0)) + 1
 
     @staticmethod
-    def tesselate_surface(w: int, h: int):
+    def encode_sheet(sheet: Path, missing: Path) -> Path:
         """
-        Greedy tesselation algorithm to count the number of tiles needed to
-        fill a surface of width w and height h.
+        Falls back to encoding the sprite sheet image when its .bin or .pal
+        was not exported. See pngsheet.py.
+        :param sheet: The sprite sheet image.
+        :param missing: The .bin or .pal that does not exist.
+        :return: The resolved image, for pngsheet.load().
         """
-        LARGE = Helpers.OAM_SIZE_LARGE
-        SMALL = Helpers.OAM_SIZE_SMALL
-
-        # Ensure that width and height are divisible by the smallest tile size
-        assert w % SMALL == 0 and h % SMALL == 0, f"Width and height must be divisible by {SMALL}"
-
-        # List of tiles we will generate for this sprite
-        tiles_large = []
-        tiles_small = []
-
-        # Initialize the top-left coordinates relative to the sprite
-        x, y = 0
-
-        max_large_area = LARGE * LARGE
-        max_small_area = SMALL * SMALL
+        image = sheet.resolve()
+        if image.suffix.lower() != ".png" or not image.is_file():
+            logger_build.error("%s does not exist and there is no PNG sheet to "
+                               "encode it from. Run pngsheet.py against your "
+                               "sprite sheet.", missing)
+            raise FileNotFoundError(missing)
+        logger_build.info("\t%s does not exist, encoding %s", missing.name, image)
+        return image
 
-        # Calculate the total area of the sprite
-        total_area = w * h
-
-        # Fill the sprite with squares
-        while total_area > 0:
-            # Try to fit a large square
-            if (total_area >= max_large_area
-                and x + LARGE <= w
-                and y + LARGE <= h):
-
-                # Build tile list
-                tiles_large.append((x, y, LARGE, LARGE))
-                total_area -= max_large_area
-
-                # If we reach the right edge, move down
-                if x == w:
-                    x = 0
-                    y += LARGE
+    @staticmethod
+    def serialize(obj: any, release: bool = False) -> bytes:
+        """
+        Serializes a header and everything below it. The size of the whole
+        tree is computed once, then every record is written exactly once
+        into a single preallocated buffer.
+        :param obj: Header implementing num_bytes() and pack_into().
+        :param release: Write the compact release format.
+        """
+        Helpers.trace_build = logger_build.isEnabledFor(logging.DEBUG)
+        Helpers.trace_serialize = logger_serialize.isEnabledFor(logging.DEBUG)
+        buffer = bytearray(obj.num_bytes(release))
+        end = obj.pack_into(buffer, 0, release)
+        assert end == len(buffer), f"Wrote {end} bytes, expected {len(buffer)}"
+        return bytes(buffer)
 
-            # Otherwise, fit a small square
-            else:
-                # Build tile list
-                tiles_small.append((x, y, SMALL, SMALL))
-                total_area -= max_small_area
-                x += 8
+    @staticmethod
+    def pack_record(obj: any, buffer: bytearray, offset: int, release: bool,
+                    magic: bytes, *values) -> int:
+        """
+        Writes the fixed part of a record. The debug format prefixes the
+        values with the magic of the record, the release format leaves it out.
+        :return: Offset just past the written record.
+        """
+        if release:
+            obj.RELEASE_STRUCT.pack_into(buffer, offset, *values)
+            return offset + obj.RELEASE_STRUCT.size
+        obj.STRUCT.pack_into(buffer, offset, magic, *values)
+        return offset + obj.STRUCT.size
 
-                if x == w:
-                    x = 0
-                    y += SMALL
+    @staticmethod
+    def unpack_record(cls: type, buffer: bytes, offset: int, release: bool,
+                      magic: bytes) -> Tuple[tuple, int]:
+        """
+        Reads the fixed part of a record written by pack_record().
+        :return: (values without the magic, offset just past the record)
+        """
+        if release:
+            return cls.RELEASE_STRUCT.unpack_from(buffer, offset), offset + cls.RELEASE_STRUCT.size
+        values = cls.STRUCT.unpack_from(buffer, offset)
+        if values[0] != magic:
+            raise ValueError(f"Expected {magic.decode()} at offset {offset}, "
+                             f"found {values[0]!r}")
+        return values[1:], offset + cls.STRUCT.size
 
-        # Return the counts of squares
-        return (tiles_large, tiles_small)
+    @staticmethod
+    def tessellate(required: np.ndarray, allowed: np.ndarray,
+                   sizes: Tuple[int, ...], max_nodes: int = 200000) -> List[Tuple[int, int, int]]:
+        """
+        Finds the covering of the required cells with the fewest objects,
+        breaking ties by the smallest covered area (fewer 8 pixel slivers).
+        Objects are squares of the given sizes and may only cover allowed
+        cells. The search is exact unless max_nodes is exhausted, in which
+        case the best covering found so far is returned.
+
+        :param required: (rows, cols) bool array of 8x8 cells to cover.
+        :param allowed: (rows, cols) bool array of cells objects may cover.
+        :param sizes: Object sizes in cells, e.g. (1, 4) for 8x8 and 32x32.
+        :param max_nodes: Search budget.
+        :return: List of (row, col, size) objects.
+        """
+        rows, cols = required.shape
+        bit = np.arange(rows * cols, dtype=object).reshape(rows, cols)
+        bit = np.vectorize(lambda i: 1 << i, otypes=[object])(bit)
+        target = sum(bit[required].tolist())
+        if not target:
+            return []
+
+        # Every placement that covers at least one required cell
+        candidates = []
+        for k in sorted(set(sizes), reverse=True):
+            for r in range(rows - k + 1):
+                for c in range(cols - k + 1):
+                    if not allowed[r:r + k, c:c + k].all():
+                        continue
+                    mask = sum(bit[r:r + k, c:c + k][required[r:r + k, c:c + k]].tolist())
+                    if mask:
+                        candidates.append((mask, k * k, (r, c, k)))
+
+        # A required cell that cannot be covered gets the smallest object
+        covered = 0
+        for mask, _, _ in candidates:
+            covered |= mask
+        for r, c in zip(*np.nonzero(required)):
+            if not covered & bit[r, c]:
+                k = min(sizes)
+                logger_build.warning("Cell (%d, %d) needs a %d cell object "
+                                     "over opaque pixels", r, c, k)
+                r0, c0 = min(r, rows - k), min(c, cols - k)
+                mask = sum(bit[r0:r0 + k, c0:c0 + k][required[r0:r0 + k, c0:c0 + k]].tolist())
+                candidates.append((mask, k * k, (r0, c0, k)))
+                covered |= mask
+
+        # Candidates for each cell, largest coverage first
+        by_cell = {}
+        for candidate in sorted(candidates, key=lambda x: (-bin(x[0]).count("1"), x[1])):
+            mask = candidate[0]
+            while mask:
+                low = mask & -mask
+                by_cell.setdefault(low, []).append(candidate)
+                mask ^= low
+        max_cover = max(bin(mask).count("1") for mask, _, _ in candidates)
+
+        # Greedy covering as the initial bound
+        best = []
+        uncovered = target
+        while uncovered:
+            mask, area, placement = max(candidates, key=lambda x: (
+                bin(x[0] & uncovered).count("1"), -x[1]))
+            best.append((mask, area, placement))
+            uncovered &= ~mask
+        best_cost = (len(best), sum(area for _, area, _ in best))
+
+        # Branch and bound on the lowest uncovered cell
+        seen = {}
+        nodes = 0
+        stack = [(target, [])]
+        while stack and nodes < max_nodes:
+            uncovered, chosen = stack.pop()
+            nodes += 1
+            if not uncovered:
+                cost = (len(chosen), sum(area for _, area, _ in chosen))
+                if cost < best_cost:
+                    best, best_cost = chosen, cost
+                continue
+            lower = len(chosen) + -(-bin(uncovered).count("1") // max_cover)
+            if lower > best_cost[0]:
+                continue
+            area = sum(area for _, area, _ in chosen)
+            if seen.get(uncovered, (len(chosen) + 1, 0)) <= (len(chosen), area):
+                continue
+            seen[uncovered] = (len(chosen), area)
+            for candidate in reversed(by_cell[uncovered & -uncovered]):
+                stack.append((uncovered & ~candidate[0], chosen + [candidate]))
+
+        if stack:
+            logger_build.warning("Tessellation search budget exhausted, "
+                                 "using %d objects", best_cost[0])
+        return sorted(placement for _, _, placement in best)
 
 
     @staticmethod
@@ -252,18 +427,165 @@ class TileHeader:
     rx: int = 0             # Relative X position of tile to the layer
     ry: int = 0             # Relative Y position of tile to the layer
 
-    def to_bytes(self) -> bytes:
+    STRUCT = struct.Struct("<3sBBBB")
+    RELEASE_STRUCT = struct.Struct("<BBBB")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized tile header.
+        """
+        return (self.RELEASE_STRUCT if release else self.STRUCT).size
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the tile header into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the written tile header.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\t\t\t\tSerializing Tile: prog_ram_addr=%d, oam_size=%d, rx=%d, ry=%d",
+                self.prog_ram_addr, self.oam_size, self.rx, self.ry)
+        return Helpers.pack_record(self, buffer, offset, release, B"TIL",
+                                   self.prog_ram_addr,
+                                   self.oam_size,
+                                   self.rx,
+                                   self.ry)
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["TileHeader", int]:
+        """
+        :return: The tile header and the offset just past it.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, B"TIL")
+        return cls(*values), end
+
+    def to_bytes(self, release: bool = False) -> bytes:
         """
         :return: Serialized tile header.
         """
-        logger_serialize.debug("\t\t\t\t\tSerializing Tile: prog_ram_addr=%d, oam_size=%d, rx=%d, ry=%d",
-            self.prog_ram_addr, self.oam_size, self.rx, self.ry)
-        return struct.pack("<3sBBBB",
-                           B"TIL",
-                           self.prog_ram_addr,
-                           self.oam_size,
-                           self.rx,
-                           self.ry)
+        return Helpers.serialize(self, release)
+
+
+class TileArray(Sequence):
+    """
+    The tiles of a layer as a NumPy structured array with one row per tile.
+    from_dict() builds every layer this way, so a sprite without any of the
+    optional passes never creates a TileHeader and writes the tiles of a
+    layer with a single tobytes().
+
+    Reading a tile turns the array into a list of TileHeader once, so the
+    passes that update tiles in place work on either representation.
+    """
+    DTYPE = np.dtype([("prog_ram_addr", "u1"), ("oam_size", "u1"),
+                      ("rx", "u1"), ("ry", "u1")])
+    """Fields of TileHeader.RELEASE_STRUCT."""
+
+    RECORD_DTYPE = np.dtype([("magic", "S3")] + DTYPE.descr)
+    """Fields of TileHeader.STRUCT."""
+
+    def __init__(self, array: np.ndarray = None, tiles: List[TileHeader] = None):
+        self.array = array
+        self._tiles = tiles
+
+    @classmethod
+    def grids(cls, grids: List[Tuple[int, int, int, int, int, int, int, int]]) -> "TileArray":
+        """
+        Covers cels with grids of objects of a single size, row by row, the
+        same way the sheet is laid out. Every grid is described by:
+
+            prog_ram_base   Character of the top left object
+            row_prog        Characters between two rows of objects in the sheet
+            size            Object size in pixels
+            oam_size        Size bit of every tile
+            rx, ry          Position of the cel relative to the sprite
+            w, h            Size of the cel in pixels
+
+        The tiles of all grids are computed at once and follow each other in
+        the order of the grids, use view() to split them up. Values that do not
+        fit in a byte are kept as TileHeader, a later pass may still rename them.
+
+        :param grids: List of (prog_ram_base, row_prog, size, oam_size, rx, ry, w, h).
+        :return: The tiles of all grids.
+        """
+        base, row_prog, size, oam_size, rx, ry, w, h = \
+            np.array(grids, dtype=np.int32).reshape(-1, 8).T
+        rows, cols = -(-h // size), -(-w // size)
+        counts = rows * cols
+        owner = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+        first = np.repeat(np.cumsum(counts, dtype=np.int32) - counts, counts)
+        r, c = np.divmod(np.arange(len(owner), dtype=np.int32) - first, cols[owner])
+        del first
+        columns = {
+            "prog_ram_addr": lambda: base[owner] + r * row_prog[owner] + c * (size[owner] // 8),
+            "oam_size": lambda: oam_size[owner],
+            "rx": lambda: rx[owner] + c * size[owner],
+            "ry": lambda: ry[owner] + r * size[owner],
+        }
+
+        # One column at a time keeps the temporaries small
+        array = np.empty(len(owner), cls.DTYPE)
+        for name in cls.DTYPE.names:
+            value = columns[name]()
+            if len(value) and (value.min() < 0 or value.max() > 0xFF):
+                return cls(tiles=[TileHeader(*tile) for tile in
+                                  zip(*(columns[name]().tolist() for name in cls.DTYPE.names))])
+            array[name] = value
+        return cls(array)
+
+    def view(self, start: int, end: int) -> "TileArray":
+        """
+        :return: The tiles from start to end, sharing the array.
+        """
+        if self._tiles is None:
+            return TileArray(self.array[start:end])
+        return TileArray(tiles=self._tiles[start:end])
+
+    def tiles(self) -> List[TileHeader]:
+        """
+        :return: The tiles as TileHeader, from now on the only representation.
+        """
+        if self._tiles is None:
+            self._tiles = [TileHeader(*tile) for tile in self.array.tolist()]
+            self.array = None
+        return self._tiles
+
+    def __len__(self) -> int:
+        return len(self.array) if self._tiles is None else len(self._tiles)
+
+    def __getitem__(self, index):
+        return self.tiles()[index]
+
+    def __iter__(self):
+        return iter(self.tiles())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Sequence) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        tiles = self.array.tolist() if self._tiles is None else self._tiles
+        return f"TileArray({tiles!r})"
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        Writes every tile, in bulk unless the tiles were read as TileHeader.
+        :return: Offset just past the last written tile.
+        """
+        if self._tiles is not None or Helpers.trace_serialize:
+            for tile in self:
+                offset = tile.pack_into(buffer, offset, release)
+            return offset
+        if release:
+            data = self.array.tobytes()
+        else:
+            records = np.empty(len(self.array), self.RECORD_DTYPE)
+            records["magic"] = b"TIL"
+            for name in self.DTYPE.names:
+                records[name] = self.array[name]
+            data = records.tobytes()
+        buffer[offset:offset + len(data)] = data
+        return offset + len(data)
 
 
 @dataclass
@@ -276,28 +598,193 @@ class LayerHeader:
     ry: int = 0             # Relative Y position of layer to the sprite
     tile_data: List[TileHeader] = field(default_factory=list)
 
-    def to_bytes(self) -> bytes:
+    STRUCT = struct.Struct("<3sBBBBH")
+    RELEASE_STRUCT = struct.Struct("<BBBB")
+
+    def num_bytes(self, release: bool = False) -> int:
         """
-        :return: Serialized layer header and all of its tile data.
+        :return: Size of the serialized layer header and all of its tiles.
         """
-        offset = 0
-        tile_data_bytes = Helpers.to_bytes(self.tile_data)
+        if release:
+            return self.RELEASE_STRUCT.size + TileHeader.RELEASE_STRUCT.size * len(self.tile_data)
+        return self.STRUCT.size + TileHeader.STRUCT.size * len(self.tile_data)
 
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the layer header and tiles into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the last written tile.
+        """
         tile_count = len(self.tile_data)
-        tile_offset = offset
-        offset += len(tile_data_bytes)
 
-        logger_serialize.debug("\t\t\t\tSerializing Layer: layer_id=%d, rx=%d, ry=%d, num_tiles=%d",
-            self.layer_id, self.rx, self.ry, tile_count)
+        # Tiles immediately follow the layer header
+        tile_offset = 0
+
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\t\t\tSerializing Layer: layer_id=%d, rx=%d, ry=%d, num_tiles=%d",
+                self.layer_id, self.rx, self.ry, tile_count)
+
+        if release:
+            self.RELEASE_STRUCT.pack_into(buffer, offset,
+                                          self.layer_id,
+                                          self.rx,
+                                          self.ry,
+                                          tile_count)
+            offset += self.RELEASE_STRUCT.size
+        else:
+            self.STRUCT.pack_into(buffer, offset,
+                                  B"LYR",
+                                  self.layer_id,
+                                  self.rx,
+                                  self.ry,
+                                  tile_count,
+                                  tile_offset)
+            offset += self.STRUCT.size
+        if isinstance(self.tile_data, TileArray):
+            return self.tile_data.pack_into(buffer, offset, release)
+        for tile in self.tile_data:
+            offset = tile.pack_into(buffer, offset, release)
+        return offset
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["LayerHeader", int]:
+        """
+        :return: The layer header with its tiles and the offset just past them.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, B"LYR")
+        layer_id, rx, ry, tile_count = values[:4]
+        if not release:
+            end += values[4]
+        layer = cls(layer_id, rx, ry)
+        for _ in range(tile_count):
+            tile, end = TileHeader.unpack_from(buffer, end, release)
+            layer.tile_data.append(tile)
+        return layer, end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized layer header and all of its tile data.
+        """
+        return Helpers.serialize(self, release)
+
+
+@dataclass
+class TileDeltaHeader:
+    """
+    A tile of a delta frame, replacing the tile at the same index of the
+    layer shown in the previous frame.
+    """
+    index: int = 0          # Index of the tile in the layer
+    tile: TileHeader = field(default_factory=TileHeader)
+
+    STRUCT = struct.Struct("<3sBBBBB")
+    RELEASE_STRUCT = struct.Struct("<BBBBB")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized tile delta.
+        """
+        return (self.RELEASE_STRUCT if release else self.STRUCT).size
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the tile delta into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the written tile delta.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\t\t\t\tSerializing TileDelta: index=%d, prog_ram_addr=%d, oam_size=%d, rx=%d, ry=%d",
+                self.index, self.tile.prog_ram_addr, self.tile.oam_size, self.tile.rx, self.tile.ry)
+        return Helpers.pack_record(self, buffer, offset, release, B"TID",
+                                   self.index,
+                                   self.tile.prog_ram_addr,
+                                   self.tile.oam_size,
+                                   self.tile.rx,
+                                   self.tile.ry)
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["TileDeltaHeader", int]:
+        """
+        :return: The tile delta and the offset just past it.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, B"TID")
+        return cls(values[0], TileHeader(*values[1:])), end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized tile delta.
+        """
+        return Helpers.serialize(self, release)
+
+
+@dataclass
+class LayerDeltaHeader:
+    """
+    The tiles of a layer that changed since the previous frame. Layers of a
+    delta frame that did not change are left out.
+    """
+    layer_id: int = 0       # Position of the layer in the frame
+    rx: int = 0             # Relative X position of layer to the sprite
+    ry: int = 0             # Relative Y position of layer to the sprite
+    num_tiles: int = 0      # Number of tiles of the layer after the update
+    tile_data: List[TileDeltaHeader] = field(default_factory=list)
+
+    STRUCT = struct.Struct("<3sBBBBB")
+    RELEASE_STRUCT = struct.Struct("<BBBBB")
 
-        return (struct.pack("<3sBBBBH",
-                            B"LYR",
-                            self.layer_id,
-                            self.rx,
-                            self.ry,
-                            tile_count,
-                            tile_offset)
-                + tile_data_bytes)
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized layer delta and all of its tiles.
+        """
+        if release:
+            return (self.RELEASE_STRUCT.size
+                    + TileDeltaHeader.RELEASE_STRUCT.size * len(self.tile_data))
+        return self.STRUCT.size + TileDeltaHeader.STRUCT.size * len(self.tile_data)
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the layer delta and tiles into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the last written tile.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\t\t\tSerializing LayerDelta: layer_id=%d, rx=%d, ry=%d, num_tiles=%d, changed=%d",
+                self.layer_id, self.rx, self.ry, self.num_tiles, len(self.tile_data))
+
+        # The changed tiles immediately follow the layer header
+        offset = Helpers.pack_record(self, buffer, offset, release, B"LYD",
+                                     self.layer_id,
+                                     self.rx,
+                                     self.ry,
+                                     self.num_tiles,
+                                     len(self.tile_data))
+        for tile in self.tile_data:
+            offset = tile.pack_into(buffer, offset, release)
+        return offset
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["LayerDeltaHeader", int]:
+        """
+        :return: The layer delta with its tiles and the offset just past them.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, B"LYD")
+        layer = cls(*values[:4])
+        for _ in range(values[4]):
+            tile, end = TileDeltaHeader.unpack_from(buffer, end, release)
+            layer.tile_data.append(tile)
+        return layer, end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized layer delta and all of its tiles.
+        """
+        return Helpers.serialize(self, release)
 
 
 @dataclass
@@ -305,76 +792,167 @@ class FrameLayerMetadataHeader:
     """
     A Frame is a collection of layers that make up a single SNES object.
     This metadata is used to inform where the layers are in program ROM.
+    The release format only keeps the offset, the layer holds its id.
     """
     layer_id: int = 0       # Layer index mapping to a layer object (with metadata)
     offset: int = 0         # Offset to the layer data
 
-    def to_bytes(self) -> bytes:
+    STRUCT = struct.Struct("<3sBH")
+    RELEASE_STRUCT = struct.Struct("<H")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized frame layer metadata header.
+        """
+        return (self.RELEASE_STRUCT if release else self.STRUCT).size
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the metadata into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the written metadata.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\t\t\tSerializing FrameLayerMetadata: layer_id=%d, offset=%d",
+                self.layer_id, self.offset)
+        if release:
+            return Helpers.pack_record(self, buffer, offset, release, b"FLM", self.offset)
+        return Helpers.pack_record(self, buffer, offset, release, b"FLM",
+                                   self.layer_id,
+                                   self.offset)
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["FrameLayerMetadataHeader", int]:
+        """
+        :return: The metadata and the offset just past it.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, b"FLM")
+        return (cls(0, *values) if release else cls(*values)), end
+
+    def to_bytes(self, release: bool = False) -> bytes:
         """
         :return: Serialized frame layer metadata header.
         """
-        logger_serialize.debug("\t\t\t\tSerializing FrameLayerMetadata: layer_id=%d, offset=%d",
-            self.layer_id, self.offset)
-        return struct.pack("<3sBH", 
-                           b"FLM",
-                           self.layer_id,
-                           self.offset)
+        return Helpers.serialize(self, release)
 
 
 @dataclass
 class FrameHeader:
     """
     A Frame is a collection of layers that make up a single SNES object.
+    The release format packs the number of layers and the delta flag
+    (bit 7) into a single byte, the layers follow the metadata.
     """
     num_layers: int = 0        # Number of layers in this frame
+    keyframe: bool = True      # False when the layers are LayerDeltaHeaders
     # [FrameLayerMetadataHeader, ...]
     # [Layer Bytes]
 
     # Fields that are not serialized and used for computing offsets
     layer_data: List[LayerHeader] = field(default_factory=list)
 
+    STRUCT = struct.Struct("<3sBBHBH")
+    RELEASE_STRUCT = struct.Struct("<B")
+
+    RELEASE_DELTA = 0x80
+    """Bit of the release frame byte set for delta frames."""
+
     @classmethod
     def from_dict(cls, data: dict) -> "FrameHeader":
         pass
 
-    def to_bytes(self) -> bytes:
+    def num_bytes(self, release: bool = False) -> int:
         """
-        :return: Serialized frame header and all of its layer metadata and data.
+        :return: Size of the serialized frame, its layer metadata and layers.
         """
-        logger_serialize.debug("\t\t\tSerializing Frame: num_layers=%d", self.num_layers)
-        layer_data = b''
-        running_offset = 0
-        layer_metadatas = []
-        for i, layer in enumerate(self.layer_data, start=1):
-            layer_metadatas.append(
-                FrameLayerMetadataHeader(layer.layer_id, running_offset))
-            layer_bytes = layer.to_bytes()
-            running_offset += len(layer_bytes)
-            layer_data += layer_bytes
-            num_tiles = len(layer.tile_data)
-            logger_serialize.debug("\t\t\t\tSerializing Layer %d: layer_id=%d, rx=%d, ry=%d, num_tiles=%d",
-                i, layer.layer_id, layer.rx, layer.ry, num_tiles)
+        return ((self.RELEASE_STRUCT if release else self.STRUCT).size
+                + FrameLayerMetadataHeader().num_bytes(release) * len(self.layer_data)
+                + sum(layer.num_bytes(release) for layer in self.layer_data))
 
-        offset = 0
-        layer_metadata_bytes = Helpers.to_bytes(layer_metadatas)
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        The layers are written first and the layer metadata is filled in
+        afterwards, once the offset of every layer is known.
 
-        frame_layer_metadata_count = len(layer_metadatas)
-        frame_layer_metadata_offset = offset
-        offset += len(layer_metadata_bytes)
+        :param buffer: Buffer to write the frame into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the last written layer.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\t\tSerializing Frame: num_layers=%d", self.num_layers)
 
+        frame_layer_metadata_count = len(self.layer_data)
+        frame_layer_metadata_offset = 0
         layer_count = len(self.layer_data)
-        layer_offset = offset
-        offset += len(layer_data)
+        layer_offset = FrameLayerMetadataHeader().num_bytes(release) * frame_layer_metadata_count
+
+        if release:
+            assert layer_count < self.RELEASE_DELTA, f"{layer_count} layers do not fit a release frame"
+            flags = 0 if self.keyframe else self.RELEASE_DELTA
+            metadata_start = Helpers.pack_record(self, buffer, offset, release, b"FRM",
+                                                 flags | layer_count)
+        else:
+            metadata_start = Helpers.pack_record(self, buffer, offset, release,
+                                                 b"FRM" if self.keyframe else b"FRD",
+                                                 self.num_layers,
+                                                 frame_layer_metadata_count,
+                                                 frame_layer_metadata_offset,
+                                                 layer_count,
+                                                 layer_offset)
+        layer_start = metadata_start + layer_offset
+
+        # Layers are written exactly once and their offsets collected
+        layer_metadatas = []
+        end = layer_start
+        for layer in self.layer_data:
+            layer_metadatas.append(
+                FrameLayerMetadataHeader(layer.layer_id, end - layer_start))
+            end = layer.pack_into(buffer, end, release)
 
-        return (struct.pack("<3sBBHBH",
-                            b"FRM",
-                            self.num_layers,
-                            frame_layer_metadata_count,
-                            frame_layer_metadata_offset,
-                            layer_count,
-                            layer_offset)
-            + layer_metadata_bytes
-            + layer_data)
+        for layer_metadata in layer_metadatas:
+            metadata_start = layer_metadata.pack_into(buffer, metadata_start, release)
+        return end
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["FrameHeader", int]:
+        """
+        :return: The frame with its layers and the offset just past them.
+        """
+        if release:
+            (flags,), metadata_start = Helpers.unpack_record(cls, buffer, offset, release, b"FRM")
+            frame = cls(flags & ~cls.RELEASE_DELTA, not (flags & cls.RELEASE_DELTA))
+            metadata_count = layer_count = frame.num_layers
+            layer_start = metadata_start + FrameLayerMetadataHeader.RELEASE_STRUCT.size * layer_count
+        else:
+            magic = bytes(buffer[offset:offset + 3])
+            values, metadata_start = Helpers.unpack_record(
+                cls, buffer, offset, release, b"FRD" if magic == b"FRD" else b"FRM")
+            num_layers, metadata_count, metadata_offset, layer_count, layer_offset = values
+            frame = cls(num_layers, magic != b"FRD")
+            metadata_start += metadata_offset
+            layer_start = metadata_start - metadata_offset + layer_offset
+
+        # Layers are found through their metadata
+        layer_class = LayerHeader if frame.keyframe else LayerDeltaHeader
+        end = layer_start
+        for _ in range(metadata_count):
+            metadata, metadata_start = FrameLayerMetadataHeader.unpack_from(
+                buffer, metadata_start, release)
+            layer, layer_end = layer_class.unpack_from(
+                buffer, layer_start + metadata.offset, release)
+            frame.layer_data.append(layer)
+            end = max(end, layer_end)
+        return frame, end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized frame header and all of its layer metadata and data.
+        """
+        return Helpers.serialize(self, release)
 
 
 @dataclass
@@ -385,12 +963,40 @@ class TagFrameMetadataHeader:
     """
     offset: int = 0         # Offset to the frame data
 
-    def to_bytes(self) -> bytes:
+    STRUCT = struct.Struct("<3sH")
+    RELEASE_STRUCT = struct.Struct("<H")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized tag frame metadata header.
+        """
+        return (self.RELEASE_STRUCT if release else self.STRUCT).size
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the metadata into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the written metadata.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\tSerializing tag frame metadata: offset=%d", self.offset)
+        return Helpers.pack_record(self, buffer, offset, release, b"FMD", self.offset)
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["TagFrameMetadataHeader", int]:
+        """
+        :return: The metadata and the offset just past it.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, b"FMD")
+        return cls(*values), end
+
+    def to_bytes(self, release: bool = False) -> bytes:
         """
         :return: Serialized tag frame metadata header.
         """
-        logger_serialize.debug("\t\tSerializing tag frame metadata: offset=%d", self.offset)
-        return struct.pack("<3sH", b"FMD", self.offset)
+        return Helpers.serialize(self, release)
 
 
 @dataclass
@@ -402,41 +1008,99 @@ class TagHeader:
     direction: int = 0           # Animation direction (forward, reverse, ping-pong)
     oam_count: int = 0           # Number of OAM tiles needed for this tag
     frame_data: List[FrameHeader] = field(default_factory=list)
-        
-    def to_bytes(self) -> bytes:
-        frame_data = b''
-        running_offset = 0
+
+    STRUCT = struct.Struct("<3sBBBHBH")
+    RELEASE_STRUCT = struct.Struct("<BBB")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized tag, its frame metadata and frames.
+        """
+        return ((self.RELEASE_STRUCT if release else self.STRUCT).size
+                + TagFrameMetadataHeader().num_bytes(release) * len(self.frame_data)
+                + sum(frame.num_bytes(release) for frame in self.frame_data))
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        The frames are written first and the frame metadata is filled in
+        afterwards, once the offset of every frame is known.
+
+        :param buffer: Buffer to write the tag into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the last written frame.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\tSerializing tag: %d frames with OAM %d",
+                         self.num_frames, self.oam_count)
+
+        frame_metadata_count = len(self.frame_data)
+        frame_metadata_offset = 0
+        frame_count = self.num_frames
+        frame_offset = TagFrameMetadataHeader().num_bytes(release) * frame_metadata_count
+
+        if release:
+            metadata_start = Helpers.pack_record(self, buffer, offset, release, b"TAG",
+                                                 self.direction,
+                                                 self.oam_count,
+                                                 frame_count)
+        else:
+            metadata_start = Helpers.pack_record(self, buffer, offset, release, b"TAG",
+                                                 self.direction,
+                                                 self.oam_count,
+                                                 frame_metadata_count,
+                                                 frame_metadata_offset,
+                                                 frame_count,
+                                                 frame_offset)
+        frame_start = metadata_start + frame_offset
+
+        # Frames are written exactly once and their offsets collected
         frame_metadatas = []
-        logger_serialize.debug("\tSerializing tag: %d frames with OAM %d",
-                     self.num_frames, self.oam_count)
+        end = frame_start
         for i, frame in enumerate(self.frame_data, start=1):
-            frame_metadatas.append(TagFrameMetadataHeader(running_offset))
-            frame_bytes = frame.to_bytes()
-            logger_build.debug("\t\tFrame %d: %d bytes", i, len(frame_bytes))
-            running_offset += len(frame_bytes)
-            frame_data += frame_bytes
-
-        offset = 0
-        frame_metadatas_bytes = Helpers.to_bytes(frame_metadatas)
-        
-        frame_metadata_count = len(frame_metadatas)
-        frame_metadata_offset = offset
-        offset += len(frame_metadatas_bytes)
+            frame_metadatas.append(TagFrameMetadataHeader(end - frame_start))
+            frame_end = frame.pack_into(buffer, end, release)
+            if Helpers.trace_build:
+                logger_build.debug("\t\tFrame %d: %d bytes", i, frame_end - end)
+            end = frame_end
 
-        frame_count = self.num_frames
-        frame_offset = offset
-        offset += len(frame_data)
+        for frame_metadata in frame_metadatas:
+            metadata_start = frame_metadata.pack_into(buffer, metadata_start, release)
+        return end
 
-        return (struct.pack("<3sBBBHBH",
-                            b"TAG",
-                            self.direction,
-                            self.oam_count,
-                            frame_metadata_count,
-                            frame_metadata_offset,
-                            frame_count,
-                            frame_offset)
-                + frame_metadatas_bytes
-                + Helpers.to_bytes(self.frame_data))
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["TagHeader", int]:
+        """
+        :return: The tag with its frames and the offset just past them.
+        """
+        values, metadata_start = Helpers.unpack_record(cls, buffer, offset, release, b"TAG")
+        if release:
+            direction, oam_count, frame_count = values
+            metadata_count = frame_count
+            frame_start = metadata_start + TagFrameMetadataHeader.RELEASE_STRUCT.size * frame_count
+        else:
+            direction, oam_count, metadata_count, metadata_offset, frame_count, frame_offset = values
+            frame_start = metadata_start + frame_offset
+            metadata_start += metadata_offset
+
+        tag = cls(direction=direction, oam_count=oam_count)
+        tag.num_frames = frame_count
+        end = frame_start
+        for _ in range(metadata_count):
+            metadata, metadata_start = TagFrameMetadataHeader.unpack_from(
+                buffer, metadata_start, release)
+            frame, frame_end = FrameHeader.unpack_from(
+                buffer, frame_start + metadata.offset, release)
+            tag.frame_data.append(frame)
+            end = max(end, frame_end)
+        return tag, end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized tag header and all of its frame metadata and data.
+        """
+        return Helpers.serialize(self, release)
 
 
 @dataclass
@@ -447,9 +1111,407 @@ class TagMetadataHeader:
     """
     offset: int = 0         # Offset to the tag data
 
+    STRUCT = struct.Struct("<3sH")
+    RELEASE_STRUCT = struct.Struct("<H")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized tag metadata header.
+        """
+        return (self.RELEASE_STRUCT if release else self.STRUCT).size
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the metadata into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the written metadata.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\tSerializing tag metadata: offset=%d", self.offset)
+        return Helpers.pack_record(self, buffer, offset, release, b"TMD", self.offset)
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["TagMetadataHeader", int]:
+        """
+        :return: The metadata and the offset just past it.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, b"TMD")
+        return cls(*values), end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized tag metadata header.
+        """
+        return Helpers.serialize(self, release)
+
+
+@dataclass
+class DmaRunHeader:
+    """
+    A contiguous run of sheet characters uploaded with a single DMA.
+    """
+    source: int = 0         # Offset of the run in the sheet data in bytes
+    dest: int = 0           # Offset of the run in the VRAM slot in words
+    size: int = 0           # Size of the run in bytes
+
+    STRUCT = struct.Struct("<3sHHH")
+    RELEASE_STRUCT = struct.Struct("<HHH")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized run.
+        """
+        return (self.RELEASE_STRUCT if release else self.STRUCT).size
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the run into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the written run.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\tSerializing DMA run: source=%d, dest=%d, size=%d",
+                self.source, self.dest, self.size)
+        return Helpers.pack_record(self, buffer, offset, release, b"RUN",
+                                   self.source, self.dest, self.size)
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["DmaRunHeader", int]:
+        """
+        :return: The run and the offset just past it.
+        """
+        values, end = Helpers.unpack_record(cls, buffer, offset, release, b"RUN")
+        return cls(*values), end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized run.
+        """
+        return Helpers.serialize(self, release)
+
+
+@dataclass
+class DmaFrameHeader:
+    """
+    The characters a single frame needs in its VRAM slot.
+    """
+    run_data: List[DmaRunHeader] = field(default_factory=list)
+
+    # Fields that are not serialized, (slot character, sheet character) pairs
+    uploads: List[Tuple[int, int]] = field(default_factory=list)
+
+    STRUCT = struct.Struct("<3sBH")
+    RELEASE_STRUCT = struct.Struct("<BH")
+
+    @classmethod
+    def from_uploads(cls, uploads: List[Tuple[int, int]]) -> "DmaFrameHeader":
+        """
+        Characters that follow each other in both the slot and the sheet are
+        uploaded together.
+        :param uploads: (slot character, sheet character) pairs.
+        """
+        char_bytes = snesgfx.char_bytes(4)
+        frame_header = cls(uploads=sorted(uploads))
+        for dest, source in frame_header.uploads:
+            run = frame_header.run_data[-1] if frame_header.run_data else None
+            if (run and run.source + run.size == source * char_bytes
+                    and run.dest + run.size // 2 == dest * char_bytes // 2):
+                run.size += char_bytes
+                continue
+            frame_header.run_data.append(DmaRunHeader(
+                source * char_bytes, dest * char_bytes // 2, char_bytes))
+        return frame_header
+
+    @property
+    def cost(self) -> int:
+        """
+        :return: Bytes uploaded for this frame.
+        """
+        return sum(run.size for run in self.run_data)
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized frame and all of its runs.
+        """
+        return ((self.RELEASE_STRUCT if release else self.STRUCT).size
+                + DmaRunHeader().num_bytes(release) * len(self.run_data))
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the frame and its runs into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the last written run.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\tSerializing DMA frame: num_runs=%d, cost=%d",
+                len(self.run_data), self.cost)
+        offset = Helpers.pack_record(self, buffer, offset, release, b"DFR",
+                                     len(self.run_data), self.cost)
+        for run in self.run_data:
+            offset = run.pack_into(buffer, offset, release)
+        return offset
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["DmaFrameHeader", int]:
+        """
+        :return: The frame with its runs and the offset just past them.
+        """
+        (num_runs, _), end = Helpers.unpack_record(cls, buffer, offset, release, b"DFR")
+        frame = cls()
+        for _ in range(num_runs):
+            run, end = DmaRunHeader.unpack_from(buffer, end, release)
+            frame.run_data.append(run)
+        return frame, end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized frame and all of its runs.
+        """
+        return Helpers.serialize(self, release)
+
+
+@dataclass
+class DmaScheduleHeader:
+    """
+    Per frame DMA uploads for streaming a sprite through a small VRAM slot.
+
+    [Schedule]
+    |_Tag first frame index (num_tags words)
+    |_Frame offsets relative to the schedule (num_frames words)
+    |_Frames, each followed by its runs
+    """
+    tag_frames: List[int] = field(default_factory=list)
+    frame_data: List[DmaFrameHeader] = field(default_factory=list)
+    slot_words: int = 0     # VRAM words the largest frame needs
+
+    STRUCT = struct.Struct("<3sBHH")
+    RELEASE_STRUCT = struct.Struct("<BHH")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized schedule and all of its frames.
+        """
+        return ((self.RELEASE_STRUCT if release else self.STRUCT).size
+                + 2 * len(self.tag_frames)
+                + 2 * len(self.frame_data)
+                + sum(frame.num_bytes(release) for frame in self.frame_data))
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the schedule into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the last written frame.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("Serializing DMA schedule: %d tags, %d frames, %d slot words",
+                len(self.tag_frames), len(self.frame_data), self.slot_words)
+        start = offset
+        offset = Helpers.pack_record(self, buffer, offset, release, b"DMS",
+                                     len(self.tag_frames), len(self.frame_data),
+                                     self.slot_words)
+        for first in self.tag_frames:
+            struct.pack_into("<H", buffer, offset, first)
+            offset += 2
+
+        # Frames follow the offset table
+        table = offset
+        offset += 2 * len(self.frame_data)
+        for frame in self.frame_data:
+            struct.pack_into("<H", buffer, table, offset - start)
+            table += 2
+            offset = frame.pack_into(buffer, offset, release)
+        return offset
+
+    @classmethod
+    def unpack_from(cls, buffer: bytes, offset: int,
+                    release: bool = False) -> Tuple["DmaScheduleHeader", int]:
+        """
+        :return: The schedule with its frames and the offset just past them.
+        """
+        (num_tags, num_frames, slot_words), table = Helpers.unpack_record(
+            cls, buffer, offset, release, b"DMS")
+        schedule = cls(slot_words=slot_words)
+        schedule.tag_frames = list(struct.unpack_from(f"<{num_tags}H", buffer, table))
+        table += 2 * num_tags
+        end = table + 2 * num_frames
+        for frame_offset in struct.unpack_from(f"<{num_frames}H", buffer, table):
+            frame, frame_end = DmaFrameHeader.unpack_from(buffer, offset + frame_offset, release)
+            schedule.frame_data.append(frame)
+            end = max(end, frame_end)
+        return schedule, end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized schedule.
+        """
+        return Helpers.serialize(self, release)
+
+
+@dataclass
+class OamFrameHeader:
+    """
+    The objects of a frame as ready to copy OAM entries. Each low table entry
+    holds the position relative to the sprite, the character relative to the
+    sheet and the flip attributes. The engine adds the sprite position and
+    VRAM name, and ORs in the palette and priority. The high table holds the
+    size bit of every object, packed 4 objects per byte.
+    """
+    # (x, y, name, attributes, large) of every object
+    objects: List[Tuple[int, int, int, int, int]] = field(default_factory=list)
+
+    STRUCT = struct.Struct("<3sBB")
+    ENTRY = struct.Struct("<BBBB")
+
+    def high_table(self) -> bytes:
+        """
+        :return: The size bits in OAM high table order, X bit 8 left clear.
+        """
+        high = bytearray(-(-len(self.objects) // 4))
+        for i, (*_, large) in enumerate(self.objects):
+            high[i // 4] |= (large << 1) << (2 * (i % 4))
+        return bytes(high)
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :param release: Unused, the OAM table has a single format.
+        :return: Size of the serialized frame and its low and high tables.
+        """
+        return (self.STRUCT.size
+                + self.ENTRY.size * len(self.objects)
+                + -(-len(self.objects) // 4))
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the frame into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Unused, the OAM table has a single format.
+        :return: Offset just past the high table.
+        """
+        high = self.high_table()
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\t\tSerializing OAM frame: %d objects", len(self.objects))
+        self.STRUCT.pack_into(buffer, offset, b"OFR", len(self.objects), len(high))
+        offset += self.STRUCT.size
+        for x, y, name, attributes, _ in self.objects:
+            self.ENTRY.pack_into(buffer, offset, x, y, name, attributes)
+            offset += self.ENTRY.size
+        buffer[offset:offset + len(high)] = high
+        return offset + len(high)
+
     def to_bytes(self) -> bytes:
-        logger_serialize.debug("\tSerializing tag metadata: offset=%d", self.offset)
-        return struct.pack("<3sH", b"TMD", self.offset)
+        """
+        :return: Serialized frame.
+        """
+        return Helpers.serialize(self)
+
+
+@dataclass
+class OamTagHeader:
+    """
+    The frames of a tag, reached through a table of offsets from the start
+    of the OAM table file.
+    """
+    name: str = ""               # Name of the tag
+    direction: int = 0           # Animation direction (forward, reverse, ping-pong)
+    oam_count: int = 0           # Number of OAM objects needed for this tag
+    frame_data: List[OamFrameHeader] = field(default_factory=list)
+
+    STRUCT = struct.Struct("<3sBBB")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :param release: Unused, the OAM table has a single format.
+        :return: Size of the serialized tag, its frame table and frames.
+        """
+        return (self.STRUCT.size
+                + 2 * len(self.frame_data)
+                + sum(frame.num_bytes(release) for frame in self.frame_data))
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False,
+                  base: int = 0) -> int:
+        """
+        :param buffer: Buffer to write the tag into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Unused, the OAM table has a single format.
+        :param base: Offset of the OAM table the frame offsets are relative to.
+        :return: Offset just past the last written frame.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("\tSerializing OAM tag: %d frames with OAM %d",
+                len(self.frame_data), self.oam_count)
+        self.STRUCT.pack_into(buffer, offset, b"OTG", self.direction,
+                              self.oam_count, len(self.frame_data))
+        table = offset + self.STRUCT.size
+        end = table + 2 * len(self.frame_data)
+        for frame in self.frame_data:
+            struct.pack_into("<H", buffer, table, end - base)
+            table += 2
+            end = frame.pack_into(buffer, end, release)
+        return end
+
+    def to_bytes(self) -> bytes:
+        """
+        :return: Serialized tag.
+        """
+        return Helpers.serialize(self)
+
+
+@dataclass
+class OamTableHeader:
+    """
+    Flattened OAM entries of every frame of a sprite, an alternative to
+    walking the TAG/FRM/LYR/TIL records at runtime.
+
+    [OAM Table]
+    |_Tag offsets (num_tags words)
+    |_Tags, each with its frame offsets followed by its frames
+    """
+    tag_data: List[OamTagHeader] = field(default_factory=list)
+
+    STRUCT = struct.Struct("<3sB")
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :param release: Unused, the OAM table has a single format.
+        :return: Size of the serialized table and all of its tags.
+        """
+        return (self.STRUCT.size
+                + 2 * len(self.tag_data)
+                + sum(tag.num_bytes(release) for tag in self.tag_data))
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        :param buffer: Buffer to write the table into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Unused, the OAM table has a single format.
+        :return: Offset just past the last written tag.
+        """
+        if Helpers.trace_serialize:
+            logger_serialize.debug("Serializing OAM table: %d tags", len(self.tag_data))
+        base = offset
+        self.STRUCT.pack_into(buffer, offset, b"OAT", len(self.tag_data))
+        table = offset + self.STRUCT.size
+        end = table + 2 * len(self.tag_data)
+        self.tag_offsets = []
+        for tag in self.tag_data:
+            self.tag_offsets.append(end - base)
+            struct.pack_into("<H", buffer, table, end - base)
+            table += 2
+            end = tag.pack_into(buffer, end, release, base)
+        return end
+
+    def to_bytes(self) -> bytes:
+        """
+        :return: Serialized table.
+        """
+        return Helpers.serialize(self)
 
 
 @dataclass
@@ -463,15 +1525,31 @@ class SpriteHeader:
     tag_metadata: List[TagMetadataHeader] = field(default_factory=list)
     tag_metadata_offset: int = 0
     tag_offset: int = 0
+    dma_schedule: Optional[DmaScheduleHeader] = None
+    dma_offset: int = 0
+
+    STRUCT = struct.Struct("<3s8s" "HH" "HH" "BH" "BH")
+    RELEASE_STRUCT = struct.Struct("<3sB8s" "H" "H" "B")
+
+    RELEASE_MAGIC = b"SPC"
+    """Magic of the release format, the only magic it keeps."""
+
+    RELEASE_VERSION = 1
+    """Bump when the layout of the release format changes."""
 
     @classmethod
-    def from_dict(cls, data:dict) -> "SpriteHeader":
+    def from_dict(cls, data:dict, options: "ConversionOptions" = None,
+                  profiler: Profiler = None) -> "SpriteHeader":
         """
         Transforms a dictionary representation of the Aseprite sprite into
         a SpriteHeader object.
         """
+        options = options or ConversionOptions()
+        profiler = profiler or Profiler.disabled()
+        debug = logger_build.isEnabledFor(logging.DEBUG)
         logger_build.info("Building sprite header from dictionary")
         data_frames = data["frames"]
+        profiler.begin("oam_sizing")
 
         # Identify how many OAM tiles are needed for each layer
         layer_to_frame = defaultdict(set)
@@ -482,8 +1560,9 @@ class SpriteHeader:
             s = obj["spriteSourceSize"]
             *_, layer = name.split("__")
             x, y, w, h = f["x"], f["y"], s["w"], s["h"]
-            logger_build.debug("\tFrame-%d %s = (%s, %d, %d, %d, %d)",
-                         i, name, layer, x, y, w, h)
+            if debug:
+                logger_build.debug("\tFrame-%d %s = (%s, %d, %d, %d, %d)",
+                             i, name, layer, x, y, w, h)
             layer_to_frame[layer].add((x, y, w, h))
 
         # Identify how many total OAM tiles are needed for each layer
@@ -497,19 +1576,21 @@ class SpriteHeader:
                 size, group, num_tiles = Helpers.oam_to_size_group(w, h)
                 layer_to_oam[layer][group] += num_tiles
                 size_to_num_tiles[group] += num_tiles
-                logger_build.debug("\t\tlayer_to_oam[%s][%s] = %d tiles (added %d tiles)",
-                    layer, group, layer_to_oam[layer][group], num_tiles)
-                logger_build.debug("\t\tsize_to_num_tiles[%s] = %d tiles (added %d tiles)",
-                    group, size_to_num_tiles[group], num_tiles)
+                if debug:
+                    logger_build.debug("\t\tlayer_to_oam[%s][%s] = %d tiles (added %d tiles)",
+                        layer, group, layer_to_oam[layer][group], num_tiles)
+                    logger_build.debug("\t\tsize_to_num_tiles[%s] = %d tiles (added %d tiles)",
+                        group, size_to_num_tiles[group], num_tiles)
             logger_build.info("\tLayer %s with %d big tiles and %d small tiles",
                 layer, layer_to_oam[layer]['big'], layer_to_oam[layer]['small'])
 
         # Debug print to show the number of OAM tiles needed for each layer
-        if logger_build.isEnabledFor(logging.DEBUG):
+        if debug:
             logger_build.debug("layer_to_oam = \n%s",
                          pprint.pformat(dict(layer_to_oam)))
             logger_build.debug("size_to_num_tiles = \n%s",
                          pprint.pformat(dict(size_to_num_tiles)))
+        profiler.end("oam_sizing")
 
         sheet = Path(data["meta"]["image"])
         logger_build.info("Loading sprite sheet %s", sheet)
@@ -524,28 +1605,36 @@ class SpriteHeader:
         sheet_width = data["meta"]["size"]["w"]
 
         # Build the pal data
+        profiler.begin("palette")
         pal_bin = sheet.with_suffix(".pal").resolve()
-        if not pal_bin.is_file():
-            logger_build.error("The palette data %s does not exist. "
-                               "Did you run the SNES GFX Tool against your "
-                               "sprite?", pal_bin)
-            raise FileNotFoundError(pal_bin)
-        with open(pal_bin, "rb") as f:
-            pal_data = Helpers.rgb_to_bgr555(f.read())
+        if pal_bin.is_file():
+            pal_data = warmcache.files.load(pal_bin, Helpers.rgb_to_bgr555, "bgr555")
+        else:
+            pal_bin = Helpers.encode_sheet(sheet, pal_bin)
+            pal_data = Helpers.rgb_to_bgr555(pngsheet.load(pal_bin).palette)
         sprite_header.pal_data = bytearray(pal_data)
         logger_build.info("\tLoaded %d bytes from %s", len(pal_data), pal_bin)
+        profiler.end("palette")
 
         # Build the sheet data
+        profiler.begin("sheet")
         sheet_bin = sheet.with_suffix(".bin").resolve()
-        if not sheet_bin.is_file():
-            logger_build.error("The 4BPP sprite sheet %s does not exist. "
-                               "Did you run the SNES GFX Tool against your "
-                               "sprite?", sheet_bin)
-            raise FileNotFoundError(sheet_bin)
-        with open(sheet_bin, "rb") as f:
-            sheet_data = f.read()
+        if sheet_bin.is_file():
+            sheet_data = warmcache.files.load(sheet_bin, bytes, "raw")
+        else:
+            sheet_bin = Helpers.encode_sheet(sheet, sheet_bin)
+            sheet_data = pngsheet.load(sheet_bin).chars
         sprite_header.sheet_data = bytearray(sheet_data)
         logger_build.info("\tLoaded %d bytes from %s", len(sheet_data), sheet_bin)
+        if logger_build.isEnabledFor(logging.INFO):
+            # Objects have no other depth, this only tells what the sheet needs
+            colors = Helpers.sheet_colors(sheet_data)
+            logger_build.info("\tSheet uses %d colors (%dbpp), objects are always %dbpp",
+                              colors, snesgfx.min_bpp(colors - 1), snesgfx.OBJ_BPP)
+        if options.tessellate == "optimal":
+            sheet_image = snesgfx.chars_to_image(snesgfx.decode_planar(sheet_data, 4),
+                                                 Helpers.SHEET_CHARS_PER_ROW)
+        profiler.end("sheet")
 
         # Build the layers
         layer_names = []
@@ -562,7 +1651,10 @@ class SpriteHeader:
         }
 
         # Build the tags
+        profiler.begin("tags")
         logger_build.info("Building tags")
+        grids = []
+        grid_layers = []
         for i, tag_dict in enumerate(data["meta"]["frameTags"]):
             tag_header = TagHeader()
             tag_name = tag_dict["name"]
@@ -579,7 +1671,8 @@ class SpriteHeader:
             for tag_frame in range(tag_header.num_frames):
                 frame_header = FrameHeader()
 
-                logger_build.debug("\t\tFrame %d: Building from layers.", tag_frame + 1)
+                if debug:
+                    logger_build.debug("\t\tFrame %d: Building from layers.", tag_frame + 1)
 
                 # Find layer data for this frame
                 layer_count = 0
@@ -587,7 +1680,8 @@ class SpriteHeader:
                     key = f"{tag_name}__{tag_frame}__{layer_name}"
                     obj = data_frames.get(key)
                     if not obj:
-                        logger_build.debug("\t\t\tSkipping '%s'", key)
+                        if debug:
+                            logger_build.debug("\t\t\tSkipping '%s'", key)
                         continue
 
                     # Build the layer header
@@ -595,10 +1689,21 @@ class SpriteHeader:
                     layer_header.rx = 0
                     layer_header.ry = 0
 
+                    # Cover the opaque pixels of the cel with the fewest objects
+                    if options.tessellate == "optimal":
+                        layer_header.tile_data = sprite_header.tessellate_cel(
+                            obj, sheet_image, options.oam_sizes)
+                        frame_header.layer_data.append(layer_header)
+                        layer_count += len(layer_header.tile_data)
+                        oam_count = max(oam_count, layer_count)
+                        continue
+
                     # Get the frame data we need
                     f_data = obj["frame"]
 
                     # Parse large/small tiles
+                    num_tiles = 0
+                    layer_start = len(grid_layers) and grid_layers[-1][2]
                     for pretty_name in ("big", "small"):
                         tile_size = Helpers.OAM_GROUP_TO_SIZE[pretty_name]
 
@@ -615,39 +1720,35 @@ class SpriteHeader:
 
                         # OAM tiles are split between small and big tiles, so
                         # we need to split the tiles based on the determined
-                        # tile size.
-                        logger_build.debug("\t\t\t%s: %s tile_size=%d (%dx%d)",
-                            key, layer_name, tile_size, w, h)
-                        k_tile = 0
-                        prog_ram_base = 16 * (y // 8) + (x // 8)
-                        for i in range(int(np.ceil(h / tile_size))):
-                            for j in range(int(np.ceil(w / tile_size))):
-                                # Build the tile header
-                                k_tile += 1
-                                tile_header = TileHeader()
-                                tile_header.prog_ram_addr =  prog_ram_base + j * (tile_size // 8)
-                                tile_header.oam_size = 1 if pretty_name == "big" else 0
-                                tile_header.rx = rx
-                                tile_header.ry = ry
-
+                        # tile size. Every row of tiles starts a new row of
+                        # objects in the sheet.
+                        if debug:
+                            logger_build.debug("\t\t\t%s: %s tile_size=%d (%dx%d)",
+                                key, layer_name, tile_size, w, h)
+                        grid = (16 * (y // 8) + (x // 8),
+                                Helpers.OAM_GROUP_TO_PROG[pretty_name],
+                                tile_size,
+                                1 if pretty_name == "big" else 0,
+                                rx, ry, w, h)
+                        rows, cols = -(-h // tile_size), -(-w // tile_size)
+                        if debug:
+                            for k_tile in range(rows * cols):
+                                i, j = divmod(k_tile, cols)
+                                prog_ram_addr = grid[0] + i * grid[1] + j * (tile_size // 8)
                                 logger_build.debug("\t\t\t\tTile %d: %d,%d at %d,%d (%d, %d) (rom=%s)",
-                                    k_tile, j, i, x, y, rx, ry, hex(tile_header.prog_ram_addr * 16 + 0x7000))
-
-                                # Add the tile header to the layer
-                                layer_header.tile_data.append(tile_header)
-
-                                # Add new offsets
-                                x += tile_size
-                                rx += tile_size
-
-                            # Add new offsets
-                            y += tile_size
-                            ry += tile_size
-                            rx = sss_data["x"]
-                            x = f_data["x"]
-                            prog_ram_base += Helpers.OAM_GROUP_TO_PROG[pretty_name]
+                                    k_tile + 1, j, i, x + j * tile_size, y + i * tile_size,
+                                    rx + j * tile_size, ry + i * tile_size,
+                                    hex(prog_ram_addr * 16 + 0x7000))
+
+                        # The tiles of the whole sprite are built at once after
+                        # the tags. Both sizes share the layer, which is listed
+                        # once per size.
+                        grids.append(grid)
+                        num_tiles += rows * cols
+                        grid_layers.append((layer_header, layer_start,
+                                            layer_start + num_tiles))
                         frame_header.layer_data.append(layer_header)
-                        layer_count += len(layer_header.tile_data)
+                        layer_count += num_tiles
                     oam_count = max(oam_count, layer_count)
                 frame_header.num_layers = len(frame_header.layer_data)
                 tag_header.frame_data.append(frame_header)
@@ -655,70 +1756,525 @@ class SpriteHeader:
             logger_build.debug("\tTag %d (%s) with %d OAM tiles",
                          i + 1, tag_name, oam_count)
             sprite_header.tag_data.append(tag_header)
+
+        # Build the tiles of every layer, which follow each other in the
+        # order of the grids
+        tiles = TileArray.grids(grids)
+        for layer_header, start, end in grid_layers:
+            layer_header.tile_data = tiles.view(start, end)
+        profiler.end("tags")
         logger_build.info("Done building sprite header")
         return sprite_header
 
-    def to_bytes(self) -> bytes:
+    def tessellate_cel(self, obj: dict, sheet: np.ndarray,
+                       sizes: Tuple[int, int]) -> List[TileHeader]:
+        """
+        Covers the opaque pixels of a cel with the fewest objects. Objects
+        may extend past the cel over transparent parts of the sheet, as long
+        as they stay within the sheet row (names wrap at 16 characters) and
+        their position relative to the layer stays positive.
+
+        :param obj: Aseprite frame entry of the cel.
+        :param sheet: Color indices of the whole sheet, (h, 128).
+        :param sizes: Small and large object sizes in pixels.
+        :return: Tile headers of the objects.
+        """
+        f_data = obj["frame"]
+        sss_data = obj["spriteSourceSize"]
+        x, y, w, h = f_data["x"], f_data["y"], f_data["w"], f_data["h"]
+        small, large = (size // snesgfx.CHAR_SIZE for size in sizes)
+
+        # Cells of the cel, padded by what a large object can overhang,
+        # without moving objects left of or above the layer origin.
+        c0, r0 = x // 8, y // 8
+        c1, r1 = -(-(x + w) // 8), -(-(y + h) // 8)
+        pad_c = min(large - 1, (sss_data["x"] - (x - c0 * 8)) // 8, c0)
+        pad_r = min(large - 1, (sss_data["y"] - (y - r0 * 8)) // 8, r0)
+        win_c0, win_r0 = c0 - max(pad_c, 0), r0 - max(pad_r, 0)
+        win_c1 = min(c1 + large - 1, Helpers.SHEET_CHARS_PER_ROW)
+        win_r1 = min(r1 + large - 1, sheet.shape[0] // 8)
+
+        # Opaque pixels of this cel, and opaque pixels of everything else
+        window = sheet[win_r0 * 8:win_r1 * 8, win_c0 * 8:win_c1 * 8]
+        inside = np.zeros(window.shape, dtype=bool)
+        inside[y - win_r0 * 8:y + h - win_r0 * 8, x - win_c0 * 8:x + w - win_c0 * 8] = True
+        rows, cols = window.shape[0] // 8, window.shape[1] // 8
+        opaque = (window != 0).reshape(rows, 8, cols, 8)
+        inside = inside.reshape(rows, 8, cols, 8)
+        required = (opaque & inside).any(axis=(1, 3))
+        allowed = ~(opaque & ~inside).any(axis=(1, 3))
+
+        tiles = []
+        for r, c, k in Helpers.tessellate(required, allowed, (small, large)):
+            tile_header = TileHeader()
+            tile_header.prog_ram_addr = (win_r0 + r) * Helpers.SHEET_CHARS_PER_ROW + win_c0 + c
+            tile_header.oam_size = 1 if k == large else 0
+            tile_header.rx = sss_data["x"] + (win_c0 + c) * 8 - x
+            tile_header.ry = sss_data["y"] + (win_r0 + r) * 8 - y
+            tiles.append(tile_header)
+        logger_build.debug("\t\t\tTessellated %dx%d cel into %d objects",
+                           w, h, len(tiles))
+        return tiles
+
+    def tiles(self) -> List[TileHeader]:
+        """
+        :return: Every tile header of every tag, frame and layer.
+        """
+        return [tile
+                for tag in self.tag_data
+                for frame in tag.frame_data
+                for layer in frame.layer_data
+                for tile in layer.tile_data]
+
+    def dedupe_chars(self, sizes: Tuple[int, int] = (Helpers.OAM_SIZE_SMALL,
+                                                     Helpers.OAM_SIZE_LARGE)) -> None:
+        """
+        Rewrites the sheet so it only holds the objects referenced by the
+        tiles, with identical and H/V/HV mirrored objects collapsed into one.
+        Objects are compared at their OAM size, since the hardware flips a
+        large object as a whole. The flip is stored in the top bits of
+        TileHeader.oam_size.
+        :param sizes: Small and large object sizes in pixels.
+        """
+        per_row = Helpers.SHEET_CHARS_PER_ROW
+        chars = snesgfx.decode_planar(self.sheet_data, 4)
+        tiles = self.tiles()
+
+        # Large objects are placed first, in rows of 4x4 characters, followed
+        # by the small objects one character each.
+        new_chars = []
+        updates = []
+        next_name = 0
+        num_objects = 0
+        num_unique = 0
+        num_flipped = 0
+        for oam_size, size in ((1, sizes[1]), (0, sizes[0])):
+            group = [tile for tile in tiles
+                     if tile.oam_size & Helpers.OAM_SIZE_MASK == oam_size]
+            if not group:
+                continue
+            n = size // snesgfx.CHAR_SIZE
+
+            # Characters of an object wrap within the sheet row, like OAM names
+            names = np.array([tile.prog_ram_addr for tile in group])
+            rows = (names // per_row)[:, None] + np.arange(n)
+            cols = ((names % per_row)[:, None] + np.arange(n)) % per_row
+            grid = np.zeros(((rows.max() + 1) * per_row, 8, 8), dtype=np.uint8)
+            grid[:len(chars)] = chars[:len(grid)]
+            grid = grid.reshape(-1, per_row, 8, 8)
+            blocks = (grid[rows[:, :, None], cols[:, None, :]]
+                      .transpose(0, 1, 3, 2, 4)
+                      .reshape(len(group), size, size))
+
+            unique, index, flip = snesgfx.dedupe_blocks(blocks)
+
+            # Place the unique objects and remember their names
+            per_line = per_row // n
+            base = next_name
+            for k, block in enumerate(blocks[unique]):
+                name = base + (k // per_line) * per_row * n + (k % per_line) * n
+                for dy in range(n):
+                    for dx in range(n):
+                        char = block[dy * 8:(dy + 1) * 8, dx * 8:(dx + 1) * 8]
+                        new_chars.append((name + dy * per_row + dx, char))
+            lines = -(-len(unique) // per_line)
+            next_name = base + lines * per_row * n if n > 1 else base + len(unique)
+
+            for tile, k, f in zip(group, index, flip):
+                k = int(k)
+                name = base + (k // per_line) * per_row * n + (k % per_line) * n
+                updates.append((tile, name, oam_size
+                                | (Helpers.OAM_FLIP_H if f & snesgfx.FLIP_H else 0)
+                                | (Helpers.OAM_FLIP_V if f & snesgfx.FLIP_V else 0)))
+
+            num_objects += len(group)
+            num_unique += len(unique)
+            num_flipped += int(np.count_nonzero(flip))
+
+        # Only keep the characters up to the last one in use
+        num_chars = max((name for name, _ in new_chars), default=-1) + 1
+        sheet = np.zeros((num_chars, 8, 8), dtype=np.uint8)
+        for name, char in new_chars:
+            sheet[name] = char
+        sheet_data = snesgfx.encode_planar(sheet, 4)
+        logger_build.info("Deduplicated %d objects into %d unique (%d flipped), "
+                          "sheet %d -> %d bytes", num_objects, num_unique,
+                          num_flipped, len(self.sheet_data), len(sheet_data))
+
+        # The aligned layout can be larger than the packed Aseprite sheet
+        # when there is nothing to collapse, and names must fit in a byte.
+        if len(sheet_data) >= len(self.sheet_data) or num_chars > 0x100:
+            logger_build.info("Keeping the original sheet")
+            return
+
+        for tile, name, oam_size in updates:
+            tile.prog_ram_addr = name
+            tile.oam_size = oam_size
+        self.sheet_data = bytearray(sheet_data)
+
+    def build_dma_schedule(self, budget: int,
+                           sizes: Tuple[int, int] = (Helpers.OAM_SIZE_SMALL,
+                                                     Helpers.OAM_SIZE_LARGE)) -> None:
+        """
+        Lays out the objects of every frame in a small VRAM slot and computes
+        the sheet characters to upload for it, merged into contiguous runs.
+        The tiles are rewritten to address the slot instead of the sheet.
+        :param budget: Bytes that can be uploaded in a single vblank.
+        :param sizes: Small and large object sizes in pixels.
+        """
+        per_row = Helpers.SHEET_CHARS_PER_ROW
+        char_bytes = snesgfx.char_bytes(4)
+        num_chars = len(self.sheet_data) // char_bytes
+
+        schedule = DmaScheduleHeader()
+        for tag in self.tag_data:
+            schedule.tag_frames.append(len(schedule.frame_data))
+            for i, frame in enumerate(tag.frame_data):
+                tiles = [tile for layer in frame.layer_data for tile in layer.tile_data]
+
+                # Large objects are placed first, in bands as tall as the
+                # object, like the sheet. Objects used twice are placed once.
+                uploads = []
+                slot_names = {}
+                next_name = 0
+                for oam_size, size in ((1, sizes[1]), (0, sizes[0])):
+                    n = size // snesgfx.CHAR_SIZE
+                    per_line = per_row // n
+                    objects = sorted({tile.prog_ram_addr for tile in tiles
+                                      if tile.oam_size & Helpers.OAM_SIZE_MASK == oam_size})
+                    for k, name in enumerate(objects):
+                        slot_name = next_name + (k // per_line) * per_row * n + (k % per_line) * n
+                        slot_names[oam_size, name] = slot_name
+                        row, col = divmod(name, per_row)
+                        for dy in range(n):
+                            for dx in range(n):
+                                source = (row + dy) * per_row + (col + dx) % per_row
+                                if source < num_chars:
+                                    uploads.append((slot_name + dy * per_row + dx, source))
+                    lines = -(-len(objects) // per_line)
+                    next_name += lines * per_row * n if n > 1 else len(objects)
+
+                for tile in tiles:
+                    tile.prog_ram_addr = slot_names[tile.oam_size & Helpers.OAM_SIZE_MASK,
+                                                    tile.prog_ram_addr]
+
+                frame_header = DmaFrameHeader.from_uploads(uploads)
+                if uploads:
+                    schedule.slot_words = max(schedule.slot_words,
+                        (max(uploads)[0] + 1) * char_bytes // 2)
+
+                logger_build.debug("\tTag %s frame %d: %d runs, %d bytes",
+                    tag.name, i, len(frame_header.run_data), frame_header.cost)
+                if frame_header.cost > budget:
+                    logger_build.warning("Tag %s frame %d uploads %d bytes, over the "
+                        "%d byte vblank budget", tag.name, i, frame_header.cost, budget)
+                schedule.frame_data.append(frame_header)
+
+        costs = [frame.cost for frame in schedule.frame_data]
+        logger_build.info("DMA schedule: %d frames, %d slot words, %d bytes "
+                          "per frame at most (sheet is %d bytes)", len(costs),
+                          schedule.slot_words, max(costs, default=0),
+                          len(self.sheet_data))
+        self.dma_schedule = schedule
+
+    def oam_table(self) -> OamTableHeader:
+        """
+        Flattens every frame into OAM entries, in the order the layers and
+        tiles are drawn. Must be built before delta_encode().
+        :return: The OAM table of the sprite.
+        """
+        table = OamTableHeader()
+        for tag in self.tag_data:
+            oam_tag = OamTagHeader(tag.name, tag.direction, tag.oam_count)
+            for frame in tag.frame_data:
+                oam_frame = OamFrameHeader()
+                for layer in frame.layer_data:
+                    for tile in layer.tile_data:
+                        attributes = tile.oam_size & (Helpers.OAM_FLIP_H | Helpers.OAM_FLIP_V)
+                        large = 1 if tile.oam_size & Helpers.OAM_SIZE_MASK else 0
+                        oam_frame.objects.append((layer.rx + tile.rx, layer.ry + tile.ry,
+                                                  tile.prog_ram_addr, attributes, large))
+                oam_tag.frame_data.append(oam_frame)
+            table.tag_data.append(oam_tag)
+        return table
+
+    def delta_encode(self, keyframe_interval: int) -> None:
+        """
+        Replaces frames with the tiles and character uploads that changed
+        since the frame shown before them. Tags played in reverse compare
+        with the next frame, and ping-pong tags with both neighbors so the
+        delta applies in either direction. The first frame played and every
+        keyframe_interval-th frame after it stay complete.
+        :param keyframe_interval: Frames between keyframes, 0 for only the first.
+        """
+        schedule = self.dma_schedule
+        totals = defaultdict(int)
+        for t, tag in enumerate(self.tag_data):
+            frames = tag.frame_data
+            n = len(frames)
+            full_bytes = sum(frame.num_bytes() for frame in frames)
+            full_tiles = sum(len(layer.tile_data) for frame in frames
+                             for layer in frame.layer_data)
+            dma_frames = schedule.frame_data[schedule.tag_frames[t]:][:n] if schedule else []
+            full_dma = sum(frame.cost for frame in dma_frames)
+
+            encoded = []
+            for i, frame in enumerate(frames):
+                if tag.direction == 1:
+                    position, neighbors = n - 1 - i, [i + 1]
+                elif tag.direction == 2:
+                    position, neighbors = i, [i - 1, i + 1]
+                else:
+                    position, neighbors = i, [i - 1]
+                neighbors = [j for j in neighbors if 0 <= j < n]
+                if (position == 0 or not neighbors
+                        or (keyframe_interval and position % keyframe_interval == 0)
+                        or any(len(frames[j].layer_data) != len(frame.layer_data)
+                               for j in neighbors)):
+                    encoded.append(frame)
+                    continue
+
+                delta = FrameHeader(keyframe=False)
+                for k, layer in enumerate(frame.layer_data):
+                    changed = set()
+                    moved = False
+                    for j in neighbors:
+                        prev = frames[j].layer_data[k]
+                        for index, tile in enumerate(layer.tile_data):
+                            if (index >= len(prev.tile_data)
+                                    or astuple(tile) != astuple(prev.tile_data[index])):
+                                changed.add(index)
+                        moved |= ((layer.rx, layer.ry, len(layer.tile_data))
+                                  != (prev.rx, prev.ry, len(prev.tile_data)))
+                    if changed or moved:
+                        delta.layer_data.append(LayerDeltaHeader(
+                            k, layer.rx, layer.ry, len(layer.tile_data),
+                            [TileDeltaHeader(index, layer.tile_data[index])
+                             for index in sorted(changed)]))
+                delta.num_layers = len(delta.layer_data)
+                if delta.num_bytes() >= frame.num_bytes():
+                    encoded.append(frame)
+                    continue
+                encoded.append(delta)
+
+                # The slot still holds what the previous frame uploaded
+                if schedule:
+                    slot = [dict(dma_frames[j].uploads) for j in neighbors]
+                    uploads = [(dest, source) for dest, source in dma_frames[i].uploads
+                               if any(prev.get(dest) != source for prev in slot)]
+                    schedule.frame_data[schedule.tag_frames[t] + i] = \
+                        DmaFrameHeader.from_uploads(uploads)
+
+            tag.frame_data = encoded
+            delta_bytes = sum(frame.num_bytes() for frame in encoded)
+            delta_tiles = sum(len(layer.tile_data) for frame in encoded
+                              for layer in frame.layer_data)
+            delta_dma = (sum(frame.cost for frame in
+                             schedule.frame_data[schedule.tag_frames[t]:][:n])
+                         if schedule else 0)
+            logger_build.info("\tTag %s: %d keyframes of %d, %d -> %d bytes, "
+                              "%d -> %d tile writes, %d -> %d DMA bytes", tag.name,
+                              sum(frame.keyframe for frame in encoded), n,
+                              full_bytes, delta_bytes, full_tiles, delta_tiles,
+                              full_dma, delta_dma)
+            for key, value in (("full_bytes", full_bytes), ("delta_bytes", delta_bytes),
+                               ("full_tiles", full_tiles), ("delta_tiles", delta_tiles),
+                               ("full_dma", full_dma), ("delta_dma", delta_dma)):
+                totals[key] += value
+
+        logger_build.info("Delta frames: %d -> %d bytes, %d -> %d tile writes, "
+                          "%d -> %d DMA bytes", totals["full_bytes"],
+                          totals["delta_bytes"], totals["full_tiles"],
+                          totals["delta_tiles"], totals["full_dma"],
+                          totals["delta_dma"])
+
+    def num_bytes(self, release: bool = False) -> int:
+        """
+        :return: Size of the serialized sprite including all of its tags.
+        """
+        return ((self.RELEASE_STRUCT if release else self.STRUCT).size
+                + len(self.pal_data)
+                + len(self.sheet_data)
+                + TagMetadataHeader().num_bytes(release) * len(self.tag_data)
+                + sum(tag.num_bytes(release) for tag in self.tag_data)
+                + (self.dma_schedule.num_bytes(release) if self.dma_schedule else 0))
+
+    def section_sizes(self, release: bool = False) -> Dict[str, int]:
+        """
+        :return: Bytes of every section of the serialized sprite, in order.
+        """
+        return {
+            "header": (self.RELEASE_STRUCT if release else self.STRUCT).size,
+            "palette": len(self.pal_data),
+            "sheet": len(self.sheet_data),
+            "tag_metadata": TagMetadataHeader().num_bytes(release) * len(self.tag_data),
+            "tags": sum(tag.num_bytes(release) for tag in self.tag_data),
+            "dma_schedule": (self.dma_schedule.num_bytes(release)
+                             if self.dma_schedule else 0),
+        }
+
+    def pack_into(self, buffer: bytearray, offset: int, release: bool = False) -> int:
+        """
+        Writes the sprite header, palette, sheet, tag metadata and tags.
+        The tags are written first and the tag metadata is filled in
+        afterwards, once the offset of every tag is known.
+
+        The release format only keeps the counts in its header, every
+        section directly follows the previous one.
+
+        :param buffer: Buffer to write the sprite into.
+        :param offset: Offset in the buffer to write to.
+        :param release: Write the compact release format.
+        :return: Offset just past the last written tag.
+        """
         # Maximum of 8-bytes for the sprite name
         name_bytes = self.name.encode("ascii", "replace")[:8]
-
-        # Build the tag metadata dynamically
-        self.tag_metadatas = []
-        tag_data = b''
-        running_offset = 0
         logger_serialize.debug("Serializing sprite header: %s", self.name)
-        for i, tag in enumerate(self.tag_data, start=1):
-            self.tag_metadatas.append(TagMetadataHeader(running_offset))
-            data = tag.to_bytes()
-            logger_build.debug("\tTag %d: %d bytes", i, len(data))
-            running_offset += len(data)
-            tag_data += data
 
         # Computed fields
         magic = b"SPR"
-        tag_metadata_bytes = Helpers.to_bytes(self.tag_metadatas)
-
-        offset = 0
+        data_offset = 0
 
         # The count is the number of 16-bit words
         pal_data_count = len(self.pal_data) // 2
-        pal_data_offset = offset
-        offset += len(self.pal_data)
+        pal_data_offset = data_offset
+        data_offset += len(self.pal_data)
         logger_build.info("PAL data is at offset %d", pal_data_offset)
 
         # The count is the number of 16-bit words
         sheet_data_count = len(self.sheet_data) // 2
-        sheet_data_offset = offset
-        offset += len(self.sheet_data)
+        sheet_data_offset = data_offset
+        data_offset += len(self.sheet_data)
         logger_build.info("Sprite sheet data is at offset %d", sheet_data_offset)
 
-        tag_metadata_count = len(self.tag_metadatas)
-        tag_metadata_offset = offset
-        self.tag_metadata_offset = offset
-        offset += len(tag_metadata_bytes)
+        tag_metadata_count = len(self.tag_data)
+        tag_metadata_offset = data_offset
+        self.tag_metadata_offset = data_offset
+        data_offset += TagMetadataHeader().num_bytes(release) * tag_metadata_count
         logger_build.info("Tag metadata is at offset %d", tag_metadata_offset)
 
         tag_count = len(self.tag_data)
-        tag_offset = offset
-        self.tag_offset = offset
+        tag_offset = data_offset
+        self.tag_offset = data_offset
         logger_build.info("Tag data is at offset %d", tag_offset)
 
         # See sprite.asm for the format of the sprite header
-        return (struct.pack("<3s8s" "HH" "HH" "BH" "BH",
-                            magic,
-                            name_bytes,
-                            pal_data_count,
-                            pal_data_offset,
-                            sheet_data_count,
-                            sheet_data_offset,
-                            tag_metadata_count,
-                            tag_metadata_offset,
-                            tag_count,
-                            tag_offset)
-                + self.pal_data
-                + self.sheet_data
-                + tag_metadata_bytes
-                + Helpers.to_bytes(self.tag_data))
+        if release:
+            self.RELEASE_STRUCT.pack_into(buffer, offset,
+                                          self.RELEASE_MAGIC,
+                                          self.RELEASE_VERSION,
+                                          name_bytes,
+                                          pal_data_count,
+                                          sheet_data_count,
+                                          tag_count)
+            start = offset + self.RELEASE_STRUCT.size
+        else:
+            self.STRUCT.pack_into(buffer, offset,
+                                  magic,
+                                  name_bytes,
+                                  pal_data_count,
+                                  pal_data_offset,
+                                  sheet_data_count,
+                                  sheet_data_offset,
+                                  tag_metadata_count,
+                                  tag_metadata_offset,
+                                  tag_count,
+                                  tag_offset)
+            start = offset + self.STRUCT.size
+
+        # Raw payloads are copied in bulk
+        pal_start = start + pal_data_offset
+        buffer[pal_start:pal_start + len(self.pal_data)] = self.pal_data
+        sheet_start = start + sheet_data_offset
+        buffer[sheet_start:sheet_start + len(self.sheet_data)] = self.sheet_data
+
+        # Tags are written exactly once and their offsets collected
+        self.tag_metadatas = []
+        metadata_start = start + tag_metadata_offset
+        tag_start = start + tag_offset
+        end = tag_start
+        for i, tag in enumerate(self.tag_data, start=1):
+            self.tag_metadatas.append(TagMetadataHeader(end - tag_start))
+            tag_end = tag.pack_into(buffer, end, release)
+            if Helpers.trace_build:
+                logger_build.debug("\tTag %d: %d bytes", i, tag_end - end)
+            end = tag_end
+
+        for tag_metadata in self.tag_metadatas:
+            metadata_start = tag_metadata.pack_into(buffer, metadata_start, release)
+
+        # The optional DMA schedule follows the tags, found through the .i file
+        if self.dma_schedule:
+            self.dma_offset = end - start
+            end = self.dma_schedule.pack_into(buffer, end, release)
+        return end
+
+    def to_bytes(self, release: bool = False) -> bytes:
+        """
+        :return: Serialized sprite header and all of its data.
+        """
+        return Helpers.serialize(self, release)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SpriteHeader":
+        """
+        Reads back a sprite written by to_bytes() in either format. Fields
+        that are not serialized, such as the tag names, are left empty.
+        :param data: Contents of a .sprite file.
+        :return: The sprite header and everything below it.
+        """
+        magic = bytes(data[:3])
+        if magic == cls.RELEASE_MAGIC:
+            (_, version, name, pal_data_count, sheet_data_count,
+             tag_count) = cls.RELEASE_STRUCT.unpack_from(data, 0)
+            if version != cls.RELEASE_VERSION:
+                raise ValueError(f"Unsupported release format version {version}")
+            release = True
+            start = cls.RELEASE_STRUCT.size
+            pal_data_offset = 0
+            sheet_data_offset = pal_data_offset + 2 * pal_data_count
+            tag_metadata_count = tag_count
+            tag_metadata_offset = sheet_data_offset + 2 * sheet_data_count
+            tag_offset = tag_metadata_offset + TagMetadataHeader.RELEASE_STRUCT.size * tag_count
+        elif magic == b"SPR":
+            (_, name, pal_data_count, pal_data_offset, sheet_data_count,
+             sheet_data_offset, tag_metadata_count, tag_metadata_offset,
+             tag_count, tag_offset) = cls.STRUCT.unpack_from(data, 0)
+            release = False
+            start = cls.STRUCT.size
+        else:
+            raise ValueError(f"Not a sprite, found {magic!r}")
+
+        sprite_header = cls(name.rstrip(b"\0").decode("ascii"))
+        pal_start = start + pal_data_offset
+        sprite_header.pal_data = bytearray(data[pal_start:pal_start + 2 * pal_data_count])
+        sheet_start = start + sheet_data_offset
+        sprite_header.sheet_data = bytearray(data[sheet_start:sheet_start + 2 * sheet_data_count])
+        sprite_header.tag_metadata_offset = tag_metadata_offset
+        sprite_header.tag_offset = tag_offset
+
+        # Tags are found through their metadata
+        sprite_header.tag_metadatas = []
+        metadata_start = start + tag_metadata_offset
+        end = start + tag_offset
+        for _ in range(tag_metadata_count):
+            tag_metadata, metadata_start = TagMetadataHeader.unpack_from(
+                data, metadata_start, release)
+            sprite_header.tag_metadatas.append(tag_metadata)
+            tag, tag_end = TagHeader.unpack_from(
+                data, start + tag_offset + tag_metadata.offset, release)
+            sprite_header.tag_data.append(tag)
+            end = max(end, tag_end)
+
+        # Anything past the tags is the DMA schedule
+        if end < len(data):
+            sprite_header.dma_offset = end - start
+            sprite_header.dma_schedule, end = DmaScheduleHeader.unpack_from(data, end, release)
+        if end != len(data):
+            raise ValueError(f"Read {end} bytes, expected {len(data)}")
+        sprite_header.num_layers = max((frame.num_layers for tag in sprite_header.tag_data
+                                        for frame in tag.frame_data), default=0)
+        return sprite_header
 
 
 class AsepriteParser:
@@ -727,7 +2283,8 @@ class AsepriteParser:
     """
     sprite_dir: Path        # The directory containing the Aseprite sprite data.
 
-    def __init__(self, sprite_dir: Path):
+    def __init__(self, sprite_dir: Path, options: "ConversionOptions" = None,
+                 profiler: Profiler = None):
         import os
 
         # Check if the provided path is a directory, which is needed to
@@ -736,19 +2293,27 @@ class AsepriteParser:
         if not sprite_dir.is_dir():
             raise NotADirectoryError(f"{sprite_dir} is not a directory")
         self.sprite_dir = sprite_dir
+        self.options = options
+        self.profiler = profiler or Profiler.disabled()
 
         # Read the JSON file from the sprite directory
         basename = sprite_dir.name + ".json"
         json_path = self.sprite_dir / basename
         logger_build.info("Reading Asesprite JSON data from %s", json_path)
-        with open(json_path, "r") as json_file:
-            json_data = json_file.read()
+        with self.profiler.stage("json_load"):
+            data = warmcache.files.load(json_path, json.loads, "json")
 
-        # Parse the JSON data and create a SpriteHeader instance
+        # Create a SpriteHeader instance, the paths within the JSON data are
+        # relative to the sprite directory. The working directory is restored
+        # on failure so a long running process can convert the next sprite.
         prev_path = os.getcwd()
         os.chdir(self.sprite_dir)
-        self.sprite_header = self.parse_json(json_data)
-        os.chdir(prev_path)
+        try:
+            with self.profiler.stage("from_dict"):
+                self.sprite_header = SpriteHeader.from_dict(data, self.options,
+                                                            self.profiler)
+        finally:
+            os.chdir(prev_path)
 
     def parse_json(self, json_data: str) -> None:
         """
@@ -758,22 +2323,48 @@ class AsepriteParser:
         :param json_data: JSON string containing the Aseprite animation data.
         :return: A SpriteHeader instance with the parsed data.
         """
-        data = json.loads(json_data)
-        return SpriteHeader.from_dict(data)
+        with self.profiler.stage("json_load"):
+            data = json.loads(json_data)
+        with self.profiler.stage("from_dict"):
+            return SpriteHeader.from_dict(data, self.options, self.profiler)
 
 
-def main(argv):
-    import argparse
+@dataclass
+class ConversionOptions:
+    """
+    Optional conversion passes, shared by every sprite of a batch.
+    """
+    dedupe_chars: bool = False   # Collapse duplicate and mirrored objects
+    tessellate: str = "size-group"  # "size-group" or "optimal" object covering
+    oam_sizes: Tuple[int, int] = (Helpers.OAM_SIZE_SMALL, Helpers.OAM_SIZE_LARGE)
+    dma_schedule: bool = False   # Emit per frame character uploads
+    dma_budget: int = Helpers.DMA_VBLANK_BUDGET  # Bytes per vblank
+    delta_frames: bool = False   # Store frames as changes to the previous one
+    oam_table: bool = False      # Also write flattened OAM entries (.oam)
+    keyframe_interval: int = 8   # Frames between complete frames, 0 for none
+    format: str = "debug"        # "debug" with record magics or compact "release"
+    profile: bool = False        # Collect stage timings and counters
+    cprofile_dir: str = ""       # Directory for cProfile dumps, empty for none
 
-    parser = argparse.ArgumentParser(
-        description="Aseprite to SNES Sprite Converter",
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-        epilog="Example: python aseprite2bin.py -i path_to_sprite_dir")
-    parser.add_argument("-i", "--input", type=str, required=True)
-    parser.add_argument("-b", "--bank", type=int, required=True)
-    parser.add_argument("-l", "--logmode", nargs="*", default=[])
-    args = parser.parse_args(argv)
 
+@dataclass
+class ConversionResult:
+    """
+    Outcome of converting a single sprite directory.
+    """
+    name: str = ""               # Name of the sprite
+    path: str = ""               # Directory of the sprite
+    ok: bool = False             # Whether the conversion succeeded
+    error: str = ""              # Error message if the conversion failed
+    num_bytes: int = 0           # Size of the written .sprite file
+    elapsed: float = 0.0         # Wall time of the conversion in seconds
+    profile: dict = field(default_factory=dict)  # Stages and counters with --profile
+
+
+def configure_logging(logmodes: List[str]) -> None:
+    """
+    Configures the build and serialize loggers from <logger>:<level> pairs.
+    """
     loggers = {
         "build": logger_build,
         "serialize": logger_serialize
@@ -783,7 +2374,7 @@ def main(argv):
     logging.basicConfig(level=logging.INFO)
 
     # Set the log level for each logger
-    for logmode in args.logmode:
+    for logmode in logmodes:
         if ':' not in logmode:
             valid_loggers = ", ".join(loggers.keys())
             raise ValueError(f"Invalid logmode: {logmode}. "
@@ -792,19 +2383,107 @@ def main(argv):
         logger, log_level = logmode.split(":")
         loggers.get(logger, logging).setLevel(log_level)
 
-    # Parse the Aseprite sprite
-    path = Path(args.input).resolve()
+
+def discover_sprites(root: Path) -> List[Path]:
+    """
+    Finds every sprite directory below root. A sprite directory contains a
+    JSON export with the same name as the directory.
+    :param root: Directory to search, e.g. resources/sprites.
+    :return: Sorted list of sprite directories.
+    """
+    return sorted(path.parent for path in root.glob("*/*.json")
+                  if path.stem == path.parent.name)
+
+
+def verify_formats(debug: bytes, release: bytes) -> None:
+    """
+    Checks that a sprite written in both formats decodes to the same tree.
+    :param debug: The sprite in the debug format.
+    :param release: The same sprite in the release format.
+    """
+    debug_header = SpriteHeader.from_bytes(debug)
+    release_header = SpriteHeader.from_bytes(release)
+    for name in ("name", "pal_data", "sheet_data", "tag_data", "dma_schedule"):
+        if getattr(debug_header, name) != getattr(release_header, name):
+            raise ValueError(f"Debug and release formats differ in {name}")
+    for debug_tag, release_tag in zip(debug_header.tag_data, release_header.tag_data):
+        if debug_tag.num_frames != release_tag.num_frames:
+            raise ValueError("Debug and release formats differ in num_frames")
+    if release_header.to_bytes(release=True) != release:
+        raise ValueError("Release format does not round trip")
+
+
+def convert(sprite_dir: Path, bank: int,
+            options: ConversionOptions = None) -> ConversionResult:
+    """
+    Converts a sprite directory and writes the .sprite and .i files into it.
+    :param sprite_dir: Directory containing the Aseprite export.
+    :param bank: ROM bank the sprite is placed in.
+    :param options: Optional conversion passes.
+    :return: The result of the conversion.
+    """
+    import time
+
+    start = time.perf_counter()
+    path = sprite_dir.resolve()
     name = path.name
-    asepite_parser = AsepriteParser(path)
+    result = ConversionResult(name=name, path=str(path))
+
+    # Parse the Aseprite sprite
+    options = options or ConversionOptions()
+    profiler = Profiler(enabled=options.profile or bool(options.cprofile_dir),
+                        cprofile=bool(options.cprofile_dir))
+    profiler.start()
+    with profiler.stage("parse"):
+        asepite_parser = AsepriteParser(path, options, profiler)
+    if options.dedupe_chars:
+        with profiler.stage("dedupe_chars"):
+            asepite_parser.sprite_header.dedupe_chars(options.oam_sizes)
+    if options.dma_schedule:
+        with profiler.stage("dma_schedule"):
+            asepite_parser.sprite_header.build_dma_schedule(options.dma_budget,
+                                                            options.oam_sizes)
+    oam_table = None
+    if options.oam_table:
+        with profiler.stage("oam_table"):
+            oam_table = asepite_parser.sprite_header.oam_table()
+    if options.delta_frames:
+        with profiler.stage("delta_encode"):
+            asepite_parser.sprite_header.delta_encode(options.keyframe_interval)
 
     # Write the output file
     output_fname = asepite_parser.sprite_dir.name + ".sprite"
     output_path = asepite_parser.sprite_dir / output_fname
+    profiler.begin("serialize")
+    sprite_bytes = asepite_parser.sprite_header.to_bytes()
+    if options.format == "release":
+        debug_bytes = sprite_bytes
+        sprite_bytes = asepite_parser.sprite_header.to_bytes(release=True)
+        profiler.end("serialize")
+        with profiler.stage("verify"):
+            verify_formats(debug_bytes, sprite_bytes)
+        logger_build.info("Release format: %d -> %d bytes (%d saved, %.1f%%)",
+                          len(debug_bytes), len(sprite_bytes),
+                          len(debug_bytes) - len(sprite_bytes),
+                          100 * (1 - len(sprite_bytes) / len(debug_bytes)))
+    else:
+        profiler.end("serialize")
+    profiler.begin("write")
     with open(output_path, "wb") as output_file:
         logger_serialize.debug("Serializing sprite header to %s", output_path)
-        num_bytes = output_file.write(asepite_parser.sprite_header.to_bytes())
+        num_bytes = output_file.write(sprite_bytes)
         logger_serialize.info("Wrote sprite header to %s (%d bytes)",
             output_path, num_bytes)
+    result.num_bytes = num_bytes
+
+    # Write the flattened OAM entries
+    if oam_table:
+        output_path = asepite_parser.sprite_dir / (name + ".oam")
+        with open(output_path, "wb") as output_file:
+            oam_bytes = output_file.write(oam_table.to_bytes())
+        profiler.count("bytes/oam_table", oam_bytes)
+        logger_serialize.info("Wrote OAM table to %s (%d bytes)",
+            output_path, oam_bytes)
 
     # Write the animation mapper
     n = name
@@ -820,15 +2499,217 @@ def main(argv):
         tag_name = tag_header.name.replace('-', '_')
         define_name = f'Sprite_{pretty_n}@Tag@{tag_name}'.ljust(40)
         output_info += f'.define {define_name} {hex_offset} ; {offset}\n'
+    if asepite_parser.sprite_header.dma_schedule:
+        dma_offset = asepite_parser.sprite_header.dma_offset
+        define_name = f'Sprite_{pretty_n}@DMA'.ljust(40)
+        output_info += f'.define {define_name} {hex(dma_offset).replace("0x", "$").upper()} ; {dma_offset}\n'
+        slot_words = asepite_parser.sprite_header.dma_schedule.slot_words
+        define_name = f'Sprite_{pretty_n}@DMASlot'.ljust(40)
+        output_info += f'.define {define_name} {hex(slot_words).replace("0x", "$").upper()} ; {slot_words}\n'
+    if oam_table:
+        output_info += f'Sprite_{pretty_n}@OAM: .incbin "resources/sprites/{n}/{n}.oam"\n'
+        for tag_header, offset in zip(oam_table.tag_data, oam_table.tag_offsets):
+            hex_offset = hex(offset).replace('0x', '$').upper()
+            tag_name = tag_header.name.replace('-', '_')
+            define_name = f'Sprite_{pretty_n}@OAM@{tag_name}'.ljust(40)
+            output_info += f'.define {define_name} {hex_offset} ; {offset}\n'
     bank_name = f'Sprite_{pretty_n}@Bank'.ljust(40)
-    output_info += f'.define {bank_name} {args.bank}'
+    output_info += f'.define {bank_name} {bank}'
     with open(output_path, "w") as output_file:
         logger_build.debug("Writing animation mapper to %s", output_path)
         num_bytes = output_file.write(output_info)
         logger_build.info("Wrote animation mapper to %s (%d bytes)",
             output_path, num_bytes)
+    profiler.end("write")
+    profiler.stop()
+
+    if profiler.enabled:
+        sprite_header = asepite_parser.sprite_header
+        frames = [frame for tag in sprite_header.tag_data for frame in tag.frame_data]
+        layers = [layer for frame in frames for layer in frame.layer_data]
+        profiler.count("tags", len(sprite_header.tag_data))
+        profiler.count("frames", len(frames))
+        profiler.count("layers", len(layers))
+        profiler.count("tiles", sum(len(layer.tile_data) for layer in layers))
+        profiler.count("sheet_chars", len(sprite_header.sheet_data) // snesgfx.char_bytes(4))
+        profiler.count("sheet_colors", Helpers.sheet_colors(sprite_header.sheet_data))
+        sections = sprite_header.section_sizes(options.format == "release")
+        for section, size in sections.items():
+            profiler.count(f"bytes/{section}", size)
+        if options.cprofile_dir:
+            cprofile_path = Path(options.cprofile_dir) / f"{name}.pstats"
+            cprofile_path.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump(str(cprofile_path))
+            logger_build.info("Wrote cProfile statistics to %s", cprofile_path)
+        result.profile = profiler.to_dict()
+
+    result.ok = True
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def convert_safe(sprite_dir: Path, bank: int,
+                 options: ConversionOptions = None) -> ConversionResult:
+    """
+    Same as convert(), but failures are returned instead of raised so that
+    one broken sprite does not abort a batch.
+    """
+    import time
+
+    start = time.perf_counter()
+    try:
+        return convert(sprite_dir, bank, options)
+    except Exception as e:
+        logger_build.exception("Failed to convert %s", sprite_dir)
+        return ConversionResult(name=sprite_dir.name, path=str(sprite_dir),
+                                error=f"{type(e).__name__}: {e}",
+                                elapsed=time.perf_counter() - start)
+
+
+def convert_batch(jobs: List[Tuple[Path, int]], num_workers: int,
+                  logmodes: List[str],
+                  options: ConversionOptions = None) -> List[ConversionResult]:
+    """
+    Converts many sprite directories across a process pool. Every worker
+    imports numpy once and then converts many sprites.
+    :param jobs: List of (sprite directory, bank) pairs.
+    :param num_workers: Maximum number of worker processes.
+    :param logmodes: Logging configuration to apply in every worker.
+    :param options: Optional conversion passes.
+    :return: Results in the same order as jobs.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    num_workers = max(1, min(num_workers, len(jobs)))
+    if num_workers == 1:
+        return [convert_safe(sprite_dir, bank, options) for sprite_dir, bank in jobs]
+
+    with ProcessPoolExecutor(max_workers=num_workers,
+                             initializer=configure_logging,
+                             initargs=(logmodes,)) as executor:
+        futures = [executor.submit(convert_safe, sprite_dir, bank, options)
+                   for sprite_dir, bank in jobs]
+        return [future.result() for future in futures]
+
+
+def write_profile(results: List[ConversionResult], path: Optional[str]) -> None:
+    """
+    Writes the profile of every converted sprite as JSON, keyed by name.
+    :param path: File to write to, "-" for stdout or None to skip.
+    """
+    import sys
+
+    if not path:
+        return
+    profile = {result.name: dict(result.profile, elapsed=result.elapsed)
+               for result in results if result.ok}
+    if path == "-":
+        json.dump(profile, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+        return
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=1)
+    logger_build.info("Wrote profile to %s", path)
+
+
+def main(argv):
+    import argparse
+    import os
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Aseprite to SNES Sprite Converter",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python aseprite2bin.py -i path_to_sprite_dir")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("-i", "--input", type=str, action="append",
+                        help="Sprite directory, may be repeated")
+    inputs.add_argument("-a", "--all", type=str,
+                        help="Convert every sprite directory below this root")
+    parser.add_argument("-b", "--bank", type=int,
+                        help="ROM bank, read from the existing .i if omitted")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("-l", "--logmode", nargs="*", default=[])
+    parser.add_argument("-d", "--dedupe-chars", action="store_true",
+                        help="Collapse duplicate and mirrored objects in the sheet")
+    parser.add_argument("-t", "--tessellate", choices=("size-group", "optimal"),
+                        default="size-group",
+                        help="How cels are covered with objects")
+    parser.add_argument("-s", "--oam-sizes", type=str, default="8,32",
+                        help="Small and large object sizes set in OBSEL")
+    parser.add_argument("--dma-schedule", action="store_true",
+                        help="Emit the characters each frame uploads")
+    parser.add_argument("--dma-budget", type=int, default=Helpers.DMA_VBLANK_BUDGET,
+                        help="Bytes a frame may upload per vblank")
+    parser.add_argument("--delta-frames", action="store_true",
+                        help="Store frames as the changes to the previous frame")
+    parser.add_argument("--keyframe-interval", type=int, default=8,
+                        help="Frames between complete frames, 0 for only the first")
+    parser.add_argument("--oam-table", action="store_true",
+                        help="Also write every frame as flattened OAM entries")
+    parser.add_argument("--format", choices=("debug", "release"), default="debug",
+                        help="Keep the record magics or write the compact release format")
+    parser.add_argument("--profile", type=str, nargs="?", const="-",
+                        help="Write stage timings and counters as JSON, to stdout without a file")
+    parser.add_argument("--cprofile", type=str,
+                        help="Directory to write a cProfile dump of every sprite into")
+    args = parser.parse_args(argv)
 
-    return 0
+    oam_sizes = tuple(int(size) for size in args.oam_sizes.split(","))
+    if oam_sizes not in Helpers.OAM_SIZE_PAIRS:
+        parser.error(f"Invalid OAM sizes: {args.oam_sizes}. Must be one of "
+                     + " ".join(f"{s},{l}" for s, l in Helpers.OAM_SIZE_PAIRS))
+
+    configure_logging(args.logmode)
+    options = ConversionOptions(dedupe_chars=args.dedupe_chars,
+                                tessellate=args.tessellate,
+                                oam_sizes=oam_sizes,
+                                dma_schedule=args.dma_schedule,
+                                dma_budget=args.dma_budget,
+                                delta_frames=args.delta_frames,
+                                keyframe_interval=args.keyframe_interval,
+                                oam_table=args.oam_table,
+                                format=args.format,
+                                profile=bool(args.profile),
+                                cprofile_dir=args.cprofile or "")
+
+    if args.all:
+        sprite_dirs = discover_sprites(Path(args.all).resolve())
+    else:
+        sprite_dirs = [Path(path).resolve() for path in args.input]
+
+    # Resolve the bank of every sprite before starting any work
+    jobs = []
+    for sprite_dir in sprite_dirs:
+        bank = args.bank
+        if bank is None:
+            bank = read_sprite_bank(sprite_dir)
+        if bank is None:
+            parser.error(f"No bank for {sprite_dir}, pass -b/--bank")
+        jobs.append((sprite_dir, bank))
+
+    # A single sprite keeps the original behavior of raising on failure
+    if len(jobs) == 1:
+        results = [convert(*jobs[0], options)]
+        write_profile(results, args.profile)
+        return 0
+
+    start = time.perf_counter()
+    results = convert_batch(jobs, args.jobs, args.logmode, options)
+    elapsed = time.perf_counter() - start
+    write_profile(results, args.profile)
+
+    logger_build.info("Converted %d sprites in %.1f ms",
+        len(results), elapsed * 1000)
+    for result in results:
+        if result.ok:
+            logger_build.info("\t%-16s ok     %6d bytes %8.1f ms",
+                result.name, result.num_bytes, result.elapsed * 1000)
+        else:
+            logger_build.error("\t%-16s failed %s", result.name, result.error)
+
+    return 1 if any(not result.ok for result in results) else 0
 
 
 if __name__ == '__main__':
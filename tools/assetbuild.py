@@ -0,0 +1,496 @@
+"""
+Incremental asset build driver for the sprite and map converters.
+
+What this script does
+=====================
+Instead of running every converter by hand, this script walks the resources
+directory and rebuilds only the generated files whose inputs changed:
+
+    resources/sprites/{name}/        -> {name}.sprite, {name}.i
+    resources/maps/{name}.tmx        -> {name}.bin
+
+For every asset the set of inputs is hashed:
+
+    Sprites: {name}.json, {name}.bin, {name}.pal, asesprite2bin.py
+    Maps:    {name}.tmx, any referenced .tsx tileset, the tileset image and
+             the .bin/.pal sheet next to it, tiled2bin.py and tmxreader.py
+
+A sheet without its .bin/.pal is encoded from the .png by the converters
+(see pngsheet.py), in which case the .png is hashed instead.
+
+The digests are stored in a cache file (build/.assetcache.json by default).
+When the digest of an asset matches the cache and all outputs still exist,
+the asset is skipped without importing any of the converters. File digests
+are themselves cached by (size, mtime) so a no-op rebuild only stats files.
+
+Watch mode
+==========
+With --watch the script keeps running after the first build and polls the
+resources directory every --interval seconds. A save rebuilds the assets
+whose inputs changed within the same process, so the converters are only
+imported once and the parsed JSON exports, palettes and sheets of every other
+asset stay in memory (see warmcache.py). A change to a converter reloads it.
+An asset that is skipped for missing inputs or an unknown bank is reported
+once, and again only after one of its inputs changes.
+
+With --assemble every rebuild that produced new outputs is followed by the
+wla-65816 and wlalink steps of build.sh.
+
+Sprite banks
+============
+The bank of a sprite is read back from the `Sprite_{Name}@Bank` define in the
+previously generated {name}.i file. Use `--bank name=N` to override it or to
+set it for a new sprite.
+
+Usage
+=====
+    python tools/assetbuild.py                 # Rebuild what changed
+    python tools/assetbuild.py --force         # Rebuild everything
+    python tools/assetbuild.py --dry-run       # Show what would be rebuilt
+    python tools/assetbuild.py --bank boss=4   # Set the bank of a sprite
+    python tools/assetbuild.py --watch --assemble
+"""
+import hashlib
+import json
+import logging
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from assetinspect import read_sprite_bank
+
+
+logger = logging.getLogger('assetbuild')
+
+TOOLS_DIR = Path(__file__).resolve().parent
+"""Directory containing the converters."""
+
+ROOT_DIR = TOOLS_DIR.parent
+"""Root of the repository."""
+
+CACHE_VERSION = 1
+"""Bump to invalidate every existing cache file."""
+
+SPRITE_CONVERTER = [TOOLS_DIR / 'asesprite2bin.py', TOOLS_DIR / 'snesgfx.py',
+                    TOOLS_DIR / 'snespal.py', TOOLS_DIR / 'profiling.py',
+                    TOOLS_DIR / 'warmcache.py', TOOLS_DIR / 'pngsheet.py',
+                    TOOLS_DIR / 'assetinspect.py']
+"""Source files that make up the sprite converter version."""
+
+MAP_CONVERTER = [TOOLS_DIR / 'tiled2bin.py', TOOLS_DIR / 'snesgfx.py',
+                 TOOLS_DIR / 'snespal.py', TOOLS_DIR / 'profiling.py',
+                 TOOLS_DIR / 'warmcache.py', TOOLS_DIR / 'tmxreader.py',
+                 TOOLS_DIR / 'pngsheet.py']
+"""Source files that make up the map converter version."""
+
+CONVERTER_MODULES = ['snesgfx', 'snespal', 'warmcache', 'profiling', 'tmxreader',
+                     'pngsheet', 'assetinspect', 'asesprite2bin', 'tiled2bin']
+"""Converter modules in import order, reloaded when their source changes."""
+
+BUILD_SCRIPT = ROOT_DIR / 'build.sh'
+"""Assembles and links the ROM, run by --assemble."""
+
+class FileDigests:
+    """
+    Content digests of files, memoized by (size, mtime) so that unchanged
+    files are never read twice across builds.
+    """
+
+    def __init__(self, entries: Optional[dict] = None):
+        self.entries = entries or {}
+
+    def digest(self, path: Path) -> str:
+        """
+        :param path: File to digest.
+        :return: Hex SHA-1 of the file contents.
+        """
+        stat = path.stat()
+        key = str(path)
+        entry = self.entries.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+
+@dataclass
+class AssetJob:
+    """
+    A single converter invocation and the files it reads and writes.
+    """
+    kind: str                   # "sprite" or "map"
+    name: str                   # Name of the asset (directory or map stem)
+    source: Path                # Sprite directory or .tmx file
+    converter: List[Path]       # Converter source files (the version)
+    inputs: List[Path] = field(default_factory=list)
+    outputs: List[Path] = field(default_factory=list)
+    missing: List[Path] = field(default_factory=list)
+    bank: Optional[int] = None  # Only used by sprites
+
+    @property
+    def key(self) -> str:
+        return f'{self.kind}:{self.name}'
+
+    def hash_inputs(self, digests: FileDigests) -> str:
+        """
+        :param digests: Memoized file digests.
+        :return: Digest of all inputs, the converter and the build options.
+        """
+        h = hashlib.sha1()
+        h.update(f'{CACHE_VERSION}:{self.kind}:{self.bank}'.encode('ascii'))
+        for path in sorted(set(self.converter)) + sorted(set(self.inputs)):
+            h.update(path.as_posix().encode('utf-8'))
+            h.update(digests.digest(path).encode('ascii'))
+        return h.hexdigest()
+
+    def run(self) -> None:
+        """
+        Invoke the converter. The converters are only imported here so
+        that an up to date build never pays their import cost.
+        """
+        if self.kind == 'sprite':
+            import asesprite2bin
+            status = asesprite2bin.main(['-i', str(self.source),
+                                         '-b', str(self.bank)])
+        else:
+            import tiled2bin
+            status = tiled2bin.main([str(self.source), str(self.outputs[0])])
+        if status:
+            raise RuntimeError(f'{self.key} exited with status {status}')
+
+
+def tileset_inputs(tmx_path: Path) -> List[Path]:
+    """
+    Finds the files a Tiled map depends on: external tilesets, their images
+    and the .bin/.pal sheet that tiled2bin reads next to the tileset image.
+    :param tmx_path: Path to the .tmx file.
+    :return: List of dependent paths (which may not exist).
+    """
+    paths = []
+    base = tmx_path.parent
+    for tileset in ET.parse(tmx_path).getroot().iter('tileset'):
+        # Images of external tilesets are relative to the .tsx file
+        source = tileset.get('source')
+        if source:
+            tsx_path = (base / source).resolve()
+            paths.append(tsx_path)
+            if not tsx_path.is_file():
+                continue
+            image = ET.parse(tsx_path).getroot().find('image')
+            image_base = tsx_path.parent
+        else:
+            image = tileset.find('image')
+            image_base = base
+        if image is None:
+            continue
+        image_path = (image_base / image.get('source')).resolve()
+        paths.append(image_path)
+
+        # tiled2bin reads the converted sheet next to the tileset image
+        paths.append(image_path.with_suffix('.bin'))
+        paths.append(image_path.with_suffix('.pal'))
+    return paths
+
+
+def discover(root: Path, banks: Dict[str, int]) -> List[AssetJob]:
+    """
+    Walks the resources directory and creates a job for every asset.
+    :param root: The resources directory.
+    :param banks: Explicit sprite banks that override the .i files.
+    :return: List of jobs.
+    """
+    jobs = []
+
+    for sprite_dir in sorted((root / 'sprites').iterdir()):
+        json_path = sprite_dir / f'{sprite_dir.name}.json'
+        if not json_path.is_file():
+            continue
+        name = sprite_dir.name
+        job = AssetJob('sprite', name, sprite_dir.resolve(), SPRITE_CONVERTER)
+        job.bank = banks.get(name, read_sprite_bank(sprite_dir))
+        required = [json_path] + [sprite_dir / f'{name}{ext}' for ext in ('.bin', '.pal')]
+        image = sprite_dir / f'{name}.png'
+        if image.is_file() and not all(p.is_file() for p in required):
+            # asesprite2bin encodes the sheet itself when it was not exported
+            required = [p for p in required if p.is_file()] + [image]
+        job.inputs = [p.resolve() for p in required if p.is_file()]
+        job.missing = [p for p in required if not p.is_file()]
+        job.outputs = [(sprite_dir / f'{name}{ext}').resolve() for ext in ('.sprite', '.i')]
+        jobs.append(job)
+
+    for tmx_path in sorted((root / 'maps').glob('*.tmx')):
+        tmx_path = tmx_path.resolve()
+        job = AssetJob('map', tmx_path.stem, tmx_path, MAP_CONVERTER)
+        deps = tileset_inputs(tmx_path)
+        job.inputs = [tmx_path] + [p for p in deps if p.is_file()]
+        job.missing = [p for p in deps if not p.is_file() and p.suffix in ('.bin', '.pal')
+                       and not p.with_suffix('.png').is_file()]
+        job.outputs = [tmx_path.with_suffix('.bin')]
+        jobs.append(job)
+
+    return jobs
+
+
+def load_cache(path: Path) -> dict:
+    """
+    :param path: Path to the cache file.
+    :return: The cache contents or an empty cache.
+    """
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {'version': CACHE_VERSION, 'files': {}, 'assets': {}}
+    if cache.get('version') != CACHE_VERSION:
+        return {'version': CACHE_VERSION, 'files': {}, 'assets': {}}
+    return cache
+
+
+def save_cache(path: Path, cache: dict) -> None:
+    """
+    :param path: Path to the cache file.
+    :param cache: The cache contents.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    tmp_path.replace(path)
+
+
+def build(jobs: List[AssetJob], cache: dict, force: bool = False,
+          dry_run: bool = False, warned: Optional[Set[str]] = None) -> Dict[str, List[str]]:
+    """
+    Runs every job whose inputs changed since the last build.
+    :param jobs: Jobs from discover().
+    :param cache: Cache from load_cache(), updated in place.
+    :param force: Rebuild every asset regardless of the cache.
+    :param dry_run: Only report what would be rebuilt.
+    :param warned: Keys of the skipped assets that were already reported,
+        updated in place. Their skips are not reported again.
+    :return: Asset keys grouped by "built", "skipped", "failed", "up-to-date".
+    """
+    digests = FileDigests(cache['files'])
+    assets = cache['assets']
+    result = {'built': [], 'skipped': [], 'failed': [], 'up-to-date': []}
+    warned = set() if warned is None else warned
+
+    for job in jobs:
+        reason = None
+        if job.missing:
+            reason = 'missing ' + ', '.join(str(p) for p in job.missing)
+        elif job.kind == 'sprite' and job.bank is None:
+            reason = f'unknown bank (use --bank {job.name}=N)'
+        if reason:
+            if job.key not in warned:
+                logger.warning('Skipping %s, %s', job.key, reason)
+            warned.add(job.key)
+            result['skipped'].append(job.key)
+            continue
+        warned.discard(job.key)
+
+        digest = job.hash_inputs(digests)
+        outputs_exist = all(p.is_file() for p in job.outputs)
+        if not force and outputs_exist and assets.get(job.key) == digest:
+            result['up-to-date'].append(job.key)
+            continue
+
+        if dry_run:
+            logger.info('Would rebuild %s', job.key)
+            result['built'].append(job.key)
+            continue
+
+        logger.info('Rebuilding %s', job.key)
+        start = time.perf_counter()
+        try:
+            job.run()
+        except Exception:
+            logger.exception('Failed to build %s', job.key)
+            assets.pop(job.key, None)
+            result['failed'].append(job.key)
+            continue
+        logger.info('Rebuilt %s in %.1f ms', job.key,
+                    (time.perf_counter() - start) * 1000)
+        assets[job.key] = digest
+        result['built'].append(job.key)
+
+    return result
+
+
+def snapshot(root: Path) -> Dict[Path, Tuple[int, int]]:
+    """
+    :param root: The resources directory.
+    :return: (size, mtime) of every file below root and of the converters.
+    """
+    paths = [p for p in root.rglob('*') if p.is_file()]
+    paths += set(SPRITE_CONVERTER + MAP_CONVERTER)
+    stats = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        stats[path.resolve()] = (stat.st_size, stat.st_mtime_ns)
+    return stats
+
+
+def changed_files(before: Dict[Path, Tuple[int, int]],
+                  after: Dict[Path, Tuple[int, int]]) -> Set[Path]:
+    """
+    :return: Paths that were added, removed or modified between snapshots.
+    """
+    return {path for path in before.keys() | after.keys()
+            if before.get(path) != after.get(path)}
+
+
+def reload_converters() -> None:
+    """
+    Reloads the converter modules that were already imported, so that the
+    next build runs the changed source.
+    """
+    import importlib
+
+    for name in CONVERTER_MODULES:
+        if name in sys.modules:
+            logger.info('Reloading %s', name)
+            importlib.reload(sys.modules[name])
+
+
+def assemble() -> bool:
+    """
+    Runs build.sh to assemble and link the ROM.
+    :return: Whether the ROM was built.
+    """
+    import shutil
+    import subprocess
+
+    missing = [tool for tool in ('wla-65816', 'wlalink') if shutil.which(tool) is None]
+    if missing:
+        logger.warning('Not assembling, %s not found', ', '.join(missing))
+        return False
+    start = time.perf_counter()
+    status = subprocess.run(['bash', str(BUILD_SCRIPT)], cwd=ROOT_DIR).returncode
+    if status:
+        logger.error('%s exited with status %d', BUILD_SCRIPT.name, status)
+        return False
+    logger.info('Assembled in %.1f ms', (time.perf_counter() - start) * 1000)
+    return True
+
+
+def watch(root: Path, cache_path: Path, banks: Dict[str, int],
+          interval: float = 0.25, run_assembler: bool = False) -> int:
+    """
+    Rebuilds the assets whose inputs change until interrupted.
+    :param root: The resources directory.
+    :param cache_path: Path to the cache file.
+    :param banks: Explicit sprite banks that override the .i files.
+    :param interval: Seconds between polls of the resources directory.
+    :param run_assembler: Run build.sh after every rebuild with new outputs.
+    :return: Exit status.
+    """
+    cache = load_cache(cache_path)
+    converters = {path.resolve() for path in SPRITE_CONVERTER + MAP_CONVERTER}
+    outputs = set()
+    warned = set()
+    before = None
+    logger.info('Watching %s, press Ctrl+C to stop', root)
+
+    try:
+        while True:
+            after = snapshot(root)
+            if before is None:
+                changed = set(after)
+            else:
+                changed = changed_files(before, after) - outputs
+                if changed & converters:
+                    reload_converters()
+            before = after
+
+            if changed:
+                start = time.perf_counter()
+                jobs = discover(root, banks)
+                # A skipped asset is reported again once its inputs change
+                for job in jobs:
+                    if changed & {path.resolve() for path in job.inputs + job.missing}:
+                        warned.discard(job.key)
+                result = build(jobs, cache, warned=warned)
+                save_cache(cache_path, cache)
+                if result['built'] or result['failed']:
+                    logger.info('%d rebuilt, %d failed (%.1f ms)', len(result['built']),
+                                len(result['failed']), (time.perf_counter() - start) * 1000)
+                if run_assembler and result['built']:
+                    assemble()
+
+                # Outputs written by the build are not changes to react to
+                outputs = {path for job in jobs for path in job.outputs}
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Incremental asset build for sprites and maps",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python assetbuild.py --bank boss=4")
+    parser.add_argument("-r", "--resources", type=str,
+                        default=str(ROOT_DIR / "resources"))
+    parser.add_argument("-c", "--cache", type=str,
+                        default=str(ROOT_DIR / "build" / ".assetcache.json"))
+    parser.add_argument("-b", "--bank", action="append", default=[],
+                        help="Sprite bank override as name=N")
+    parser.add_argument("-f", "--force", action="store_true")
+    parser.add_argument("-n", "--dry-run", action="store_true")
+    parser.add_argument("-w", "--watch", action="store_true",
+                        help="Keep rebuilding the assets whose inputs change")
+    parser.add_argument("--interval", type=float, default=0.25,
+                        help="Seconds between polls of the resources in --watch")
+    parser.add_argument("--assemble", action="store_true",
+                        help="Run build.sh after every --watch rebuild")
+    parser.add_argument("-l", "--loglevel", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.loglevel)
+
+    banks = {}
+    for bank in args.bank:
+        if '=' not in bank:
+            raise ValueError(f"Invalid bank: {bank}. Expected format: <name>=<bank>.")
+        name, value = bank.split('=', 1)
+        banks[name] = int(value)
+
+    # The converters resolve their own sibling imports
+    sys.path.insert(0, str(TOOLS_DIR))
+
+    if args.watch:
+        return watch(Path(args.resources).resolve(), Path(args.cache).resolve(),
+                     banks, args.interval, args.assemble)
+
+    start = time.perf_counter()
+    cache_path = Path(args.cache).resolve()
+    cache = load_cache(cache_path)
+    jobs = discover(Path(args.resources).resolve(), banks)
+    result = build(jobs, cache, force=args.force, dry_run=args.dry_run)
+    if not args.dry_run:
+        save_cache(cache_path, cache)
+
+    logger.info('%d assets: %d rebuilt, %d up to date, %d skipped, %d failed (%.1f ms)',
+                len(jobs), len(result['built']), len(result['up-to-date']),
+                len(result['skipped']), len(result['failed']),
+                (time.perf_counter() - start) * 1000)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,721 @@
+"""
+Zero-copy reader and inspector for converted sprites and maps.
+
+What this script reads
+======================
+    {name}.sprite   Written by asesprite2bin, in the debug or release format
+    {name}.bin      Map written by tiled2bin (resources/maps)
+
+The readers wrap the file in a memoryview and decode records with
+struct.unpack_from on demand. Payloads such as the palette, the sheet and the
+tilemaps are returned as memoryview slices of the file, nothing is copied.
+Every record is checked while it is read: its magic (debug format only), that
+it lies inside the file, and that the offsets of the sections line up. Any
+problem raises a ValueError naming the offset.
+
+    sprite = SpriteView(Path('plane.sprite').read_bytes())
+    for tag in sprite.tags:
+        for frame in tag.frames:
+            for layer in frame.layers:
+                layer.tiles        # [(name, size and flips, rx, ry), ...]
+
+Output
+======
+For every file the offset tree is printed, down to --depth levels:
+
+    plane.sprite                       8483 bytes  debug
+      $0000  header                        25  plane
+      $0019  palette                      512  256 colors
+      $0219  sheet                       6656  208 characters
+      $1C19  tag metadata                  25  5 tags
+      $1C32  tag Forward                   55  1 frames, 2 objects
+        $1C42  frame 0                     39  1 layers
+      ...
+
+Tag names are read from the {name}.i file next to the sprite when it exists.
+The script exits with status 1 when any file fails to validate.
+
+Usage
+=====
+    python tools/assetinspect.py resources/sprites/plane/plane.sprite
+    python tools/assetinspect.py -a resources --depth 1
+    python tools/assetinspect.py resources/maps/Skyscraper.bin --depth 3
+"""
+import logging
+import re
+import struct
+import sys
+import time
+
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger('assetinspect')
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+"""Root of the repository."""
+
+RECORDS = {
+    # Magic: (debug layout without the magic, release layout)
+    b'TMD': ('H', 'H'),
+    b'TAG': ('BBBHBH', 'BBB'),
+    b'FMD': ('H', 'H'),
+    b'FRM': ('BBHBH', 'B'),
+    b'FRD': ('BBHBH', 'B'),
+    b'FLM': ('BH', 'H'),
+    b'LYR': ('BBBBH', 'BBBB'),
+    b'LYD': ('BBBBB', 'BBBBB'),
+    b'TIL': ('BBBB', 'BBBB'),
+    b'TID': ('BBBBB', 'BBBBB'),
+    b'DMS': ('BHH', 'BHH'),
+    b'DFR': ('BH', 'BH'),
+    b'RUN': ('HHH', 'HHH'),
+}
+"""Sprite records, see the record classes in asesprite2bin."""
+
+DEBUG_RECORDS = {magic: struct.Struct('<3s' + debug) for magic, (debug, _) in RECORDS.items()}
+RELEASE_RECORDS = {magic: struct.Struct('<' + release) for magic, (_, release) in RECORDS.items()}
+
+SPRITE_HEADER = struct.Struct('<3s8sHHHHBHBH')
+"""Header of a debug .sprite file, see SpriteHeader in asesprite2bin."""
+
+SPRITE_RELEASE_HEADER = struct.Struct('<3sB8sHHB')
+"""Header of a release .sprite file."""
+
+SPRITE_RELEASE_VERSION = 1
+"""Release format version this reader understands."""
+
+FRAME_RELEASE_DELTA = 0x80
+"""Bit of the release frame byte set for delta frames."""
+
+MAP_HEADER = struct.Struct('<3sB16sBBBBBBHHHH')
+"""Header of a map .bin file, see Map in tiled2bin."""
+
+BACKGROUND_HEADER = struct.Struct('<HH')
+MAP_TILE = struct.Struct('<HH')
+METATILE_HEADER = struct.Struct('<3sBBH')
+SHEET_HEADER = struct.Struct('<3sBHBBBB')
+PALETTE_HEADER = struct.Struct('<3sBH')
+
+BACKGROUND_DENSE = 0x0100
+BACKGROUND_METATILE = 0x0200
+"""Flags in the high byte of the background id, see Background in tiled2bin."""
+
+
+def check_span(data: memoryview, offset: int, size: int, what: str) -> None:
+    """
+    :raise ValueError: When size bytes at offset are not inside data.
+    """
+    if offset < 0 or offset + size > len(data):
+        raise ValueError(f'{what} at ${offset:04X} ({size} bytes) is past the '
+                         f'end of the file (${len(data):04X})')
+
+
+def read_record(data: memoryview, offset: int, magic: bytes,
+                release: bool) -> Tuple[tuple, int]:
+    """
+    Reads the fixed part of a sprite record.
+    :param magic: Magic of the record, checked in the debug format.
+    :return: (values without the magic, offset just past the record)
+    """
+    layout = RELEASE_RECORDS[magic] if release else DEBUG_RECORDS[magic]
+    check_span(data, offset, layout.size, magic.decode())
+    values = layout.unpack_from(data, offset)
+    if release:
+        return values, offset + layout.size
+    if values[0] != magic:
+        raise ValueError(f'Expected {magic.decode()} at ${offset:04X}, found {values[0]!r}')
+    return values[1:], offset + layout.size
+
+
+def read_records(data: memoryview, offset: int, count: int, magic: bytes,
+                 release: bool) -> Tuple[List[tuple], int]:
+    """
+    Reads an array of fixed size sprite records.
+    :return: (list of values without the magic, offset just past the array)
+    """
+    layout = RELEASE_RECORDS[magic] if release else DEBUG_RECORDS[magic]
+    size = layout.size * count
+    check_span(data, offset, size, f'{count} {magic.decode()}')
+    values = list(layout.iter_unpack(data[offset:offset + size]))
+    if release:
+        return values, offset + size
+    for i, value in enumerate(values):
+        if value[0] != magic:
+            raise ValueError(f'Expected {magic.decode()} at ${offset + i * layout.size:04X}, '
+                             f'found {value[0]!r}')
+    return [value[1:] for value in values], offset + size
+
+
+@dataclass
+class Section:
+    """
+    A range of a file shown in the offset tree.
+    """
+    name: str
+    offset: int
+    size: int
+    info: str = ''
+    children: List['Section'] = field(default_factory=list)
+
+    def lines(self, depth: int, indent: int = 1) -> List[str]:
+        """
+        :param depth: Number of levels below this one to include.
+        :return: Lines of the tree, one per section.
+        """
+        lines = [f'{"  " * indent}${self.offset:04X}  {self.name.ljust(28 - 2 * indent)}'
+                 f'{self.size:6d}  {self.info}'.rstrip()]
+        if depth > 0:
+            for child in self.children:
+                lines.extend(child.lines(depth - 1, indent + 1))
+        return lines
+
+
+class LayerView:
+    """
+    A layer of a frame with its tiles. In a delta frame the tiles are
+    (index, name, size and flips, rx, ry) of the changed tiles only.
+    """
+
+    def __init__(self, data: memoryview, offset: int, release: bool, delta: bool):
+        self.data = data
+        self.offset = offset
+        self.release = release
+        self.delta = delta
+        if delta:
+            values, self.tile_offset = read_record(data, offset, b'LYD', release)
+            self.layer_id, self.rx, self.ry, self.num_tiles, self.num_changed = values
+        else:
+            values, self.tile_offset = read_record(data, offset, b'LYR', release)
+            self.layer_id, self.rx, self.ry, self.num_tiles = values[:4]
+            if not release:
+                self.tile_offset += values[4]
+            self.num_changed = self.num_tiles
+
+    @cached_property
+    def _tiles(self) -> Tuple[List[tuple], int]:
+        magic = b'TID' if self.delta else b'TIL'
+        return read_records(self.data, self.tile_offset, self.num_changed, magic, self.release)
+
+    @property
+    def tiles(self) -> List[tuple]:
+        return self._tiles[0]
+
+    @property
+    def end(self) -> int:
+        return self._tiles[1]
+
+    def section(self, index: int) -> Section:
+        kind = 'changed tiles' if self.delta else 'tiles'
+        return Section(f'layer {index}', self.offset, self.end - self.offset,
+                       f'id {self.layer_id} at ({self.rx}, {self.ry}), '
+                       f'{self.num_changed} {kind}')
+
+
+class FrameView:
+    """
+    A frame of a tag, either complete or the delta to the frame before it.
+    """
+
+    def __init__(self, data: memoryview, offset: int, release: bool):
+        self.data = data
+        self.offset = offset
+        self.release = release
+        if release:
+            (flags,), self.metadata_offset = read_record(data, offset, b'FRM', release)
+            self.keyframe = not (flags & FRAME_RELEASE_DELTA)
+            self.num_layers = self.num_metadata = flags & ~FRAME_RELEASE_DELTA
+            self.layer_offset = self.metadata_offset + RELEASE_RECORDS[b'FLM'].size * self.num_layers
+        else:
+            check_span(data, offset, 3, 'FRM')
+            self.keyframe = bytes(data[offset:offset + 3]) != b'FRD'
+            values, start = read_record(data, offset, b'FRM' if self.keyframe else b'FRD', release)
+            self.num_layers, self.num_metadata, metadata_offset, _, layer_offset = values
+            self.metadata_offset = start + metadata_offset
+            self.layer_offset = start + layer_offset
+
+    @cached_property
+    def layers(self) -> List[LayerView]:
+        metadata, _ = read_records(self.data, self.metadata_offset, self.num_metadata,
+                                   b'FLM', self.release)
+        return [LayerView(self.data, self.layer_offset + values[-1], self.release,
+                          not self.keyframe)
+                for values in metadata]
+
+    @property
+    def end(self) -> int:
+        return max([self.layer_offset] + [layer.end for layer in self.layers])
+
+    def section(self, index: int) -> Section:
+        kind = 'frame' if self.keyframe else 'delta frame'
+        return Section(f'{kind} {index}', self.offset, self.end - self.offset,
+                       f'{len(self.layers)} layers',
+                       [layer.section(i) for i, layer in enumerate(self.layers)])
+
+
+class TagView:
+    """
+    A tag (animation) of a sprite and its frames.
+    """
+
+    def __init__(self, data: memoryview, offset: int, release: bool, name: str = ''):
+        self.data = data
+        self.offset = offset
+        self.release = release
+        self.name = name
+        values, start = read_record(data, offset, b'TAG', release)
+        if release:
+            self.direction, self.oam_count, self.num_frames = values
+            self.num_metadata = self.num_frames
+            self.metadata_offset = start
+            self.frame_offset = start + RELEASE_RECORDS[b'FMD'].size * self.num_frames
+        else:
+            (self.direction, self.oam_count, self.num_metadata, metadata_offset,
+             self.num_frames, frame_offset) = values
+            self.metadata_offset = start + metadata_offset
+            self.frame_offset = start + frame_offset
+
+    @cached_property
+    def frames(self) -> List[FrameView]:
+        metadata, _ = read_records(self.data, self.metadata_offset, self.num_metadata,
+                                   b'FMD', self.release)
+        return [FrameView(self.data, self.frame_offset + offset, self.release)
+                for offset, in metadata]
+
+    @property
+    def end(self) -> int:
+        return max([self.frame_offset] + [frame.end for frame in self.frames])
+
+    def section(self, index: int) -> Section:
+        return Section(f'tag {self.name or index}', self.offset, self.end - self.offset,
+                       f'{self.num_frames} frames, {self.oam_count} objects',
+                       [frame.section(i) for i, frame in enumerate(self.frames)])
+
+
+class DmaScheduleView:
+    """
+    Per frame character uploads appended after the tags.
+    """
+
+    def __init__(self, data: memoryview, offset: int, release: bool):
+        self.data = data
+        self.offset = offset
+        self.release = release
+        values, self.table_offset = read_record(data, offset, b'DMS', release)
+        self.num_tags, self.num_frames, self.slot_words = values
+        check_span(data, self.table_offset, 2 * (self.num_tags + self.num_frames), 'DMS table')
+
+    @cached_property
+    def tag_frames(self) -> Tuple[int, ...]:
+        return struct.unpack_from(f'<{self.num_tags}H', self.data, self.table_offset)
+
+    @cached_property
+    def frames(self) -> List[List[tuple]]:
+        """
+        :return: (source, dest, size) runs of every frame.
+        """
+        frames = []
+        table = self.table_offset + 2 * self.num_tags
+        for offset in struct.unpack_from(f'<{self.num_frames}H', self.data, table):
+            (num_runs, cost), start = read_record(self.data, self.offset + offset, b'DFR',
+                                                  self.release)
+            runs, _ = read_records(self.data, start, num_runs, b'RUN', self.release)
+            if sum(run[2] for run in runs) != cost:
+                raise ValueError(f'DFR at ${self.offset + offset:04X} costs {cost} bytes, '
+                                 f'its runs add up to {sum(run[2] for run in runs)}')
+            frames.append(runs)
+        return frames
+
+    @property
+    def end(self) -> int:
+        end = self.table_offset + 2 * (self.num_tags + self.num_frames)
+        run_size = (RELEASE_RECORDS if self.release else DEBUG_RECORDS)[b'RUN'].size
+        frame_size = (RELEASE_RECORDS if self.release else DEBUG_RECORDS)[b'DFR'].size
+        table = self.table_offset + 2 * self.num_tags
+        offsets = struct.unpack_from(f'<{self.num_frames}H', self.data, table)
+        for offset, runs in zip(offsets, self.frames):
+            end = max(end, self.offset + offset + frame_size + run_size * len(runs))
+        return end
+
+    def section(self) -> Section:
+        cost = max((sum(run[2] for run in runs) for runs in self.frames), default=0)
+        return Section('dma schedule', self.offset, self.end - self.offset,
+                       f'{self.num_frames} frames, {self.slot_words} slot words, '
+                       f'{cost} bytes at most')
+
+
+class SpriteView:
+    """
+    A .sprite file in the debug or release format.
+    """
+
+    def __init__(self, data: bytes, tag_names: Optional[Dict[int, str]] = None):
+        """
+        :param data: Contents of the file, wrapped without copying.
+        :param tag_names: Tag names by tag offset, see read_tag_names().
+        """
+        self.data = memoryview(data)
+        self.tag_names = tag_names or {}
+        magic = bytes(self.data[:3])
+        if magic == b'SPC':
+            check_span(self.data, 0, SPRITE_RELEASE_HEADER.size, 'SPC')
+            (_, version, name, self.pal_count, self.sheet_count,
+             self.num_tags) = SPRITE_RELEASE_HEADER.unpack_from(self.data, 0)
+            if version != SPRITE_RELEASE_VERSION:
+                raise ValueError(f'Unsupported release format version {version}')
+            self.release = True
+            self.start = SPRITE_RELEASE_HEADER.size
+            self.pal_offset = 0
+            self.sheet_offset = 2 * self.pal_count
+            self.num_metadata = self.num_tags
+            self.metadata_offset = self.sheet_offset + 2 * self.sheet_count
+            self.tag_offset = self.metadata_offset + RELEASE_RECORDS[b'TMD'].size * self.num_tags
+        elif magic == b'SPR':
+            check_span(self.data, 0, SPRITE_HEADER.size, 'SPR')
+            (_, name, self.pal_count, self.pal_offset, self.sheet_count,
+             self.sheet_offset, self.num_metadata, self.metadata_offset,
+             self.num_tags, self.tag_offset) = SPRITE_HEADER.unpack_from(self.data, 0)
+            self.release = False
+            self.start = SPRITE_HEADER.size
+        else:
+            raise ValueError(f'Not a sprite, found {magic!r}')
+        self.name = bytes(name).rstrip(b'\0').decode('ascii', 'replace')
+
+        # Sections follow each other in the order of the header
+        expected = [(self.pal_offset, 0, 'palette'),
+                    (self.sheet_offset, self.pal_offset + 2 * self.pal_count, 'sheet'),
+                    (self.metadata_offset, self.sheet_offset + 2 * self.sheet_count, 'tag metadata')]
+        for offset, follows, what in expected:
+            if offset != follows:
+                raise ValueError(f'The {what} is at ${offset:04X}, expected ${follows:04X}')
+        check_span(self.data, self.start + self.metadata_offset, 0, 'Tag metadata')
+
+    @property
+    def palette(self) -> memoryview:
+        start = self.start + self.pal_offset
+        return self.data[start:start + 2 * self.pal_count]
+
+    @property
+    def sheet(self) -> memoryview:
+        start = self.start + self.sheet_offset
+        return self.data[start:start + 2 * self.sheet_count]
+
+    @cached_property
+    def tags(self) -> List[TagView]:
+        metadata, _ = read_records(self.data, self.start + self.metadata_offset,
+                                   self.num_metadata, b'TMD', self.release)
+        return [TagView(self.data, self.start + self.tag_offset + offset, self.release,
+                        self.tag_names.get(self.tag_offset + offset, ''))
+                for offset, in metadata]
+
+    @property
+    def tags_end(self) -> int:
+        return max([self.start + self.tag_offset] + [tag.end for tag in self.tags])
+
+    @cached_property
+    def dma_schedule(self) -> Optional[DmaScheduleView]:
+        end = self.tags_end
+        if end == len(self.data):
+            return None
+        return DmaScheduleView(self.data, end, self.release)
+
+    def validate(self) -> None:
+        """
+        Reads every record once.
+        :raise ValueError: When a record is broken or bytes are left over.
+        """
+        self.sections()
+
+    def sections(self) -> List[Section]:
+        """
+        :return: The sections of the file, validated down to every tile.
+        """
+        header_size = self.start
+        metadata_size = (RELEASE_RECORDS if self.release else DEBUG_RECORDS)[b'TMD'].size
+        sections = [
+            Section('header', 0, header_size, self.name),
+            Section('palette', self.start + self.pal_offset, len(self.palette),
+                    f'{self.pal_count} colors'),
+            Section('sheet', self.start + self.sheet_offset, len(self.sheet),
+                    f'{len(self.sheet) // 32} characters'),
+            Section('tag metadata', self.start + self.metadata_offset,
+                    metadata_size * self.num_metadata, f'{self.num_metadata} tags'),
+        ]
+        sections.extend(tag.section(i) for i, tag in enumerate(self.tags))
+        end = self.tags_end
+        if self.dma_schedule:
+            sections.append(self.dma_schedule.section())
+            end = self.dma_schedule.end
+        if end != len(self.data):
+            raise ValueError(f'{len(self.data) - end} bytes after ${end:04X} are not referenced')
+        return sections
+
+
+class BackgroundView:
+    """
+    A background layer of a map: sparse tiles, a dense tilemap or a grid of
+    metatile indices.
+    """
+
+    def __init__(self, data: memoryview, offset: int, index_bytes: int = 0):
+        check_span(data, offset, BACKGROUND_HEADER.size, 'Background')
+        self.offset = offset
+        self.id, self.num_tiles = BACKGROUND_HEADER.unpack_from(data, offset)
+        if self.id & BACKGROUND_DENSE:
+            self.kind, item_size = 'dense', 2
+        elif self.id & BACKGROUND_METATILE:
+            self.kind, item_size = 'metatile', index_bytes
+        else:
+            self.kind, item_size = 'sparse', MAP_TILE.size
+        start = offset + BACKGROUND_HEADER.size
+        self.end = start + item_size * self.num_tiles
+        check_span(data, start, self.end - start, f'Background {self.id & 0xFF}')
+        self.payload = data[start:self.end]
+
+    @property
+    def tiles(self) -> List[Tuple[int, int]]:
+        """
+        :return: (tile id, tilemap index) of a sparse background.
+        """
+        return list(MAP_TILE.iter_unpack(self.payload))
+
+    def section(self) -> Section:
+        return Section(f'BG{self.id & 0xFF}', self.offset, self.end - self.offset,
+                       f'{self.kind}, {self.num_tiles} tiles')
+
+
+class MapView:
+    """
+    A map .bin file written by tiled2bin.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        check_span(self.data, 0, MAP_HEADER.size, 'TMX')
+        (magic, self.version, name, self.num_backgrounds, self.num_objects,
+         self.tile_width, self.tile_height, self.height, self.width,
+         self.background_offset, self.sheet_offset, self.palette_offset,
+         self.object_offset) = MAP_HEADER.unpack_from(self.data, 0)
+        if magic != b'TMX':
+            raise ValueError(f'Not a map, found {magic!r}')
+        self.name = bytes(name).rstrip(b'\0').decode('ascii', 'replace')
+
+    @cached_property
+    def backgrounds(self) -> List[BackgroundView]:
+        # Metatile grids need the index size from the dictionary that follows them
+        for index_bytes in (1, 2):
+            backgrounds = []
+            offset = self.background_offset
+            for _ in range(self.num_backgrounds):
+                backgrounds.append(BackgroundView(self.data, offset, index_bytes))
+                offset = backgrounds[-1].end
+            if all(bg.kind != 'metatile' for bg in backgrounds) or \
+                    self._metatile_index_bytes(offset) == index_bytes:
+                self.backgrounds_end = offset
+                return backgrounds
+        raise ValueError(f'No metatile set after the backgrounds of {self.name}')
+
+    def _metatile_index_bytes(self, offset: int) -> int:
+        if offset + METATILE_HEADER.size > len(self.data):
+            return 0
+        magic, _, index_bytes, _ = METATILE_HEADER.unpack_from(self.data, offset)
+        return index_bytes if magic == b'MTS' else 0
+
+    @cached_property
+    def metatiles(self) -> Optional[Section]:
+        self.backgrounds
+        offset = self.backgrounds_end
+        if offset == self.sheet_offset:
+            return None
+        check_span(self.data, offset, METATILE_HEADER.size, 'MTS')
+        magic, size, index_bytes, count = METATILE_HEADER.unpack_from(self.data, offset)
+        if magic != b'MTS':
+            raise ValueError(f'Expected MTS at ${offset:04X}, found {magic!r}')
+        num_bytes = METATILE_HEADER.size + 2 * size * size * count
+        return Section('metatiles', offset, num_bytes,
+                       f'{count} {size}x{size} blocks, {index_bytes} byte indices')
+
+    def _payload(self, offset: int, header: struct.Struct, magic: bytes,
+                 size_field: int) -> Tuple[tuple, memoryview]:
+        check_span(self.data, offset, header.size, magic.decode())
+        values = header.unpack_from(self.data, offset)
+        if values[0] != magic:
+            raise ValueError(f'Expected {magic.decode()} at ${offset:04X}, found {values[0]!r}')
+        start = offset + header.size
+        check_span(self.data, start, values[size_field], magic.decode())
+        return values, self.data[start:start + values[size_field]]
+
+    @property
+    def sheet(self) -> memoryview:
+        return self._payload(self.sheet_offset, SHEET_HEADER, b'SPR', 2)[1]
+
+    @property
+    def sheet_bpp(self) -> int:
+        bpp = self._payload(self.sheet_offset, SHEET_HEADER, b'SPR', 2)[0][1]
+        if bpp not in (2, 4, 8):
+            raise ValueError(f'Sheet at ${self.sheet_offset:04X} has {bpp} bits per pixel')
+        return bpp
+
+    @property
+    def palette(self) -> memoryview:
+        return self._payload(self.palette_offset, PALETTE_HEADER, b'PAL', 2)[1]
+
+    def validate(self) -> None:
+        """
+        :raise ValueError: When a record is broken or the offsets do not line up.
+        """
+        self.sections()
+
+    def sections(self) -> List[Section]:
+        """
+        :return: The sections of the file, validated.
+        """
+        if self.background_offset != MAP_HEADER.size:
+            raise ValueError(f'Backgrounds at ${self.background_offset:04X}, '
+                             f'expected ${MAP_HEADER.size:04X}')
+        sections = [Section('header', 0, MAP_HEADER.size,
+                            f'{self.name}, version {self.version}, '
+                            f'{self.width}x{self.height} tiles of '
+                            f'{self.tile_width}x{self.tile_height}')]
+        sections.extend(bg.section() for bg in self.backgrounds)
+        end = self.backgrounds_end
+        if self.metatiles:
+            sections.append(self.metatiles)
+            end = self.metatiles.offset + self.metatiles.size
+        if end != self.sheet_offset:
+            raise ValueError(f'Sheet at ${self.sheet_offset:04X}, expected ${end:04X}')
+
+        sheet, bpp = self.sheet, self.sheet_bpp
+        sections.append(Section('sheet', self.sheet_offset, SHEET_HEADER.size + len(sheet),
+                                f'{len(sheet) // (8 * bpp)} characters at {bpp}bpp'))
+        end = self.sheet_offset + SHEET_HEADER.size + len(sheet)
+        if end != self.palette_offset:
+            raise ValueError(f'Palette at ${self.palette_offset:04X}, expected ${end:04X}')
+
+        palette = self.palette
+        sections.append(Section('palette', self.palette_offset,
+                                PALETTE_HEADER.size + len(palette),
+                                f'{len(palette) // 2} colors'))
+        end = self.palette_offset + PALETTE_HEADER.size + len(palette)
+        if end != self.object_offset:
+            raise ValueError(f'Objects at ${self.object_offset:04X}, expected ${end:04X}')
+        if self.object_offset != len(self.data):
+            sections.append(Section('objects', self.object_offset,
+                                    len(self.data) - self.object_offset,
+                                    f'{self.num_objects} objects'))
+        return sections
+
+
+TAG_RE = re.compile(r'^\.define\s+Sprite_\S+@Tag@(\S+)\s+\$[0-9A-F]+\s*;\s*(\d+)', re.MULTILINE)
+
+
+def read_tag_names(sprite_path: Path) -> Dict[int, str]:
+    """
+    :param sprite_path: A .sprite file, the .i file next to it is read.
+    :return: Tag names by tag offset, empty when there is no .i file.
+    """
+    mapper = sprite_path.with_suffix('.i')
+    if not mapper.is_file():
+        return {}
+    return {int(offset): name for name, offset in TAG_RE.findall(mapper.read_text())}
+
+
+BANK_RE = re.compile(r'^\.define\s+Sprite_\S+@Bank\s+(\d+)', re.MULTILINE)
+
+
+def read_sprite_bank(sprite_dir: Path) -> Optional[int]:
+    """
+    Reads the bank of a sprite from its previously generated .i file.
+    :param sprite_dir: Directory of the sprite.
+    :return: The bank number or None if it is unknown.
+    """
+    mapper = sprite_dir / f'{sprite_dir.name}.i'
+    if not mapper.is_file():
+        return None
+    match = BANK_RE.search(mapper.read_text())
+    return int(match.group(1)) if match else None
+
+
+def open_asset(path: Path):
+    """
+    :param path: A .sprite or map .bin file.
+    :return: A SpriteView or a MapView.
+    """
+    data = path.read_bytes()
+    if path.suffix == '.sprite':
+        return SpriteView(data, read_tag_names(path))
+    return MapView(data)
+
+
+def discover(root: Path) -> List[Path]:
+    """
+    :param root: The resources directory.
+    :return: Every generated sprite and map below it.
+    """
+    sprites = [path for path in sorted((root / 'sprites').glob('*/*.sprite'))
+               if path.stem == path.parent.name]
+    return sprites + sorted((root / 'maps').glob('*.bin'))
+
+
+def inspect_asset(path: Path, depth: int) -> List[str]:
+    """
+    :param path: A .sprite or map .bin file.
+    :param depth: Levels of the offset tree below the sections.
+    :return: Lines of the offset tree.
+    :raise ValueError: When the file does not validate.
+    """
+    asset = open_asset(path)
+    sections = asset.sections()
+    kind = ('release' if asset.release else 'debug') if isinstance(asset, SpriteView) \
+        else f'map version {asset.version}'
+    lines = [f'{path.name.ljust(32)} {len(asset.data):6d} bytes  {kind}']
+    for section in sections:
+        lines.extend(section.lines(depth))
+    return lines
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Print and validate the layout of sprite and map files",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python assetinspect.py -a resources --depth 1")
+    parser.add_argument("paths", type=str, nargs="*",
+                        help=".sprite or map .bin files")
+    parser.add_argument("-a", "--all", type=str,
+                        help="Inspect every sprite and map below this resources root")
+    parser.add_argument("--depth", type=int, default=1,
+                        help="Levels below the sections to print (tags, frames, layers)")
+    parser.add_argument("-l", "--loglevel", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+
+    paths = [Path(path) for path in args.paths]
+    if args.all:
+        paths += discover(Path(args.all).resolve())
+    if not paths:
+        parser.error("Nothing to inspect, pass files or -a")
+
+    start = time.perf_counter()
+    failed = 0
+    for path in paths:
+        try:
+            lines = inspect_asset(path, args.depth)
+        except (OSError, ValueError, struct.error) as e:
+            logger.error('%s: %s', path, e)
+            failed += 1
+            continue
+        logger.info('\n'.join(lines))
+
+    logger.info('Inspected %d files in %.1f ms, %d failed', len(paths),
+                (time.perf_counter() - start) * 1000, failed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,410 @@
+"""
+Benchmarks the sprite and map converters on synthetic assets.
+
+What this script measures
+=========================
+Synthetic inputs are generated into a temporary directory for every size:
+
+    sprite      Aseprite JSON export with its .bin sheet and .pal palette
+    palette     RGB palette bytes
+    map         Tiled .tmx map with several BG layers and its tileset sheet
+
+and every conversion stage is run on them:
+
+    sprite/json_load        json.loads of the export
+    sprite/from_dict        asesprite2bin.SpriteHeader.from_dict
+    sprite/to_bytes         asesprite2bin.SpriteHeader.to_bytes
+    sprite/tags_to_bytes    asesprite2bin.TagHeader.to_bytes of every tag
+    palette/rgb_to_bgr555   asesprite2bin.Helpers.rgb_to_bgr555
+    map/load                tiled2bin.Map (parses the TMX and encodes the layers)
+    map/pack                tiled2bin.Map.pack
+
+Each stage is timed --repeat times and the fastest run is kept. The peak
+memory of the stage is measured with tracemalloc in a separate run, so it does
+not slow down the timed runs. Stages whose output does not fit the 8 and 16
+bit fields of the format (the large sizes go past it on purpose) are recorded
+as skipped with the reason. Every tag fits on its own, so tags_to_bytes
+follows the serialization at every size.
+
+Sizes
+=====
+    small       8 tags x 4 frames x 2 layers, 32x32 map with 2 layers
+    medium      12 tags x 8 frames x 3 layers, 64x64 map with 3 layers
+    large       255 tags x 16 frames x 6 layers, 255x255 map with 4 layers
+
+Comparing
+=========
+The results are written as JSON (build/benchmark.json by default). With
+--baseline the run is compared against an earlier results file and the script
+exits with status 1 when any stage got slower by more than --threshold.
+
+Usage
+=====
+    python tools/benchmark.py
+    python tools/benchmark.py --size large --only sprite
+    python tools/benchmark.py -o build/new.json --baseline build/benchmark.json
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+logger = logging.getLogger('benchmark')
+
+TOOLS_DIR = Path(__file__).resolve().parent
+"""Directory containing the converters."""
+
+ROOT_DIR = TOOLS_DIR.parent
+"""Root of the repository."""
+
+RESULTS_VERSION = 1
+"""Bump when the results file changes in a way baselines can not follow."""
+
+MIN_COMPARE_SECONDS = 0.001
+"""Stages faster than this in the baseline are too noisy to flag."""
+
+SIZES = {
+    'small': {'tags': 8, 'frames': 4, 'layers': 2, 'colors': 256,
+              'map': 32, 'map_layers': 2},
+    'medium': {'tags': 12, 'frames': 8, 'layers': 3, 'colors': 4096,
+               'map': 64, 'map_layers': 3},
+    'large': {'tags': 255, 'frames': 16, 'layers': 6, 'colors': 65536,
+              'map': 255, 'map_layers': 4},
+}
+"""Synthetic asset sizes. Tags, frames per tag and map sides fit a byte."""
+
+CEL_SIZES = ((16, 16), (32, 16), (16, 32), (32, 32))
+"""Cel sizes of the synthetic sprites in pixels."""
+
+TILESET_COLUMNS = 8
+TILESET_COUNT = 112
+"""Layout of the synthetic 16x16 tileset, the same as the Skyscraper one."""
+
+
+@dataclass
+class StageResult:
+    """
+    Timings and memory of a single conversion stage.
+    """
+    seconds: float = 0.0        # Fastest of the timed runs
+    median: float = 0.0         # Median of the timed runs
+    peak_bytes: int = 0         # Peak traced memory of the stage
+    counts: Dict[str, int] = field(default_factory=dict)
+    skipped: str = ''           # Why the stage could not run
+
+
+def write_sprite(directory: Path, name: str, tags: int, frames: int,
+                 layers: int, rng: random.Random) -> Path:
+    """
+    Writes a synthetic Aseprite export in the layout of resources/sprites.
+    :return: The sprite directory.
+    """
+    sprite_dir = directory / name
+    sprite_dir.mkdir(parents=True)
+    (sprite_dir / f'{name}.bin').write_bytes(rng.randbytes(16 * 16 * 32))
+    (sprite_dir / f'{name}.pal').write_bytes(rng.randbytes(256 * 3))
+
+    data_frames = {}
+    frame_tags = []
+    index = 0
+    for t in range(tags):
+        frame_tags.append({'name': f'Tag{t}', 'from': index, 'to': index + frames - 1,
+                           'direction': rng.choice(('forward', 'reverse', 'pingpong'))})
+        index += frames
+        for f in range(frames):
+            for l in range(layers):
+                w, h = rng.choice(CEL_SIZES)
+                x, y = 16 * rng.randrange(7), 16 * rng.randrange(5)
+                rx, ry = 8 * rng.randrange(8), 8 * rng.randrange(8)
+                data_frames[f'Tag{t}__{f}__Layer{l}'] = {
+                    'frame': {'x': x, 'y': y, 'w': w, 'h': h},
+                    'rotated': False,
+                    'trimmed': True,
+                    'spriteSourceSize': {'x': rx, 'y': ry, 'w': w, 'h': h},
+                    'sourceSize': {'w': 128, 'h': 128},
+                    'duration': 100,
+                }
+
+    data = {
+        'frames': data_frames,
+        'meta': {
+            'image': f'{name}.png',
+            'size': {'w': 128, 'h': 128},
+            'frameTags': frame_tags,
+            'layers': [{'name': f'Layer{l}'} for l in range(layers)],
+        },
+    }
+    (sprite_dir / f'{name}.json').write_text(json.dumps(data))
+    return sprite_dir
+
+
+def write_map(directory: Path, name: str, side: int, layers: int,
+              rng: random.Random) -> Path:
+    """
+    Writes a synthetic Tiled map with half of the cells of every BG layer
+    set, next to a tileset image path and its .bin/.pal sheet.
+    :return: Path to the .tmx file.
+    """
+    rows = TILESET_COUNT // TILESET_COLUMNS
+    (directory / 'tiles.bin').write_bytes(rng.randbytes(rows * 2 * 16 * 32))
+    (directory / 'tiles.pal').write_bytes(rng.randbytes(256 * 3))
+
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<map version="1.9" orientation="orthogonal" renderorder="left-down" '
+        f'width="{side}" height="{side}" tilewidth="16" tileheight="16" infinite="0">',
+        ' <properties>',
+        f'  <property name="name" value="{name}"/>',
+        ' </properties>',
+        f' <tileset firstgid="1" name="tiles" tilewidth="16" tileheight="16" '
+        f'tilecount="{TILESET_COUNT}" columns="{TILESET_COLUMNS}">',
+        f'  <image source="tiles.png" width="{16 * TILESET_COLUMNS}" height="{16 * rows}"/>',
+        ' </tileset>',
+    ]
+    for l in range(layers, 0, -1):
+        lines.append(f' <layer id="{l}" name="BG{l}" width="{side}" height="{side}">')
+        lines.append('  <data encoding="csv">')
+        cells = [str(rng.randrange(1, TILESET_COUNT + 1)) if rng.random() < 0.5 else '0'
+                 for _ in range(side * side)]
+        lines.append(',\n'.join(','.join(cells[y * side:(y + 1) * side]) for y in range(side)))
+        lines.append('  </data>')
+        lines.append(' </layer>')
+    lines.append('</map>')
+
+    path = directory / f'{name}.tmx'
+    path.write_text('\n'.join(lines))
+    return path
+
+
+def measure(stage: Callable[[], object], repeat: int) -> StageResult:
+    """
+    Times a stage and measures its peak memory in one more traced run.
+    :param stage: Callable running the stage once.
+    :param repeat: Number of timed runs.
+    """
+    result = StageResult()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    result.seconds = times[0]
+    result.median = times[len(times) // 2]
+
+    tracemalloc.start()
+    try:
+        stage()
+        result.peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def run_stage(results: Dict[str, StageResult], key: str,
+              stage: Callable[[], object], repeat: int) -> Optional[StageResult]:
+    """
+    Measures a stage and stores its result, recording why it was skipped
+    when the converter rejects the synthetic input.
+    """
+    logger.info('Running %s', key)
+    try:
+        result = measure(stage, repeat)
+    except (OverflowError, ValueError, struct.error) as e:
+        logger.warning('Skipping %s: %s', key, e)
+        results[key] = StageResult(skipped=f'{type(e).__name__}: {e}')
+        return None
+    logger.info('\t%.1f ms, %.1f KiB peak', result.seconds * 1000, result.peak_bytes / 1024)
+    results[key] = result
+    return result
+
+
+def bench_sprite(directory: Path, size: str, spec: dict, repeat: int,
+                 results: Dict[str, StageResult]) -> None:
+    import asesprite2bin
+
+    rng = random.Random(size)
+    sprite_dir = write_sprite(directory, f'bench-{size}', spec['tags'], spec['frames'],
+                              spec['layers'], rng)
+    text = (sprite_dir / f'{sprite_dir.name}.json').read_text()
+
+    run_stage(results, f'sprite/{size}/json_load', lambda: json.loads(text), repeat)
+
+    # The export refers to the sheet relative to its directory
+    data = json.loads(text)
+    prev_path = os.getcwd()
+    os.chdir(sprite_dir)
+    try:
+        result = run_stage(results, f'sprite/{size}/from_dict',
+                           lambda: asesprite2bin.SpriteHeader.from_dict(data), repeat)
+        sprite_header = asesprite2bin.SpriteHeader.from_dict(data)
+    finally:
+        os.chdir(prev_path)
+    if result:
+        result.counts = {
+            'tags': len(sprite_header.tag_data),
+            'frames': sum(len(tag.frame_data) for tag in sprite_header.tag_data),
+            'layers': sum(len(frame.layer_data) for tag in sprite_header.tag_data
+                          for frame in tag.frame_data),
+            'tiles': sum(len(layer.tile_data) for tag in sprite_header.tag_data
+                         for frame in tag.frame_data for layer in frame.layer_data),
+        }
+
+    result = run_stage(results, f'sprite/{size}/to_bytes', sprite_header.to_bytes, repeat)
+    if result:
+        result.counts = {'bytes': sprite_header.num_bytes()}
+
+    result = run_stage(results, f'sprite/{size}/tags_to_bytes',
+                       lambda: [tag.to_bytes() for tag in sprite_header.tag_data], repeat)
+    if result:
+        result.counts = {'bytes': sum(tag.num_bytes() for tag in sprite_header.tag_data)}
+
+
+def bench_palette(size: str, spec: dict, repeat: int,
+                  results: Dict[str, StageResult]) -> None:
+    import asesprite2bin
+
+    rgb = random.Random(size).randbytes(3 * spec['colors'])
+    result = run_stage(results, f'palette/{size}/rgb_to_bgr555',
+                       lambda: asesprite2bin.Helpers.rgb_to_bgr555(rgb), repeat)
+    if result:
+        result.counts = {'colors': spec['colors']}
+
+
+def bench_map(directory: Path, size: str, spec: dict, repeat: int, encoding: str,
+              results: Dict[str, StageResult]) -> None:
+    import tiled2bin
+
+    screen = tiled2bin.Background.SCREEN_SIZE * tiled2bin.Background.MAX_SCREENS
+    if encoding == 'dense' and spec['map'] > screen:
+        logger.warning('Skipping map/%s, a dense tilemap is at most %dx%d', size, screen, screen)
+        return
+
+    map_dir = directory / f'map-{size}'
+    map_dir.mkdir()
+    tmx_path = write_map(map_dir, f'Bench{size.title()}', spec['map'], spec['map_layers'],
+                         random.Random(size))
+
+    # The converter reports its offsets on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_stage(results, f'map/{size}/load',
+                           lambda: tiled2bin.Map(str(tmx_path), bg_encoding=encoding), repeat)
+        tile_map = tiled2bin.Map(str(tmx_path), bg_encoding=encoding)
+    if result:
+        result.counts = {'cells': spec['map'] ** 2 * spec['map_layers'],
+                         'backgrounds': tile_map.num_backgrounds}
+
+    result = run_stage(results, f'map/{size}/pack', tile_map.pack, repeat)
+    if result:
+        result.counts = {'bytes': tile_map.num_bytes()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    :param results: Results of this run.
+    :param baseline: Results of an earlier run.
+    :param threshold: Allowed slowdown, 0.2 for 20%.
+    :return: Keys of the stages that got slower than allowed.
+    """
+    regressions = []
+    for key, stage in sorted(results['stages'].items()):
+        base = baseline.get('stages', {}).get(key)
+        if not base or base.get('skipped') or stage['skipped']:
+            continue
+        ratio = stage['seconds'] / base['seconds'] if base['seconds'] else 1.0
+        memory = stage['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else 1.0
+        slower = ratio > 1 + threshold and base['seconds'] >= MIN_COMPARE_SECONDS
+        logger.log(logging.WARNING if slower else logging.INFO,
+                   '%-32s %8.1f ms -> %8.1f ms (%+.0f%%), memory %+.0f%%', key,
+                   base['seconds'] * 1000, stage['seconds'] * 1000,
+                   (ratio - 1) * 100, (memory - 1) * 100)
+        if slower:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the converters on synthetic sprites and maps",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python benchmark.py --baseline build/benchmark.json")
+    parser.add_argument("--size", choices=SIZES.keys(), nargs="+",
+                        default=['small', 'medium'], help="Sizes to run")
+    parser.add_argument("--only", choices=("sprite", "palette", "map"), nargs="+",
+                        default=['sprite', 'palette', 'map'], help="Assets to run")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--map-encoding", choices=("sparse", "dense", "auto", "metatile"),
+                        default="sparse")
+    parser.add_argument("-o", "--output", type=str,
+                        default=str(ROOT_DIR / "build" / "benchmark.json"))
+    parser.add_argument("--baseline", type=str,
+                        help="Earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown reported as a regression")
+    parser.add_argument("-l", "--loglevel", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.loglevel)
+
+    # The converters log every record at INFO, which would be measured too
+    sys.path.insert(0, str(TOOLS_DIR))
+    import asesprite2bin
+    asesprite2bin.logger_build.setLevel(logging.WARNING)
+    asesprite2bin.logger_serialize.setLevel(logging.WARNING)
+    logging.getLogger('tiled2bin').setLevel(logging.WARNING)
+
+    stages = {}
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as tmp:
+        for size in args.size:
+            spec = SIZES[size]
+            if 'sprite' in args.only:
+                bench_sprite(Path(tmp), size, spec, args.repeat, stages)
+            if 'palette' in args.only:
+                bench_palette(size, spec, args.repeat, stages)
+            if 'map' in args.only:
+                bench_map(Path(tmp), size, spec, args.repeat, args.map_encoding, stages)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'stages': {key: asdict(stage) for key, stage in stages.items()},
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    logger.info('Wrote %d stages to %s', len(stages), output)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('version') != RESULTS_VERSION:
+        logger.error('Baseline %s is version %s, expected %d', args.baseline,
+                     baseline.get('version'), RESULTS_VERSION)
+        return 1
+    regressions = compare(results, baseline, args.threshold)
+    for key in regressions:
+        logger.error('%s is slower than the baseline', key)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,365 @@
+"""
+CGRAM sub-palette planner for the sprites, maps and fonts.
+
+What this script plans
+======================
+Every sheet comes with its own .pal of 256 colors, of which it uses a few.
+CGRAM holds 8 sub-palettes of 16 colors for the backgrounds and 8 for the
+objects, and in mode 1 the 2BPP BG3 palettes are the first 32 BG colors:
+
+    bg          $00-$7F     8 sub-palettes of 16 colors for 4BPP maps
+    bg2         $00-$1F     8 sub-palettes of 4 colors for 2BPP fonts
+    obj         $80-$FF     8 sub-palettes of 16 colors for sprites
+
+This script reads the characters of every sheet, collects the colors (as
+BGR555, what CGRAM holds) of the color indices they actually use, and packs
+the assets into sub-palettes. Assets whose colors fit together share a
+sub-palette: an asset goes to the sub-palette that already holds most of its
+colors, or the fullest one with room, before a new one is opened. Color 0 is
+transparent and never counts.
+
+Fonts are placed first. The 4BPP sub-palettes that overlap the 2BPP ones in
+use are left to the fonts, then maps take the others. Every sprite is
+resident, and so is every map, so that switching maps does not upload
+palettes.
+
+Output
+======
+The chosen sub-palettes are written as .define lines (resources/cgram.i by
+default) with the sub-palette number, as used by the OAM and tilemap
+palette bits, and the CGRAM index of its color 0:
+
+    .define Sprite_Boss@Palette                      1
+    .define Sprite_Boss@CGRAM                        $90
+    .define Map_Skyscraper@Palette                   1
+    .define Map_Skyscraper@CGRAM                     $10
+
+With --apply the color indices of every sheet are remapped to its
+sub-palette. The .bin and .pal next to each image are rewritten in place,
+with the whole sub-palette in the first colors of the .pal, so the converters
+and assetbuild.py pick them up. The script exits with status 1 when an asset
+does not fit.
+
+Usage
+=====
+    python tools/palplan.py
+    python tools/palplan.py --report build/cgram.json
+    python tools/palplan.py --apply
+"""
+import json
+import logging
+import sys
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import pngsheet
+import snesgfx
+import snespal
+import tmxreader
+
+
+logger = logging.getLogger('palplan')
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+"""Root of the repository."""
+
+NUM_SUB_PALETTES = 8
+"""Sub-palettes per group."""
+
+GROUPS = {
+    'bg2': (2, 0x00),
+    'bg': (4, 0x00),
+    'obj': (4, 0x80),
+}
+"""Bits per pixel and CGRAM index of the first color of every group."""
+
+
+@dataclass
+class Asset:
+    """
+    A sheet, the colors it uses and where they end up.
+    """
+    kind: str                   # "sprite", "map" or "font"
+    name: str                   # Name used for the defines
+    path: Path                  # The .bin the characters were read from
+    bpp: int
+    chars: np.ndarray           # (num_chars, 8, 8) color indices
+    palette: np.ndarray         # (n, 3) RGB colors of the .pal
+    sub_palette: Optional["SubPalette"] = None
+
+    @property
+    def define(self) -> str:
+        return {'sprite': 'Sprite', 'map': 'Map', 'font': 'Font'}[self.kind] + f'_{self.name}'
+
+    @property
+    def group(self) -> str:
+        return 'obj' if self.kind == 'sprite' else 'bg2' if self.bpp == 2 else 'bg'
+
+    @property
+    def used(self) -> np.ndarray:
+        """
+        :return: The color indices used by the characters, without color 0.
+        """
+        used = np.unique(self.chars)
+        return used[used != 0]
+
+    @property
+    def colors(self) -> List[int]:
+        """
+        :return: BGR555 words of the used colors, without repeats.
+        """
+        words = snespal.encode_bgr555(self.palette[self.used]).tolist()
+        return list(dict.fromkeys(words))
+
+    @property
+    def backdrop(self) -> int:
+        return int(snespal.encode_bgr555(self.palette[0]))
+
+    def remap(self) -> np.ndarray:
+        """
+        :return: Table from the color indices of the sheet to the sub-palette.
+        """
+        table = np.zeros(1 << self.bpp, dtype=np.uint8)
+        positions = {word: i + 1 for i, word in enumerate(self.sub_palette.colors)}
+        words = snespal.encode_bgr555(self.palette[self.used]).tolist()
+        for index, word in zip(self.used.tolist(), words):
+            table[index] = positions[word]
+        return table
+
+
+@dataclass
+class SubPalette:
+    """
+    A sub-palette of CGRAM and the colors that have been placed in it.
+    """
+    group: str                  # "bg", "bg2" or "obj"
+    index: int                  # Sub-palette number in the group
+    backdrop: int               # BGR555 color 0
+    colors: List[int] = field(default_factory=list)    # BGR555 colors 1..n
+    assets: List[str] = field(default_factory=list)
+
+    @property
+    def capacity(self) -> int:
+        return (1 << GROUPS[self.group][0]) - 1
+
+    @property
+    def cgram(self) -> int:
+        bpp, base = GROUPS[self.group]
+        return base + self.index * (1 << bpp)
+
+    def added(self, colors: List[int]) -> List[int]:
+        """
+        :return: The colors that are not in the sub-palette yet.
+        """
+        present = set(self.colors)
+        return [word for word in colors if word not in present]
+
+    def rgb(self) -> np.ndarray:
+        """
+        :return: (n, 3) RGB colors, color 0 first.
+        """
+        return snespal.decode_bgr555(np.array([self.backdrop] + self.colors, dtype=np.uint16))
+
+    def report(self) -> dict:
+        return {
+            'group': self.group,
+            'index': self.index,
+            'cgram': self.cgram,
+            'colors': len(self.colors),
+            'free': self.capacity - len(self.colors),
+            'assets': list(self.assets),
+        }
+
+
+def read_sheet(image: Path, bpp: int) -> Optional[Tuple[Path, np.ndarray, np.ndarray]]:
+    """
+    Reads the .bin and .pal next to an image, or encodes the image like the
+    converters do when they were not exported.
+    :param image: The sheet image, or any path with the name of the sheet.
+    :param bpp: Bits per pixel of the .bin.
+    :return: (path of the .bin, characters, RGB palette), None if there is
+        no sheet.
+    """
+    sheet_bin, sheet_pal = image.with_suffix('.bin'), image.with_suffix('.pal')
+    if sheet_bin.is_file() and sheet_pal.is_file():
+        data, rgb = sheet_bin.read_bytes(), sheet_pal.read_bytes()
+    elif image.suffix.lower() == '.png' and image.is_file():
+        sheet = pngsheet.load(image, bpp)
+        data, rgb = sheet.chars, sheet.palette
+    else:
+        return None
+    chars = snesgfx.decode_planar(data, bpp)
+    palette = np.zeros((1 << bpp, 3), dtype=np.uint8)
+    colors = np.frombuffer(rgb, dtype=np.uint8).reshape(-1, 3)[:1 << bpp]
+    palette[:len(colors)] = colors
+    return sheet_bin, chars, palette
+
+
+def discover(root: Path) -> List[Asset]:
+    """
+    Finds the sheets of the sprites, maps and fonts below the resources root.
+    :param root: The resources directory.
+    :return: List of assets, not yet placed.
+    """
+    found = []
+    for json_path in sorted((root / 'sprites').glob('*/*.json')):
+        if json_path.stem != json_path.parent.name:
+            continue
+        name = json_path.stem.title().replace('-', '_')
+        found.append(('sprite', name, json_path.with_suffix('.png'), snesgfx.OBJ_BPP))
+    for tmx_path in sorted((root / 'maps').glob('*.tmx')):
+        tmx = tmxreader.read_tmx(tmx_path)
+        if not tmx.tilesets or not tmx.tilesets[0].image:
+            continue
+        found.append(('map', tmx_path.stem, tmx_path.parent / tmx.tilesets[0].image, 4))
+    for path in sorted((root / 'fonts').glob('*-font.bin')):
+        name = path.stem[:-len('-font')].replace('-', '_')
+        found.append(('font', name, path, 2))
+
+    assets = []
+    for kind, name, image, bpp in found:
+        sheet = read_sheet(image.resolve(), bpp)
+        if sheet is None:
+            logger.warning('Skipping %s %s, no .bin/.pal or PNG sheet', kind, name)
+            continue
+        path, chars, palette = sheet
+        assets.append(Asset(kind, name, path, bpp, chars, palette))
+    return assets
+
+
+def place(assets: List[Asset], group: str, slots: List[int]) -> Tuple[List[SubPalette], List[Asset]]:
+    """
+    Packs assets into sub-palettes, the assets with the most colors first.
+    :param assets: Assets of the group, updated in place with their sub-palette.
+    :param group: "bg", "bg2" or "obj".
+    :param slots: Sub-palette numbers the group may use.
+    :return: (sub-palettes, assets that did not fit)
+    """
+    sub_palettes: List[SubPalette] = []
+    overflow = []
+    for asset in sorted(assets, key=lambda a: (-len(a.colors), a.define)):
+        colors = asset.colors
+        fits = [p for p in sub_palettes if len(p.colors) + len(p.added(colors)) <= p.capacity]
+        if fits:
+            # Most colors in common, then the fullest, so free room stays together
+            target = max(fits, key=lambda p: (len(colors) - len(p.added(colors)), len(p.colors)))
+        elif len(sub_palettes) < len(slots) and len(colors) <= (1 << GROUPS[group][0]) - 1:
+            target = SubPalette(group, slots[len(sub_palettes)], asset.backdrop)
+            sub_palettes.append(target)
+        else:
+            overflow.append(asset)
+            continue
+        target.colors.extend(target.added(colors))
+        target.assets.append(asset.define)
+        asset.sub_palette = target
+    return sub_palettes, overflow
+
+
+def plan(assets: List[Asset]) -> Tuple[List[SubPalette], List[Asset]]:
+    """
+    Places every asset in a sub-palette of its group.
+    :param assets: From discover(), updated in place with the sub-palettes.
+    :return: (sub-palettes, assets that did not fit)
+    """
+    by_group = {group: [a for a in assets if a.group == group] for group in GROUPS}
+    slots = list(range(NUM_SUB_PALETTES))
+
+    fonts, overflow = place(by_group['bg2'], 'bg2', slots)
+
+    # 2BPP sub-palettes share CGRAM with the first 4BPP ones
+    taken = {p.cgram // 16 for p in fonts}
+    maps, more = place(by_group['bg'], 'bg', [s for s in slots if s not in taken])
+    overflow += more
+
+    sprites, more = place(by_group['obj'], 'obj', slots)
+    overflow += more
+    return fonts + maps + sprites, overflow
+
+
+def apply(asset: Asset) -> None:
+    """
+    Rewrites the .bin and .pal of an asset with the color indices and the
+    colors of its sub-palette.
+    """
+    chars = asset.remap()[asset.chars]
+    palette = np.zeros((pngsheet.PAL_COLORS, 3), dtype=np.uint8)
+    rgb = asset.sub_palette.rgb()
+    palette[:len(rgb)] = rgb
+    asset.path.write_bytes(snesgfx.encode_planar(chars, asset.bpp))
+    asset.path.with_suffix('.pal').write_bytes(palette.tobytes())
+    logger.info('Remapped %s to %s sub-palette %d', asset.path, asset.sub_palette.group,
+                asset.sub_palette.index)
+
+
+def defines(assets: List[Asset]) -> str:
+    """
+    :param assets: Placed assets.
+    :return: Contents of the generated .i file.
+    """
+    lines = ['; Generated by palplan.py']
+    for asset in assets:
+        if asset.sub_palette is None:
+            continue
+        lines.append(f'.define {(asset.define + "@Palette").ljust(40)} {asset.sub_palette.index}')
+        lines.append(f'.define {(asset.define + "@CGRAM").ljust(40)} ${asset.sub_palette.cgram:02X}')
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Plan the CGRAM sub-palettes of sprites, maps and fonts",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python palplan.py --report build/cgram.json")
+    parser.add_argument("-r", "--resources", type=str,
+                        default=str(ROOT_DIR / "resources"))
+    parser.add_argument("-o", "--output", type=str,
+                        default=str(ROOT_DIR / "resources" / "cgram.i"))
+    parser.add_argument("--apply", action="store_true",
+                        help="Remap the .bin and .pal of every sheet to its sub-palette")
+    parser.add_argument("--report", type=str,
+                        help="Also write the report as JSON")
+    parser.add_argument("-l", "--loglevel", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.loglevel)
+
+    assets = discover(Path(args.resources).resolve())
+    sub_palettes, overflow = plan(assets)
+
+    for group in GROUPS:
+        placed = [p for p in sub_palettes if p.group == group]
+        members = [a for a in assets if a.group == group]
+        logger.info('%-4s %d assets in %d sub-palettes, %d colors (%d before merging)',
+                    group, len(members), len(placed), sum(len(p.colors) for p in placed),
+                    sum(len(a.colors) for a in members))
+    for sub_palette in sub_palettes:
+        logger.debug('%-4s %d $%02X %2d colors %s', sub_palette.group, sub_palette.index,
+                     sub_palette.cgram, len(sub_palette.colors), ', '.join(sub_palette.assets))
+    for asset in overflow:
+        logger.error('%s does not fit (%d colors)', asset.define, len(asset.colors))
+
+    if args.apply:
+        for asset in assets:
+            if asset.sub_palette is not None:
+                apply(asset)
+
+    with open(args.output, 'w') as f:
+        f.write(defines(assets))
+    if args.report:
+        report = {
+            'sub_palettes': [sub_palette.report() for sub_palette in sub_palettes],
+            'overflow': [asset.define for asset in overflow],
+        }
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+    return 1 if overflow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
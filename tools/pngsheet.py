@@ -0,0 +1,370 @@
+"""
+PNG sheet to SNES planar character and palette encoder.
+
+What this script does
+=====================
+The converters read the characters of every sprite sheet and tileset from
+the {name}.bin next to the image, and its colors from {name}.pal. These used
+to be exported by hand with the SNES GFX Tool. This script produces both
+from the image itself:
+
+    {name}.png  ->  {name}.bin   planar characters, see snesgfx.py
+                    {name}.pal   256 colors of 3 bytes (R, G, B)
+
+The image is read with the PNG reader below, so no imaging library is
+needed. Indexed images whose color indices fit the bit depth keep their
+palette and indices unchanged. Any other image (RGB, RGBA, grayscale, or
+indexed with too many colors) is quantized with snespal.quantize(): color 0
+is reserved for transparent pixels (alpha below 128) and the opaque pixels
+share the remaining 2^bpp - 1 colors.
+
+The image is split into 8x8 characters left to right, top to bottom, so its
+width and height must be multiples of 8. The converters expect sheets of 16
+characters (128 pixels) per row.
+
+When a .bin or .pal is missing, asesprite2bin and tiled2bin encode the image
+in memory with load() instead of failing, so writing the files is only needed
+to check them in or to inspect them.
+
+Usage
+=====
+    python tools/pngsheet.py resources/sprites/boss/boss.png
+    python tools/pngsheet.py --bpp 2 -o build resources/fonts/8x8-font.png
+"""
+import logging
+import struct
+import sys
+import zlib
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+import snesgfx
+import snespal
+import warmcache
+
+
+logger = logging.getLogger('pngsheet')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+PAL_COLORS = 256
+"""Colors of a .pal file, unused colors are black."""
+
+ALPHA_OPAQUE = 128
+"""Pixels with a lower alpha are transparent and use color 0."""
+
+CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+"""Samples per pixel of every PNG color type."""
+
+DIAGONAL_COST = 120
+"""Average and Paeth bytes decoded one by one in the time of one diagonal."""
+
+
+@dataclass
+class PngImage:
+    """
+    A decoded PNG image with 8 bits per sample.
+    """
+    width: int
+    height: int
+    pixels: np.ndarray              # height x width indices, or height x width x 4 RGBA
+    palette: Optional[np.ndarray] = None    # n x 4 RGBA colors of an indexed image
+
+    @property
+    def indexed(self) -> bool:
+        return self.palette is not None
+
+    def rgba(self) -> np.ndarray:
+        """
+        :return: height x width x 4 RGBA pixels.
+        """
+        if not self.indexed:
+            return self.pixels
+        palette = np.zeros((PAL_COLORS, 4), dtype=np.uint8)
+        palette[:len(self.palette)] = self.palette
+        return palette[self.pixels]
+
+
+@dataclass
+class EncodedSheet:
+    """
+    The contents of the .bin and .pal files of an image.
+    """
+    chars: bytes                # Planar characters
+    palette: bytes              # PAL_COLORS colors as R, G, B bytes
+    bpp: int
+    num_colors: int             # Colors used by the palette
+
+    @property
+    def num_chars(self) -> int:
+        return len(self.chars) // snesgfx.char_bytes(self.bpp)
+
+
+def unfilter_rows(raw: np.ndarray, stride: int, pixel_bytes: int) -> np.ndarray:
+    """
+    Reverses the PNG scanline filters one row at a time. None, Sub and Up
+    rows are vectorized, Average and Paeth rows are decoded byte by byte.
+    :param raw: Decompressed image data, height x (1 + stride) bytes.
+    :param stride: Bytes of a scanline.
+    :param pixel_bytes: Bytes of a pixel, at least 1.
+    :return: height x stride unfiltered bytes.
+    """
+    rows = np.empty((len(raw), stride), dtype=np.uint8)
+    prev = np.zeros(stride, dtype=np.uint8)
+    for y, (kind, line) in enumerate(zip(raw[:, 0], raw[:, 1:])):
+        if kind == 0:
+            rows[y] = line
+        elif kind == 1:
+            # Sub is a running sum over the pixels of each byte lane
+            rows[y] = line.reshape(-1, pixel_bytes).cumsum(axis=0, dtype=np.uint8).ravel()
+        elif kind == 2:
+            rows[y] = line + prev
+        else:
+            # Average and Paeth depend on the byte just decoded to the left
+            cur = bytearray(stride)
+            up = prev.tolist()
+            for x, value in enumerate(line.tolist()):
+                left = cur[x - pixel_bytes] if x >= pixel_bytes else 0
+                if kind == 3:
+                    value += (left + up[x]) >> 1
+                else:
+                    corner = up[x - pixel_bytes] if x >= pixel_bytes else 0
+                    base = left + up[x] - corner
+                    dl, du, dc = abs(base - left), abs(base - up[x]), abs(base - corner)
+                    value += left if dl <= du and dl <= dc else up[x] if du <= dc else corner
+                cur[x] = value & 0xFF
+            rows[y] = np.frombuffer(bytes(cur), dtype=np.uint8)
+        prev = rows[y]
+    return rows
+
+
+def unfilter_diagonals(raw: np.ndarray, stride: int, pixel_bytes: int) -> np.ndarray:
+    """
+    Reverses the PNG scanline filters one anti-diagonal of pixels at a time.
+    A pixel only depends on its left, upper and upper left neighbors, so all
+    pixels of a diagonal are decoded together whatever the filter of their row.
+    :param raw: Decompressed image data, height x (1 + stride) bytes.
+    :param stride: Bytes of a scanline.
+    :param pixel_bytes: Bytes of a pixel, at least 1.
+    :return: height x stride unfiltered bytes.
+    """
+    height, width = len(raw), stride // pixel_bytes
+    kinds = raw[:, 0].astype(np.intp)[:, None]
+    lines = raw[:, 1:].reshape(height, width, pixel_bytes).astype(np.int16)
+
+    # Decoded pixels, with a row and a column of zeros above and to the left
+    out = np.zeros((height + 1, width + 1, pixel_bytes), dtype=np.int16)
+    for diagonal in range(height + width - 1):
+        ys = np.arange(max(0, diagonal - width + 1), min(height - 1, diagonal) + 1)
+        xs = diagonal - ys
+        left, up, corner = out[ys + 1, xs], out[ys, xs + 1], out[ys, xs]
+        base = left + up - corner
+        dl, du, dc = np.abs(base - left), np.abs(base - up), np.abs(base - corner)
+        paeth = np.where((dl <= du) & (dl <= dc), left, np.where(du <= dc, up, corner))
+        predictor = np.choose(kinds[ys], [np.zeros_like(left), left, up,
+                                          (left + up) >> 1, paeth])
+        out[ys + 1, xs + 1] = (lines[ys, xs] + predictor) & 0xFF
+    return out[1:, 1:].reshape(height, stride).astype(np.uint8)
+
+
+def unfilter(raw: np.ndarray, stride: int, pixel_bytes: int) -> np.ndarray:
+    """
+    Reverses the PNG scanline filters, by diagonals when the Average and
+    Paeth rows would take longer to decode byte by byte.
+    :param raw: Decompressed image data, height x (1 + stride) bytes.
+    :param stride: Bytes of a scanline.
+    :param pixel_bytes: Bytes of a pixel, at least 1.
+    :return: height x stride unfiltered bytes.
+    """
+    kinds = raw[:, 0]
+    if len(kinds) and int(kinds.max()) > 4:
+        y = int(np.argmax(kinds > 4))
+        raise ValueError(f'Invalid PNG filter {kinds[y]} on row {y}')
+    sequential = int(np.count_nonzero(kinds >= 3)) * stride
+    if sequential > DIAGONAL_COST * (len(raw) + stride // pixel_bytes):
+        return unfilter_diagonals(raw, stride, pixel_bytes)
+    return unfilter_rows(raw, stride, pixel_bytes)
+
+
+def read_png(data: bytes) -> PngImage:
+    """
+    Decodes a non-interlaced PNG of any color type and bit depth. 16-bit
+    samples are reduced to their high byte and grayscale samples below
+    8 bits are scaled to 8 bits.
+    :param data: Contents of the PNG file.
+    :return: The image.
+    """
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError('Not a PNG file')
+
+    header = None
+    plte = trns = None
+    idat = []
+    offset = 8
+    while offset + 8 <= len(data):
+        length, kind = struct.unpack_from('>I4s', data, offset)
+        chunk = data[offset + 8:offset + 8 + length]
+        offset += 12 + length
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'PLTE':
+            plte = chunk
+        elif kind == b'tRNS':
+            trns = chunk
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'IEND':
+            break
+    if header is None:
+        raise ValueError('PNG has no IHDR')
+
+    width, height, depth, color_type, _, _, interlace = header
+    if color_type not in CHANNELS:
+        raise ValueError(f'Invalid PNG color type {color_type}')
+    if interlace:
+        raise ValueError('Interlaced PNGs are not supported')
+    if color_type == 3 and plte is None:
+        raise ValueError('Indexed PNG has no PLTE')
+
+    channels = CHANNELS[color_type]
+    stride = (width * channels * depth + 7) // 8
+    raw = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8)
+    if len(raw) < height * (stride + 1):
+        raise ValueError(f'PNG data has {len(raw)} bytes, expected {height * (stride + 1)}')
+    rows = unfilter(raw[:height * (stride + 1)].reshape(height, stride + 1), stride,
+                    max(1, channels * depth // 8))
+
+    # Samples at their own bit depth
+    if depth == 16:
+        samples = rows.reshape(height, width * channels, 2)[..., 0]
+    elif depth == 8:
+        samples = rows
+    else:
+        bits = np.unpackbits(rows, axis=1)[:, :width * depth].reshape(height, width, depth)
+        samples = np.packbits(bits, axis=-1)[..., 0] >> (8 - depth)
+    samples = samples.reshape(height, width, channels)
+
+    if color_type == 3:
+        palette = np.full((len(plte) // 3, 4), 255, dtype=np.uint8)
+        palette[:, :3] = np.frombuffer(plte, dtype=np.uint8)[:len(palette) * 3].reshape(-1, 3)
+        if trns:
+            alpha = np.frombuffer(trns, dtype=np.uint8)[:len(palette)]
+            palette[:len(alpha), 3] = alpha
+        return PngImage(width, height, samples[..., 0], palette)
+
+    # Transparent color key of grayscale and RGB images, at the original depth
+    key = None
+    if trns and color_type in (0, 2):
+        key = np.frombuffer(trns, dtype='>u2')[:channels]
+        key = key >> 8 if depth == 16 else key
+        key = np.all(samples == key.astype(np.uint8), axis=-1)
+    if depth < 8:
+        samples = samples * (255 // ((1 << depth) - 1))
+
+    pixels = np.full((height, width, 4), 255, dtype=np.uint8)
+    if color_type in (0, 4):
+        pixels[..., :3] = samples[..., :1]
+    else:
+        pixels[..., :3] = samples[..., :3]
+    if color_type in (4, 6):
+        pixels[..., 3] = samples[..., -1]
+    if key is not None:
+        pixels[key, 3] = 0
+    return PngImage(width, height, pixels)
+
+
+def index_image(image: PngImage, bpp: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Maps every pixel to a color of at most 2^bpp colors.
+    :param image: The image.
+    :param bpp: Bits per pixel (2, 4 or 8).
+    :return: (indices, palette) where indices is height x width and palette
+        is an n x 3 array of R, G, B colors.
+    """
+    limit = 1 << bpp
+    if image.indexed and (not image.pixels.size or int(image.pixels.max()) < limit):
+        return image.pixels, image.palette[:limit, :3]
+
+    rgba = image.rgba()
+    opaque = rgba[..., 3] >= ALPHA_OPAQUE
+    palette, index = snespal.quantize(rgba[..., :3][opaque], limit - 1)
+    indices = np.zeros((image.height, image.width), dtype=np.uint8)
+    indices[opaque] = index + 1
+    return indices, np.concatenate([np.zeros((1, 3), dtype=np.uint8), palette])
+
+
+def encode(image: PngImage, bpp: int = 4) -> EncodedSheet:
+    """
+    :param image: The image, its dimensions must be multiples of 8.
+    :param bpp: Bits per pixel (2, 4 or 8).
+    :return: The planar characters and palette of the image.
+    """
+    snesgfx.char_bytes(bpp)
+    indices, colors = index_image(image, bpp)
+    chars = snesgfx.encode_planar(snesgfx.image_to_chars(indices), bpp)
+    palette = np.zeros((PAL_COLORS, 3), dtype=np.uint8)
+    palette[:len(colors)] = colors
+    return EncodedSheet(chars, palette.tobytes(), bpp, len(colors))
+
+
+def load(path: Path, bpp: int = 4) -> EncodedSheet:
+    """
+    Encodes an image, once per process until it changes.
+    :param path: Path to the PNG file.
+    :param bpp: Bits per pixel (2, 4 or 8).
+    :return: The planar characters and palette of the image.
+    """
+    return warmcache.files.load(path, lambda data: encode(read_png(data), bpp),
+                                f'planar{bpp}')
+
+
+def write(path: Path, bpp: int = 4, output_dir: Optional[Path] = None) -> EncodedSheet:
+    """
+    Writes the .bin and .pal of an image.
+    :param path: Path to the PNG file.
+    :param bpp: Bits per pixel (2, 4 or 8).
+    :param output_dir: Directory of the outputs, next to the image by default.
+    :return: The planar characters and palette that were written.
+    """
+    path = Path(path)
+    sheet = encode(read_png(path.read_bytes()), bpp)
+    base = (Path(output_dir) if output_dir else path.parent) / path.stem
+    base.with_suffix('.bin').write_bytes(sheet.chars)
+    base.with_suffix('.pal').write_bytes(sheet.palette)
+    logger.info('%s: %d chars at %dbpp, %d colors', path, sheet.num_chars, bpp,
+                sheet.num_colors)
+    return sheet
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Encode PNG sheets to SNES planar characters and palettes",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python pngsheet.py resources/sprites/boss/boss.png")
+    parser.add_argument("images", type=str, nargs="+", help="PNG files to encode")
+    parser.add_argument("-b", "--bpp", type=int, choices=(2, 4, 8), default=4)
+    parser.add_argument("-o", "--output-dir", type=str,
+                        help="Write the .bin and .pal here instead of next to each image")
+    parser.add_argument("-l", "--loglevel", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.loglevel)
+
+    failed = 0
+    for image in args.images:
+        try:
+            write(Path(image), args.bpp, args.output_dir)
+        except (OSError, ValueError, zlib.error) as e:
+            logger.error('%s: %s', image, e)
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,126 @@
+"""
+Per-stage timings and counters shared by the converters.
+
+A Profiler collects the wall time of named stages and integer counters of a
+single conversion. Stages nest, and a nested stage is recorded under the path
+of its parents:
+
+    profiler = Profiler()
+    with profiler.stage("parse"):
+        with profiler.stage("tags"):
+            ...
+    profiler.count("tiles", 42)
+    profiler.to_dict()
+    # {"stages": {"parse": 0.012, "parse/tags": 0.009}, "counters": {"tiles": 42}}
+
+A disabled profiler, as returned by Profiler.disabled(), records nothing. It
+is the default of every converter entry point, so stages are only timed
+with --profile. Stages are coarse; counters are computed once from the
+converted data and are never updated inside hot loops.
+
+With cprofile=True the whole conversion also runs under cProfile and dump()
+writes the statistics for pstats or snakeviz.
+"""
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class Profiler:
+    """
+    Wall time of stages and counters of a single conversion.
+    """
+
+    def __init__(self, enabled: bool = True, cprofile: bool = False):
+        self.enabled = enabled
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._stack: List[Tuple[str, float]] = []
+        self._cprofile = None
+        if enabled and cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+
+    @classmethod
+    def disabled(cls) -> "Profiler":
+        """
+        :return: A profiler that records nothing.
+        """
+        return cls(enabled=False)
+
+    def begin(self, name: str) -> None:
+        """
+        Starts a stage, nested under the enclosing stages. Long sequential
+        phases use begin() and end() instead of stage() to keep their
+        indentation.
+        """
+        if self.enabled:
+            self._stack.append((name, time.perf_counter()))
+
+    def end(self, name: str) -> None:
+        """
+        Ends the stage started last. Repeated stages add up.
+        """
+        if not self.enabled:
+            return
+        path = "/".join(stage for stage, _ in self._stack)
+        started, start = self._stack.pop()
+        assert started == name, f"Ending stage {name} while in {started}"
+        self.stages[path] = self.stages.get(path, 0.0) + time.perf_counter() - start
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Times the body of the with statement. A stage left by an exception
+        is not recorded, along with the stages it left open.
+        :param name: Name of the stage, nested under the enclosing stages.
+        """
+        depth = len(self._stack)
+        self.begin(name)
+        try:
+            yield
+        except BaseException:
+            del self._stack[depth:]
+            raise
+        self.end(name)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Adds value to a counter.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def start(self) -> None:
+        """
+        Starts cProfile, if enabled.
+        """
+        if self._cprofile:
+            self._cprofile.enable()
+
+    def stop(self) -> None:
+        """
+        Stops cProfile, if enabled.
+        """
+        if self._cprofile:
+            self._cprofile.disable()
+
+    def dump(self, path: str) -> Optional[str]:
+        """
+        Writes the cProfile statistics.
+        :return: The path written to, None without cProfile.
+        """
+        if not self._cprofile:
+            return None
+        self._cprofile.dump_stats(path)
+        return path
+
+    def to_dict(self) -> dict:
+        """
+        :return: Stage timings in seconds and counters, in recording order.
+        """
+        return {
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+        }
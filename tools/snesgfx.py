@@ -0,0 +1,247 @@
+"""
+Helpers for SNES character (tile) data shared by the converters.
+
+Planar character format
+=======================
+The SNES stores an 8x8 character as bitplanes grouped in pairs. For every
+pair of planes, each of the 8 rows is stored as two bytes (low plane first):
+
+    2bpp: [p0 r0, p1 r0, p0 r1, p1 r1, ... p0 r7, p1 r7]              16 bytes
+    4bpp: 2bpp planes 0/1, followed by 2bpp planes 2/3                  32 bytes
+    8bpp: 2bpp planes 0/1, 2/3, 4/5, then 6/7                           64 bytes
+
+The leftmost pixel of a row is the most significant bit of each plane byte.
+
+Sheets
+======
+A sheet is a sequence of characters laid out left to right, top to bottom,
+in rows of a fixed number of characters (16 for a 128 pixel wide sheet).
+Larger tiles (16x16 BG tiles, 32x32 objects) are made of neighboring
+characters of the sheet.
+
+Flips
+=====
+Flip variants are numbered so they compose with XOR:
+
+    0 = none, 1 = horizontal, 2 = vertical, 3 = both
+
+Depths
+======
+The depth of a background is fixed by the BG mode (see BG_MODE_BPP), and
+objects are always 4bpp. min_bpp() tells which depth the colors of a set of
+characters need, and convert_planar() moves characters between depths.
+"""
+import numpy as np
+
+from typing import Tuple
+
+
+FLIP_NONE = 0
+FLIP_H = 1
+FLIP_V = 2
+FLIP_HV = FLIP_H | FLIP_V
+
+CHAR_SIZE = 8
+"""Width and height of a character in pixels."""
+
+BG_MODE_BPP = {
+    0: (2, 2, 2, 2),
+    1: (4, 4, 2),
+    2: (4, 4),
+    3: (8, 4),
+    4: (8, 2),
+    5: (4, 2),
+    6: (4,),
+}
+"""Bits per pixel of BG1, BG2, ... in every BG mode. Mode 7 is not planar."""
+
+OBJ_BPP = 4
+"""Bits per pixel of object (sprite) characters."""
+
+
+def char_bytes(bpp: int) -> int:
+    """
+    :param bpp: Bits per pixel (2, 4 or 8).
+    :return: Number of bytes of a single character.
+    """
+    if bpp not in (2, 4, 8):
+        raise ValueError(f"Unsupported bpp: {bpp}")
+    return CHAR_SIZE * bpp
+
+
+def decode_planar(data: bytes, bpp: int) -> np.ndarray:
+    """
+    Decodes planar character data into color indices.
+    :param data: Planar character data, a multiple of char_bytes(bpp).
+    :param bpp: Bits per pixel (2, 4 or 8).
+    :return: Array of shape (num_chars, 8, 8) with the color index per pixel.
+    """
+    size = char_bytes(bpp)
+    raw = np.frombuffer(bytes(data), dtype=np.uint8)
+    if len(raw) % size:
+        raise ValueError(f"{len(raw)} bytes is not a multiple of {size}")
+
+    # (char, plane pair, row, plane in pair) -> bits along the columns
+    pairs = raw.reshape(-1, bpp // 2, CHAR_SIZE, 2)
+    bits = np.unpackbits(pairs[..., None], axis=-1)
+
+    # (char, plane, row, column)
+    planes = bits.transpose(0, 1, 3, 2, 4).reshape(-1, bpp, CHAR_SIZE, CHAR_SIZE)
+    weights = (1 << np.arange(bpp, dtype=np.uint16)).reshape(1, bpp, 1, 1)
+    return (planes.astype(np.uint16) * weights).sum(axis=1).astype(np.uint8)
+
+
+def encode_planar(chars: np.ndarray, bpp: int) -> bytes:
+    """
+    Encodes color indices into planar character data.
+    :param chars: Array of shape (num_chars, 8, 8) with color indices.
+    :param bpp: Bits per pixel (2, 4 or 8).
+    :return: Planar character data.
+    """
+    char_bytes(bpp)
+    chars = np.asarray(chars, dtype=np.uint8)
+    if chars.size and int(chars.max()) >= (1 << bpp):
+        raise ValueError(f"Color index {int(chars.max())} does not fit {bpp}bpp")
+
+    # (char, plane, row, column) -> (char, plane, row) bytes
+    shifts = np.arange(bpp, dtype=np.uint8).reshape(1, bpp, 1, 1)
+    planes = (chars[:, None, :, :] >> shifts) & 1
+    rows = np.packbits(planes, axis=-1)[..., 0]
+
+    # (char, plane pair, plane in pair, row) -> (char, plane pair, row, plane in pair)
+    pairs = rows.reshape(-1, bpp // 2, 2, CHAR_SIZE).transpose(0, 1, 3, 2)
+    return np.ascontiguousarray(pairs).tobytes()
+
+
+def min_bpp(chars: np.ndarray) -> int:
+    """
+    :param chars: Array of color indices, e.g. of shape (num_chars, 8, 8).
+    :return: The smallest depth (2, 4 or 8) that holds every color index.
+    """
+    chars = np.asarray(chars)
+    top = int(chars.max()) if chars.size else 0
+    return next(bpp for bpp in (2, 4, 8) if top < (1 << bpp))
+
+
+def convert_planar(data: bytes, bpp: int, new_bpp: int) -> bytes:
+    """
+    Re-encodes planar character data at another depth.
+    :param data: Planar character data at bpp.
+    :param bpp: Bits per pixel of data.
+    :param new_bpp: Bits per pixel of the result.
+    :return: The same characters at new_bpp. Raises ValueError if a color
+        index does not fit new_bpp.
+    """
+    if bpp == new_bpp:
+        return bytes(data)
+    return encode_planar(decode_planar(data, bpp), new_bpp)
+
+
+def chars_to_image(chars: np.ndarray, chars_per_row: int) -> np.ndarray:
+    """
+    Lays out characters as a sheet image. Missing characters are zero.
+    :param chars: Array of shape (num_chars, 8, 8).
+    :param chars_per_row: Number of characters per sheet row.
+    :return: Array of shape (rows * 8, chars_per_row * 8).
+    """
+    num_rows = -(-len(chars) // chars_per_row)
+    padded = np.zeros((num_rows * chars_per_row, CHAR_SIZE, CHAR_SIZE), dtype=np.uint8)
+    padded[:len(chars)] = chars
+    return (padded.reshape(num_rows, chars_per_row, CHAR_SIZE, CHAR_SIZE)
+                  .transpose(0, 2, 1, 3)
+                  .reshape(num_rows * CHAR_SIZE, chars_per_row * CHAR_SIZE))
+
+
+def image_to_chars(image: np.ndarray) -> np.ndarray:
+    """
+    Splits a sheet image into characters, left to right, top to bottom.
+    :param image: Array whose dimensions are multiples of 8.
+    :return: Array of shape (num_chars, 8, 8).
+    """
+    height, width = image.shape
+    if height % CHAR_SIZE or width % CHAR_SIZE:
+        raise ValueError(f"{width}x{height} is not a multiple of {CHAR_SIZE}")
+    return (image.reshape(height // CHAR_SIZE, CHAR_SIZE, width // CHAR_SIZE, CHAR_SIZE)
+                 .transpose(0, 2, 1, 3)
+                 .reshape(-1, CHAR_SIZE, CHAR_SIZE))
+
+
+def image_to_blocks(image: np.ndarray, block_w: int, block_h: int) -> np.ndarray:
+    """
+    Splits a sheet image into blocks (e.g. 16x16 tiles), left to right,
+    top to bottom.
+    :return: Array of shape (num_blocks, block_h, block_w).
+    """
+    height, width = image.shape
+    rows, cols = height // block_h, width // block_w
+    return (image[:rows * block_h, :cols * block_w]
+            .reshape(rows, block_h, cols, block_w)
+            .transpose(0, 2, 1, 3)
+            .reshape(-1, block_h, block_w))
+
+
+def blocks_to_image(blocks: np.ndarray, blocks_per_row: int) -> np.ndarray:
+    """
+    Lays out blocks as a sheet image. Missing blocks are zero.
+    :param blocks: Array of shape (num_blocks, block_h, block_w).
+    :param blocks_per_row: Number of blocks per sheet row.
+    :return: Array of shape (rows * block_h, blocks_per_row * block_w).
+    """
+    num, block_h, block_w = blocks.shape
+    num_rows = -(-num // blocks_per_row)
+    padded = np.zeros((num_rows * blocks_per_row, block_h, block_w), dtype=np.uint8)
+    padded[:num] = blocks
+    return (padded.reshape(num_rows, blocks_per_row, block_h, block_w)
+                  .transpose(0, 2, 1, 3)
+                  .reshape(num_rows * block_h, blocks_per_row * block_w))
+
+
+def flip_variants(blocks: np.ndarray) -> np.ndarray:
+    """
+    :param blocks: Array of shape (num_blocks, h, w).
+    :return: Array of shape (num_blocks, 4, h, w) indexed by flip.
+    """
+    return np.stack([blocks,
+                     blocks[:, :, ::-1],
+                     blocks[:, ::-1, :],
+                     blocks[:, ::-1, ::-1]], axis=1)
+
+
+def dedupe_blocks(blocks: np.ndarray, flips: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Collapses identical blocks, and optionally blocks that are flips of each
+    other. Every block is represented by the first block of its group in its
+    original orientation, so unique blocks keep their order of appearance.
+
+    :param blocks: Array of shape (num_blocks, h, w).
+    :param flips: Whether flipped blocks are considered equal.
+    :return: (unique, index, flip) where unique holds the indices of the
+        representative blocks and block i equals
+        flip_variants(blocks[unique])[index[i], flip[i]].
+    """
+    num = len(blocks)
+    if not num:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, empty.astype(np.uint8)
+
+    variants = flip_variants(blocks) if flips else blocks[:, None]
+    rows = np.ascontiguousarray(variants.reshape(num * variants.shape[1], -1))
+    _, ranks = np.unique(rows, axis=0, return_inverse=True)
+    ranks = ranks.reshape(num, variants.shape[1])
+
+    # Equal blocks share the same smallest variant, and the variant that
+    # reaches it tells how the block is flipped relative to that canonical form
+    canonical = ranks.min(axis=1)
+    to_canonical = ranks.argmin(axis=1).astype(np.uint8)
+
+    # Groups are numbered by first appearance
+    _, first, group = np.unique(canonical, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    index = renumber[group.reshape(-1)]
+    unique = first[order]
+
+    # Flips compose with XOR: block -> canonical -> representative
+    flip = to_canonical ^ to_canonical[unique][index]
+    return unique, index, flip
@@ -0,0 +1,135 @@
+"""
+RGB888 to SNES BGR555 palette conversion shared by the converters.
+
+Color format
+============
+A SNES color is a little-endian 16-bit word with red in the low bits:
+
+    bit  15  14-10  9-5    4-0
+         0   blue   green  red
+
+The .pal files written by pngsheet.py (or the SNES GFX Tool before it) hold
+3 bytes per color in R, G, B order. A channel is reduced to 5 bits by dropping its low 3 bits,
+exactly like OpenCV's COLOR_BGR2BGR555 that the converters used before.
+Decoding repeats the high bits of a channel in its low bits, so 31 becomes
+255.
+
+    words = encode_bgr555(rgb)          # (..., 3) uint8 -> (...) uint16
+    data = rgb_to_bgr555(pal_bytes)     # .pal bytes -> 2 bytes per color
+
+Any number of palettes can be converted at once by stacking them along the
+leading axes, see rgb_to_bgr555_batch().
+
+Quantization
+============
+quantize() reduces the colors of an image to a palette of at most N colors.
+Colors are first reduced to BGR555, so colors the SNES cannot tell apart
+share an entry. If more than N remain they are split by median cut,
+weighted by the number of pixels of every color.
+"""
+import numpy as np
+
+from typing import List, Sequence, Tuple
+
+
+def encode_bgr555(rgb: np.ndarray) -> np.ndarray:
+    """
+    :param rgb: (..., 3) array of 8-bit R, G, B channels.
+    :return: (...) array of BGR555 words.
+    """
+    rgb = np.asarray(rgb, dtype=np.uint8)
+    if rgb.shape[-1:] != (3,):
+        raise ValueError(f'Expected (..., 3) RGB colors, got shape {rgb.shape}')
+    r, g, b = (rgb[..., i].astype(np.uint16) >> 3 for i in range(3))
+    return r | (g << 5) | (b << 10)
+
+
+def decode_bgr555(words: np.ndarray) -> np.ndarray:
+    """
+    :param words: (...) array of BGR555 words, bit 15 is ignored.
+    :return: (..., 3) array of 8-bit R, G, B channels.
+    """
+    words = np.asarray(words, dtype=np.uint16)
+    channels = np.stack([(words >> shift) & 0x1F for shift in (0, 5, 10)], axis=-1)
+    return ((channels << 3) | (channels >> 2)).astype(np.uint8)
+
+
+def rgb_to_bgr555(rgbpal: bytes) -> np.ndarray:
+    """
+    :param rgbpal: Colors as R, G, B bytes, e.g. the contents of a .pal file.
+    :return: Two little-endian bytes per color.
+    """
+    rgb = np.frombuffer(rgbpal, dtype=np.uint8).reshape(-1, 3)
+    return encode_bgr555(rgb).astype('<u2').view(np.uint8)
+
+
+def bgr555_to_rgb(data: bytes) -> np.ndarray:
+    """
+    :param data: Two little-endian bytes per color, as written by rgb_to_bgr555().
+    :return: (n, 3) array of 8-bit R, G, B channels.
+    """
+    return decode_bgr555(np.frombuffer(data, dtype='<u2'))
+
+
+def rgb_to_bgr555_batch(palettes: Sequence[bytes]) -> List[np.ndarray]:
+    """
+    Converts many palettes in a single pass.
+    :param palettes: Colors of every palette as R, G, B bytes.
+    :return: Two little-endian bytes per color, one array per palette.
+    """
+    if not palettes:
+        return []
+    data = rgb_to_bgr555(b''.join(palettes))
+    ends = np.cumsum([len(rgb) // 3 * 2 for rgb in palettes])
+    return np.split(data, ends[:-1])
+
+
+def quantize(rgb: np.ndarray, max_colors: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduces colors to a palette in BGR555 space.
+    :param rgb: (..., 3) array of 8-bit R, G, B channels, e.g. the pixels of an image.
+    :param max_colors: Maximum number of palette colors.
+    :return: (palette, index) where palette is a (k, 3) array of 8-bit R, G, B
+        channels with k <= max_colors and index has the shape of rgb[..., 0]
+        with the palette entry of every color.
+    """
+    words = encode_bgr555(rgb)
+    colors, inverse, counts = np.unique(words.ravel(), return_inverse=True,
+                                        return_counts=True)
+    inverse = inverse.reshape(words.shape)
+    if len(colors) <= max_colors:
+        return decode_bgr555(colors), inverse.astype(np.intp)
+
+    # Median cut: split the box with the widest channel at the pixel median
+    # of that channel until there are enough boxes
+    channels = np.stack([(colors >> shift) & 0x1F for shift in (0, 5, 10)],
+                        axis=-1).astype(np.int32)
+
+    def spread(box: np.ndarray) -> Tuple[int, int]:
+        extent = channels[box].max(axis=0) - channels[box].min(axis=0)
+        return int(extent.max()), int(extent.argmax())
+
+    boxes = [np.arange(len(colors))]
+    spreads = [spread(boxes[0])]
+    while len(boxes) < max_colors:
+        widest = max(range(len(boxes)), key=lambda i: spreads[i][0])
+        if spreads[widest][0] == 0:
+            break
+        box = boxes[widest]
+        box = box[np.argsort(channels[box, spreads[widest][1]], kind='stable')]
+        weight = np.cumsum(counts[box])
+        split = int(np.searchsorted(weight, weight[-1] / 2))
+        split = min(max(split, 1), len(box) - 1)
+        halves = [box[:split], box[split:]]
+        boxes[widest:widest + 1] = halves
+        spreads[widest:widest + 1] = [spread(half) for half in halves]
+
+    # Every box becomes the weighted mean of its colors
+    entry = np.empty(len(colors), dtype=np.intp)
+    palette = np.empty((len(boxes), 3), dtype=np.uint16)
+    for i, box in enumerate(boxes):
+        entry[box] = i
+        mean = np.average(channels[box], axis=0, weights=counts[box])
+        palette[i] = np.rint(mean).astype(np.uint16)
+    palette = palette[:, 0] | (palette[:, 1] << 5) | (palette[:, 2] << 10)
+    return decode_bgr555(palette), entry[inverse]
@@ -0,0 +1,322 @@
+"""
+Scanline sprite-overflow analyzer for converted sprites.
+
+What this script checks
+=======================
+The PPU evaluates at most 32 objects per scanline ("range over") and draws
+at most 34 8-pixel slivers of them ("time over"). Anything past that is
+dropped for that line, which shows up as flicker or missing sprite parts.
+
+For every tag and frame of a sprite, the objects of all layers are laid
+out exactly as asesprite2bin builds them and counted per scanline:
+
+    objects[y]  Objects whose rows include line y of the sprite
+    slivers[y]  Sum of (object width / 8) over those objects
+
+Scenes
+======
+Sprites rarely appear alone, so --scene combines several sprites that can be
+on screen at the same time, e.g. `--scene plane,plane,boss`. Each instance
+may show any of its frames. Without a position the instances are assumed to
+line up their worst scanlines, which is the worst case for free moving
+sprites. A fixed vertical position can be given as `name@y` with y in 0-255,
+in which case the worst frame of each instance is taken per line of the
+screen.
+
+Output
+======
+A JSON report is written to stdout (or --output) and the script exits with
+status 1 when any frame or scene exceeds --max-objects or --max-slivers.
+Like the batch mode of asesprite2bin, a sprite that fails to convert is
+listed under "failed" with its error, the other sprites are still analyzed
+and the exit status is 1.
+
+Usage
+=====
+    python tools/spritecheck.py -a resources/sprites
+    python tools/spritecheck.py -a resources/sprites --scene plane,plane,boss
+    python tools/spritecheck.py -i resources/sprites/plane --scene plane@0,plane@40
+"""
+import json
+import logging
+import sys
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import asesprite2bin
+
+
+logger = logging.getLogger('spritecheck')
+
+MAX_OBJECTS_PER_LINE = 32
+"""Objects the PPU evaluates per scanline."""
+
+MAX_SLIVERS_PER_LINE = 34
+"""8-pixel object slivers the PPU draws per scanline."""
+
+NUM_LINES = 256
+"""Lines of a sprite, object positions relative to a layer are a byte."""
+
+
+@dataclass
+class FrameProfile:
+    """
+    Per scanline object and sliver counts of a single frame.
+    """
+    tag: str = ""                # Name of the tag
+    frame: int = 0               # Index of the frame in the tag
+    objects: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    slivers: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+
+    def to_dict(self) -> dict:
+        height = int(np.flatnonzero(self.objects)[-1]) + 1 if self.objects.any() else 0
+        return {
+            'tag': self.tag,
+            'frame': self.frame,
+            'objects': int(self.objects.max(initial=0)),
+            'slivers': int(self.slivers.max(initial=0)),
+            'line': int(np.argmax(self.slivers)) if height else 0,
+            'objects_per_line': self.objects[:height].tolist(),
+            'slivers_per_line': self.slivers[:height].tolist(),
+        }
+
+
+@dataclass
+class SpriteProfile:
+    """
+    Scanline profiles of every frame of a sprite.
+    """
+    name: str = ""
+    frames: List[FrameProfile] = field(default_factory=list)
+
+    def envelope(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (objects, slivers) with the worst frame per line.
+        """
+        if not self.frames:
+            empty = np.zeros(NUM_LINES, dtype=np.int32)
+            return empty, empty
+        return (np.max([f.objects for f in self.frames], axis=0),
+                np.max([f.slivers for f in self.frames], axis=0))
+
+    def peak(self) -> Tuple[int, int]:
+        """
+        :return: (objects, slivers) on the worst line of the worst frame.
+        """
+        return (max((int(f.objects.max()) for f in self.frames), default=0),
+                max((int(f.slivers.max()) for f in self.frames), default=0))
+
+
+def profile_frame(frame: "asesprite2bin.FrameHeader",
+                  sizes: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts the objects and slivers of a frame on every line.
+    :param frame: Frame with its layers and tiles.
+    :param sizes: Small and large object sizes in pixels.
+    :return: (objects, slivers) arrays indexed by the line of the sprite.
+    """
+    objects = np.zeros(NUM_LINES + sizes[1], dtype=np.int32)
+    slivers = np.zeros(NUM_LINES + sizes[1], dtype=np.int32)
+    for layer in frame.layer_data:
+        for tile in layer.tile_data:
+            large = tile.oam_size & asesprite2bin.Helpers.OAM_SIZE_MASK
+            size = sizes[1] if large else sizes[0]
+            top = layer.ry + tile.ry
+            objects[top:top + size] += 1
+            slivers[top:top + size] += size // 8
+    return objects[:NUM_LINES], slivers[:NUM_LINES]
+
+
+def profile_sprite(name: str, header: "asesprite2bin.SpriteHeader",
+                   sizes: Tuple[int, int]) -> SpriteProfile:
+    """
+    :param name: Name of the sprite.
+    :param header: Sprite built by asesprite2bin.
+    :param sizes: Small and large object sizes in pixels.
+    :return: Profiles of every frame of every tag.
+    """
+    profile = SpriteProfile(name)
+    for tag in header.tag_data:
+        for i, frame in enumerate(tag.frame_data):
+            objects, slivers = profile_frame(frame, sizes)
+            profile.frames.append(FrameProfile(tag.name, i, objects, slivers))
+    return profile
+
+
+def parse_scene(scene: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    :param scene: Comma separated sprite names, each optionally name@y.
+    :return: List of (name, y) with y None for a free moving sprite.
+    :raises ValueError: If a position is not a line of the screen.
+    """
+    instances = []
+    for item in scene.split(','):
+        name, _, y = item.strip().partition('@')
+        if not y:
+            instances.append((name, None))
+            continue
+        if not y.isdigit() or int(y) >= NUM_LINES:
+            raise ValueError(f"Invalid position {item.strip()} in scene {scene}, "
+                             f"y must be 0-{NUM_LINES - 1}")
+        instances.append((name, int(y)))
+    return instances
+
+
+def profile_scene(instances: List[Tuple[str, Optional[int]]],
+                  profiles: Dict[str, SpriteProfile]) -> dict:
+    """
+    Evaluates the worst scanline of sprites that are on screen together.
+    Free moving sprites line up their worst lines with the worst line of
+    the positioned sprites.
+    :param instances: From parse_scene().
+    :param profiles: Sprite profiles by name.
+    :return: Worst objects and slivers, and the line of the positioned part.
+    """
+    placed_objects = np.zeros(NUM_LINES * 2, dtype=np.int32)
+    placed_slivers = np.zeros(NUM_LINES * 2, dtype=np.int32)
+    free_objects = free_slivers = 0
+    for name, y in instances:
+        if name not in profiles:
+            raise KeyError(f"Scene sprite {name} was not analyzed")
+        profile = profiles[name]
+        if y is None:
+            objects, slivers = profile.peak()
+            free_objects += objects
+            free_slivers += slivers
+            continue
+        objects, slivers = profile.envelope()
+        placed_objects[y:y + NUM_LINES] += objects
+        placed_slivers[y:y + NUM_LINES] += slivers
+
+    line = int(np.argmax(placed_slivers))
+    return {
+        'objects': int(placed_objects.max()) + free_objects,
+        'slivers': int(placed_slivers.max()) + free_slivers,
+        'line': line,
+    }
+
+
+def analyze(sprite_dirs: List[Path], scenes: List[str],
+            options: "asesprite2bin.ConversionOptions",
+            max_objects: int, max_slivers: int) -> dict:
+    """
+    Builds every sprite, profiles its frames and evaluates the scenes.
+    :return: The report, with "ok" False when a budget is exceeded. Sprites
+        that failed to convert are listed with their error under "failed".
+    """
+    report = {
+        'limits': {'objects': max_objects, 'slivers': max_slivers},
+        'sprites': {},
+        'scenes': [],
+        'failed': {},
+        'ok': True,
+    }
+
+    profiles = {}
+    for sprite_dir in sprite_dirs:
+        try:
+            header = asesprite2bin.AsepriteParser(sprite_dir, options).sprite_header
+        except Exception as e:
+            logger.error('Failed to convert %s: %s: %s', sprite_dir.name, type(e).__name__, e)
+            report['failed'][sprite_dir.name] = f"{type(e).__name__}: {e}"
+            continue
+        profile = profile_sprite(sprite_dir.name, header, options.oam_sizes)
+        profiles[profile.name] = profile
+
+        frames = [frame.to_dict() for frame in profile.frames]
+        objects, slivers = profile.peak()
+        over = objects > max_objects or slivers > max_slivers
+        report['sprites'][profile.name] = {
+            'objects': objects,
+            'slivers': slivers,
+            'over': over,
+            'frames': frames,
+        }
+        for frame in frames:
+            if frame['objects'] > max_objects or frame['slivers'] > max_slivers:
+                logger.warning('%s %s frame %d: %d objects, %d slivers on line %d',
+                               profile.name, frame['tag'], frame['frame'],
+                               frame['objects'], frame['slivers'], frame['line'])
+        report['ok'] &= not over
+
+    for scene in scenes:
+        try:
+            result = profile_scene(parse_scene(scene), profiles)
+        except KeyError as e:
+            logger.error('Scene %s: %s', scene, e.args[0])
+            report['scenes'].append(dict(scene=scene, error=e.args[0]))
+            report['ok'] = False
+            continue
+        over = result['objects'] > max_objects or result['slivers'] > max_slivers
+        if over:
+            logger.warning('Scene %s: %d objects, %d slivers', scene,
+                           result['objects'], result['slivers'])
+        report['scenes'].append(dict(scene=scene, over=over, **result))
+        report['ok'] &= not over
+
+    return report
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Scanline sprite overflow analyzer",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python spritecheck.py -a resources/sprites --scene plane,plane,boss")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("-i", "--input", type=str, action="append",
+                        help="Sprite directory, may be repeated")
+    inputs.add_argument("-a", "--all", type=str,
+                        help="Analyze every sprite directory below this root")
+    parser.add_argument("--scene", type=str, action="append", default=[],
+                        help="Sprites on screen together as name[@y],...")
+    parser.add_argument("--max-objects", type=int, default=MAX_OBJECTS_PER_LINE)
+    parser.add_argument("--max-slivers", type=int, default=MAX_SLIVERS_PER_LINE)
+    parser.add_argument("-t", "--tessellate", choices=("size-group", "optimal"),
+                        default="size-group")
+    parser.add_argument("-s", "--oam-sizes", type=str, default="8,32")
+    parser.add_argument("-o", "--output", type=str,
+                        help="Write the report here instead of stdout")
+    parser.add_argument("-l", "--loglevel", type=str, default="WARNING")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.loglevel)
+    asesprite2bin.logger_build.setLevel(logging.WARNING)
+    asesprite2bin.logger_serialize.setLevel(logging.WARNING)
+
+    oam_sizes = tuple(int(size) for size in args.oam_sizes.split(","))
+    if oam_sizes not in asesprite2bin.Helpers.OAM_SIZE_PAIRS:
+        parser.error(f"Invalid OAM sizes: {args.oam_sizes}")
+    options = asesprite2bin.ConversionOptions(tessellate=args.tessellate,
+                                              oam_sizes=oam_sizes)
+
+    if args.all:
+        sprite_dirs = asesprite2bin.discover_sprites(Path(args.all).resolve())
+    else:
+        sprite_dirs = [Path(path).resolve() for path in args.input]
+
+    for scene in args.scene:
+        try:
+            parse_scene(scene)
+        except ValueError as e:
+            parser.error(str(e))
+
+    report = analyze(sprite_dirs, args.scene, options,
+                     args.max_objects, args.max_slivers)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+    return 0 if report['ok'] and not report['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
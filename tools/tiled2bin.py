@@ -4,11 +4,17 @@ See engine/map.asm for the format specification.
 """
 import pathlib
 import argparse
+import json
 import struct
-import pytmx
 import logging
-import cv2
 import numpy as np
+import pngsheet
+import snespal
+import snesgfx
+import tmxreader
+import warmcache
+
+from profiling import Profiler
 
 
 logger = logging.getLogger(__name__)
@@ -23,54 +29,89 @@ class Exporter:
         Initialize the tileset with default values.
         """
         self.data = []
+        self._num_bytes = None
         for name, fmt in self.fields:
             setattr(self, name, 0)
 
+    @classmethod
+    def header(cls) -> struct.Struct:
+        """
+        Return the compiled struct for the fields of this class.
+        Multi-byte fields such as '3B' are packed as fixed-size, zero padded
+        strings so the bytearray values can be passed as-is.
+        """
+        compiled = cls.__dict__.get('_header')
+        if compiled is None:
+            pack_str = '<'
+            for _, fmt in cls.fields:
+                if fmt.endswith('B') and fmt[:-1]:
+                    fmt = fmt[:-1] + 's'
+                pack_str += fmt
+            compiled = struct.Struct(pack_str)
+            cls._header = compiled
+        return compiled
+
     def append(self, obj) -> None:
         """
         Append data to the end of the struct.
         """
         self.data.append(obj)
+        self._num_bytes = None
 
-    def pack(self) -> bytes:
+    def extend(self, payload) -> None:
         """
-        Pack the object into a binary string based on the fields.
-        Appends the data as bytes to the end of the string.
+        Append a raw payload (bytes, bytearray or numpy array) to the end of
+        the struct. The payload is copied in bulk when packing.
+        """
+        self.data.append(bytes(payload))
+        self._num_bytes = None
+
+    def pack_into(self, buffer: bytearray, offset: int) -> int:
         """
-        # Initially create the pack string with the fields.
-        pack_str = ''.join(fmt for _, fmt in self.fields)
+        Pack the fields and then the data into the buffer at offset.
+        Returns the offset just past the packed data.
+        """
+        header = self.header()
+        header.pack_into(buffer, offset,
+                         *(getattr(self, name) for name, _ in self.fields))
+        offset += header.size
 
-        # Pack the data from the children.
-        packed_data = bytearray([])
         for obj in self.data:
             if isinstance(obj, Exporter):
-                packed_data.extend(obj.pack())
-            else:
-                packed_data.extend(bytearray([obj]))
-
-        # Add the data to the end of the pack string.
-        pack_str += f'{len(packed_data)}B'
-        
-        all_data = []
-        for name, width in self.fields:
-            obj = getattr(self, name)
-            if isinstance(obj, bytearray):
-                width = int(width.replace('B', ''))
-                all_data.extend(obj)
-                if len(obj) < width:
-                    for i in range(width - len(obj)):
-                        all_data.append(0)
+                offset = obj.pack_into(buffer, offset)
+            elif isinstance(obj, int):
+                buffer[offset] = obj
+                offset += 1
             else:
-                all_data.append(obj)
-        all_data.extend(packed_data)
+                buffer[offset:offset + len(obj)] = obj
+                offset += len(obj)
+        return offset
 
-        return struct.pack(pack_str, *all_data)
+    def pack(self) -> bytes:
+        """
+        Pack the object into a binary string based on the fields.
+        Appends the data as bytes to the end of the string.
+        """
+        buffer = bytearray(self.num_bytes())
+        self.pack_into(buffer, 0)
+        return bytes(buffer)
 
     def num_bytes(self) -> int:
         """
         Return the number of bytes that will be written to the file.
+        The size is cached until more data is appended.
         """
-        return len(self.pack())
+        if self._num_bytes is None:
+            size = self.header().size
+            for obj in self.data:
+                if isinstance(obj, Exporter):
+                    size += obj.num_bytes()
+                elif isinstance(obj, int):
+                    size += 1
+                else:
+                    size += len(obj)
+            self._num_bytes = size
+        return self._num_bytes
 
 
 class Tile(Exporter):
@@ -79,6 +120,9 @@ class Tile(Exporter):
         ('index', 'H'),
     ]
 
+    # The same layout as an array, for writing all tiles of a layer at once
+    DTYPE = np.dtype([('id', '<u2'), ('index', '<u2')])
+
     def __init__(self, pk, version, index):
         super().__init__()
         self.id = pk
@@ -90,6 +134,146 @@ class Background(Exporter):
         ('num_tiles', 'H'),
     ]
 
+    # The low byte of the id is the layer (1..4), the high byte holds flags.
+    # A dense background is a full tilemap word array laid out exactly as
+    # VRAM expects it at the tilemap base, and num_tiles is the word count.
+    FLAG_DENSE = 0x0100
+
+    # A metatile background is a grid of indices into the map's MetatileSet
+    # and num_tiles is the number of grid cells.
+    FLAG_METATILE = 0x0200
+
+    # Non-empty cells of a layer: position in the map and tilemap word
+    CELL_DTYPE = np.dtype([('x', np.int64), ('y', np.int64), ('ntid', np.int64)])
+
+    # Tilemaps are made out of 32x32 screens of 16-bit words
+    SCREEN_SIZE = 32
+
+    # The SNES supports up to 2x2 screens, but docs/vram-layout.md reserves
+    # 2 KB (one screen) per BG tilemap and bg.asm sets BGxSC to 32x32.
+    MAX_SCREENS = 1
+
+    @classmethod
+    def screens(cls, width: int, height: int) -> tuple:
+        """
+        Return the number of 32x32 screens (horizontal, vertical) needed to
+        hold a width x height tilemap, at most MAX_SCREENS each way.
+        """
+        screens_w = -(-width // cls.SCREEN_SIZE)
+        screens_h = -(-height // cls.SCREEN_SIZE)
+        if screens_w > cls.MAX_SCREENS or screens_h > cls.MAX_SCREENS:
+            size = cls.SCREEN_SIZE * cls.MAX_SCREENS
+            raise ValueError(f'{width}x{height} does not fit the {size}x{size} '
+                             f'tilemap of a BG')
+        return screens_w, screens_h
+
+    @classmethod
+    def vram_index(cls, x, y, screens_w: int):
+        """
+        Return the word index of the cell (x, y) in the tilemap, for single
+        cells or arrays of them. Screens are stored one after another:
+        top-left, top-right, bottom-left, bottom-right.
+        """
+        size = cls.SCREEN_SIZE
+        screen = (y // size) * screens_w + (x // size)
+        return screen * size * size + (y % size) * size + (x % size)
+
+    def load_sparse(self, cells: np.ndarray) -> None:
+        """
+        Emit one Tile(id, index) record per non-empty cell.
+        """
+        tiles = np.empty(len(cells), dtype=Tile.DTYPE)
+        tiles['id'] = cells['ntid']
+        tiles['index'] = (cells['y'] * 0x20) + cells['x'] # (HACK): Hardcoded map size and assumes 8x8
+        self.extend(tiles.tobytes())
+        self.num_tiles = len(cells)
+
+    def load_dense(self, cells: np.ndarray, width: int, height: int) -> None:
+        """
+        Emit the whole tilemap as one word array so it can be uploaded with a
+        single DMA. Empty cells are written as character 0.
+        """
+        screens_w, screens_h = self.screens(width, height)
+        words = np.zeros(screens_w * screens_h * self.SCREEN_SIZE ** 2, dtype='<u2')
+        words[self.vram_index(cells['x'], cells['y'], screens_w)] = cells['ntid']
+        self.extend(words.tobytes())
+        self.id |= self.FLAG_DENSE
+        self.num_tiles = len(words)
+
+    def load_metatiles(self, grid: np.ndarray, index_bytes: int) -> None:
+        """
+        Emit the grid of metatile indices in row-major order.
+        """
+        dtype = np.uint8 if index_bytes == 1 else np.dtype('<u2')
+        self.extend(grid.astype(dtype).tobytes())
+        self.id |= self.FLAG_METATILE
+        self.num_tiles = grid.size
+
+    @staticmethod
+    def grid(cells: np.ndarray, width: int, height: int) -> np.ndarray:
+        """
+        Return the tile ids of the layer as a height x width array.
+        """
+        grid = np.zeros((height, width), dtype=np.uint16)
+        grid[cells['y'], cells['x']] = cells['ntid']
+        return grid
+
+
+class MetatileSet(Exporter):
+    """
+    Dictionary of the unique size x size blocks of tile ids shared by every
+    metatile background. Metatile 0 is always the empty block.
+    """
+    fields = [
+        ('magic', '3B'),
+        ('size', 'B'),
+        ('index_bytes', 'B'),
+        ('num_metatiles', 'H'),
+    ]
+
+    def __init__(self, size: int):
+        super().__init__()
+        self.magic = bytearray(b'MTS')
+        self.size = size
+
+    def blocks(self, grid: np.ndarray) -> tuple:
+        """
+        Split a tile id grid into rows of size * size tile ids, one row per
+        block in row-major block order. The grid is padded with empty tiles.
+        """
+        n = self.size
+        height, width = grid.shape
+        padded = np.zeros((-(-height // n) * n, -(-width // n) * n), dtype=grid.dtype)
+        padded[:height, :width] = grid
+        rows, cols = padded.shape[0] // n, padded.shape[1] // n
+        return (padded.reshape(rows, n, cols, n)
+                      .transpose(0, 2, 1, 3)
+                      .reshape(rows * cols, n * n)), (rows, cols)
+
+    def build(self, grids: list) -> list:
+        """
+        Find the unique blocks across all grids and return the grid of
+        metatile indices for each of them.
+        """
+        split = [self.blocks(grid) for grid in grids]
+        empty = np.zeros((1, self.size * self.size), dtype=np.uint16)
+        all_blocks = np.concatenate([empty] + [blocks for blocks, _ in split])
+
+        # The empty block sorts first, so it is always metatile 0
+        unique, inverse = np.unique(all_blocks, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)[1:]
+
+        self.num_metatiles = len(unique)
+        self.index_bytes = 1 if self.num_metatiles <= 0x100 else 2
+        self.extend(unique.astype('<u2').tobytes())
+
+        index_grids = []
+        start = 0
+        for blocks, shape in split:
+            index_grids.append(inverse[start:start + len(blocks)].reshape(shape))
+            start += len(blocks)
+        return index_grids
+
 
 class SpriteSheet(Exporter):
     fields = [
@@ -127,16 +311,210 @@ class Map(Exporter):
         ('object_offset', 'H'),
     ]
 
-    def __init__(self, tmx_map):
+    # Map format version, bumped when any background is dense
+    VERSION_SPARSE = 1
+    VERSION_DENSE = 2
+    VERSION_METATILE = 3
+
+    # Tilemap word flip bits
+    TILE_FLIP_H = 0x4000
+    TILE_FLIP_V = 0x8000
+
+    # Characters per row of the sheet (a 128 pixel wide sheet)
+    SHEET_CHARS_PER_ROW = 16
+
+    # Depth of the sheet when no layer is on a BG of the BG mode
+    DEFAULT_BPP = 4
+
+    # engine/map.asm loads every map sheet as mode 1 BG1/BG2 characters, so
+    # other depths only show correctly once the engine sets up their BGs
+    ENGINE_BPP = 4
+
+    # Tilemap word bits of the character number
+    TILE_CHAR_MASK = 0x3FF
+
+    def __init__(self, tmx_map, bg_encoding='sparse', dense_threshold=0.5,
+                 metatile_size=2, optimize_tiles=False, bpp='auto', bg_mode=1,
+                 engine_check=True, profiler=None):
+        """
+        :param tmx_map: Path to the Tiled map.
+        :param bg_encoding: 'sparse', 'dense', 'auto' to pick per layer, or
+            'metatile' to share a dictionary of blocks across all layers.
+        :param dense_threshold: Occupancy at which 'auto' picks dense. At 0.5
+            a 32x32 dense tilemap is the same size as the sparse tiles.
+        :param metatile_size: Width and height of a metatile in tiles.
+        :param optimize_tiles: Remove duplicate and mirrored tiles from the
+            sheet and use the tilemap flip bits instead.
+        :param bpp: Bits per pixel of the sheet (2, 4 or 8), or 'auto' for the
+            depth of the BGs of the layers in bg_mode.
+        :param bg_mode: BG mode the map is shown in, see snesgfx.BG_MODE_BPP.
+        :param engine_check: Only write sheets of ENGINE_BPP, the depth the
+            engine loads. 'auto' falls back to it, a forced bpp raises.
+        :param profiler: Records the time of every stage of load().
+        """
         super().__init__()
+        self.bg_encoding = bg_encoding
+        self.dense_threshold = dense_threshold
+        self.metatile_size = metatile_size
+        self.optimize_tiles = optimize_tiles
+        self.bpp = bpp
+        self.bg_mode = bg_mode
+        self.engine_check = engine_check
+        self.profiler = profiler or Profiler.disabled()
         self.load(tmx_map)
 
+    def is_dense(self, num_tiles: int) -> bool:
+        """
+        Return whether a background with num_tiles non-empty cells should be
+        written as a dense tilemap. Auto keeps maps larger than the tilemap
+        of a BG sparse.
+        """
+        if self.bg_encoding == 'auto':
+            size = Background.SCREEN_SIZE * Background.MAX_SCREENS
+            if self.width > size or self.height > size:
+                return False
+            return num_tiles >= self.dense_threshold * self.width * self.height
+        return self.bg_encoding == 'dense'
+
+    def load_metatiles(self, layers: list) -> MetatileSet:
+        """
+        Encode every background as a grid of indices into one shared
+        dictionary of metatiles and report the size against the other
+        encodings.
+        """
+        logger.warning('engine/map.asm does not load metatile backgrounds yet')
+        metatiles = MetatileSet(self.metatile_size)
+        grids = [Background.grid(cells, self.width, self.height) for _, cells in layers]
+        index_grids = metatiles.build(grids)
+        for (background, _), index_grid in zip(layers, index_grids):
+            background.load_metatiles(index_grid, metatiles.index_bytes)
+            logger.info('num_tiles: %s (metatile grid)', hex(background.num_tiles))
+        self.version = self.VERSION_METATILE
+
+        # Compare against the sparse and dense encodings of the same layers
+        header = Background.header().size
+        sparse = sum(header + Tile.header().size * len(cells) for _, cells in layers)
+        dense = sum(header + 2 * grid.size for grid in grids)
+        packed = sum(background.num_bytes() for background, _ in layers) + metatiles.num_bytes()
+        logger.info('metatiles: %d unique %dx%d blocks, %d bytes '
+                    '(sparse %d bytes, dense %d bytes, %.1f%% saved)',
+                    metatiles.num_metatiles, self.metatile_size, self.metatile_size,
+                    packed, sparse, dense, 100 * (1 - packed / min(sparse, dense)))
+        return metatiles
+
+    def load_optimized_tiles(self, layers: list, sheet_data: bytes, bpp: int) -> bytes:
+        """
+        Rewrite the sheet so it only holds the tiles used by the layers, with
+        duplicates and H/V/HV mirrored copies collapsed into one. The tile ids
+        of the layers are rewritten in place with the flip bits set.
+        Tile 0 always stays first, since empty cells in VRAM refer to it.
+        """
+        chars_per_row = self.SHEET_CHARS_PER_ROW
+        chars_w = self.tile_width // snesgfx.CHAR_SIZE
+        chars_h = self.tile_height // snesgfx.CHAR_SIZE
+
+        # Tiles are blocks of characters that start at the tile id
+        chars = snesgfx.decode_planar(sheet_data, bpp)
+        image = snesgfx.chars_to_image(chars, chars_per_row)
+        used = np.union1d([0], np.concatenate([cells['ntid'] for _, cells in layers]))
+        blocks = np.zeros((len(used), self.tile_height, self.tile_width), dtype=np.uint8)
+        for k, ntid in enumerate(used):
+            y = (ntid // chars_per_row) * snesgfx.CHAR_SIZE
+            x = (ntid % chars_per_row) * snesgfx.CHAR_SIZE
+            blocks[k] = image[y:y + self.tile_height, x:x + self.tile_width]
+
+        unique, index, flip = snesgfx.dedupe_blocks(blocks)
+
+        # Unique tiles are laid out in the same grid the tile ids assume
+        tiles_per_row = chars_per_row // chars_w
+        index = index.astype(np.int64)
+        remap = (index // tiles_per_row) * chars_per_row * chars_h
+        remap += (index % tiles_per_row) * chars_w
+        remap |= np.where(flip & snesgfx.FLIP_H, self.TILE_FLIP_H, 0)
+        remap |= np.where(flip & snesgfx.FLIP_V, self.TILE_FLIP_V, 0)
+
+        # used is sorted, so the position of a tile id in it is its block
+        for _, cells in layers:
+            cells['ntid'] = remap[np.searchsorted(used, cells['ntid'])]
+
+        optimized = snesgfx.blocks_to_image(blocks[unique], tiles_per_row)
+        data = snesgfx.encode_planar(snesgfx.image_to_chars(optimized), bpp)
+        logger.info('tiles: %d used, %d unique, %d flipped, sheet %d -> %d bytes',
+                    len(used), len(unique), int(np.count_nonzero(flip)),
+                    len(sheet_data), len(data))
+        return data
+
+    def bg_depth(self, layers: list) -> int:
+        """
+        Return the bits per pixel of the BGs of the layers in the BG mode.
+        All layers share one sheet, so the deepest BG wins if they differ.
+        """
+        depths = snesgfx.BG_MODE_BPP[self.bg_mode]
+        used = set()
+        for background, _ in layers:
+            if not 1 <= background.id <= len(depths):
+                logger.warning('BG%d does not exist in mode %d', background.id, self.bg_mode)
+                continue
+            used.add(depths[background.id - 1])
+        if len(used) > 1:
+            logger.warning('Layers on %s bpp BGs share one sheet, using %dbpp',
+                           '/'.join(str(depth) for depth in sorted(used)), max(used))
+        return max(used, default=self.DEFAULT_BPP)
+
+    def engine_bpp(self, bpp: int) -> int:
+        """
+        Return the depth to write when the engine can not load bpp. 'auto'
+        falls back to ENGINE_BPP, a forced depth raises unless engine_check
+        is off.
+        """
+        if bpp == self.ENGINE_BPP or not self.engine_check:
+            return bpp
+        if self.bpp == 'auto':
+            logger.warning('The engine only loads %dbpp BGs, using %dbpp instead of %dbpp',
+                           self.ENGINE_BPP, self.ENGINE_BPP, bpp)
+            return self.ENGINE_BPP
+        raise ValueError(f'engine/map.asm loads map sheets as {self.ENGINE_BPP}bpp BG1/BG2 '
+                         f'characters, a {bpp}bpp sheet would not display correctly '
+                         f'(use --no-engine-check to write it anyway)')
+
+    def check_bpp(self, layers: list, sheet_data: bytes, sheet_bpp: int, bpp: int) -> None:
+        """
+        Report the colors used by the tiles of every layer and check that the
+        sheet fits bpp, whether it was forced or picked from the BG mode.
+        """
+        chars = snesgfx.decode_planar(sheet_data, sheet_bpp)
+        top = chars.reshape(len(chars), -1).max(axis=1, initial=0)
+        chars_w = self.tile_width // snesgfx.CHAR_SIZE
+        chars_h = self.tile_height // snesgfx.CHAR_SIZE
+        offsets = np.array([y * self.SHEET_CHARS_PER_ROW + x
+                            for y in range(chars_h) for x in range(chars_w)])
+        for background, cells in layers:
+            ntids = cells['ntid'] & self.TILE_CHAR_MASK
+            ids = (ntids[:, None] + offsets).ravel()
+            colors = int(top[ids[ids < len(chars)]].max(initial=0)) + 1
+            logger.info('BG%d: %d colors (%dbpp)', background.id, colors,
+                        snesgfx.min_bpp(colors - 1))
+
+        if snesgfx.min_bpp(top) > bpp:
+            raise ValueError(f'The sheet uses {int(top.max()) + 1} colors, '
+                             f'more than {bpp}bpp allows')
+
     def rgb_to_bgr555(self, rgbpal: bytearray) -> bytearray:
         """
         Converts a byte array of RGB data to BGR555 bytearray.
+        See snespal.py for the channel order.
+        """
+        return snespal.rgb_to_bgr555(rgbpal)
+
+    def encode_sheet(self, sprite_sheet, missing, bpp: int) -> pngsheet.EncodedSheet:
+        """
+        Encodes the tileset image when its .bin or .pal was not exported.
+        See pngsheet.py.
         """
-        array = np.array([np.reshape(np.frombuffer(rgbpal, dtype=np.uint8), (-1, 3))])
-        return cv2.cvtColor(array, cv2.COLOR_BGR2BGR555).flatten()
+        if sprite_sheet.suffix.lower() != '.png' or not sprite_sheet.is_file():
+            raise FileNotFoundError(missing)
+        logger.info('%s does not exist, encoding %s', missing.name, sprite_sheet)
+        return pngsheet.load(sprite_sheet, bpp)
 
     def load(self, tmx_map):
         """
@@ -144,9 +522,11 @@ class Map(Exporter):
         """
         # Set the magic number and version.
         self.magic = bytearray(b'TMX')
-        self.version = 1
+        self.version = self.VERSION_SPARSE
+        profiler = self.profiler
 
-        tiled_map = pytmx.TiledMap(tmx_map, allow_duplicate_names=True, load_all_tiles=True)
+        with profiler.stage('tmx_parse'):
+            tiled_map = tmxreader.read_tmx(tmx_map)
 
         # Set the common map properties.
         self.name = bytearray(tiled_map.name.encode('ascii'))
@@ -156,18 +536,18 @@ class Map(Exporter):
         self.height = tiled_map.height
 
         # (HACK): Background offset is fixed by field offset in the map struct.
-        self.background_offset = sum(struct.calcsize(fmt) for _, fmt in self.fields)
+        self.background_offset = self.header().size
 
         # This will be updated as each tile is added
         self.sprite_offset = self.background_offset
 
-        # (HACK): Not supporting multiple layers
-        layer = tiled_map.layers[0]
-
         # (HACK): Not support multiple sprite sheets
-        sprite_sheet = pathlib.Path(tmx_map).parent / pathlib.Path(tiled_map.tilesets[0].source)
+        sprite_sheet = pathlib.Path(tmx_map).parent / pathlib.Path(tiled_map.tilesets[0].image)
 
-        # Load all non-zero tile from the layer.
+        # Load all non-zero tile from the layer. Tile ids are 16x16 tiles of
+        # the 8 tile wide tileset, converted to their first 8x8 character.
+        profiler.begin('layers')
+        layers = []
         for layer in tiled_map.layers:
             if not layer.name.startswith('BG'):
                 continue
@@ -175,21 +555,58 @@ class Map(Exporter):
             background = Background()
             background.num_tiles = 0
             background.id = int(layer.name[-1])
-            for x, y, gid in layer.iter_data():
-                if gid == 0:
-                    continue
-
-                tid = tiled_map.tiledgidmap[gid]
-
-                # Add the tile and increment the counter tracking
-                index = (y * 0x20) + x # (HACK): Hardcoded map size and assumes 8x8
-                ntid = 2 * (tid - 1)
-                ntid += ((tid - 1) // 8) * 16
-                tile = Tile(ntid, version=0, index=index)
-                background.append(tile)
-                background.num_tiles += 1
-            print(f'num_tiles: {hex(background.num_tiles)}')
-
+            tile_ids = layer.tile_ids()
+            ys, xs = np.nonzero(tile_ids)
+            tid = tile_ids[ys, xs].astype(np.int64) - 1
+            ntid = 2 * tid + (tid // 8) * 16
+            cells = np.empty(len(xs), dtype=Background.CELL_DTYPE)
+            cells['x'], cells['y'], cells['ntid'] = xs, ys, ntid
+            layers.append((background, cells))
+        profiler.end('layers')
+
+        # Depth of the sheet, from the BG mode unless it is forced
+        bpp = self.bg_depth(layers) if self.bpp == 'auto' else self.bpp
+        bpp = self.engine_bpp(bpp)
+
+        # Read the sheet that goes with the tileset. Exported sheets are 4bpp,
+        # a sheet encoded from the image is encoded at the depth of the BGs.
+        path = sprite_sheet.with_suffix('.bin')
+        with profiler.stage('read_sheet'):
+            if path.is_file():
+                sheet_data = warmcache.files.load(path, bytes, 'raw')
+                sheet_bpp = 4
+            else:
+                sheet_data = self.encode_sheet(sprite_sheet, path, bpp).chars
+                sheet_bpp = bpp
+
+        # Collapse duplicate and mirrored tiles before encoding the layers
+        if self.optimize_tiles:
+            with profiler.stage('optimize_tiles'):
+                sheet_data = self.load_optimized_tiles(layers, sheet_data, sheet_bpp)
+
+        # Convert the sheet to the chosen depth, if the colors allow
+        with profiler.stage('check_bpp'):
+            self.check_bpp(layers, sheet_data, sheet_bpp, bpp)
+            sheet_data = snesgfx.convert_planar(sheet_data, sheet_bpp, bpp)
+        logger.info('sheet: %d chars at %dbpp, %d bytes',
+                    len(sheet_data) // snesgfx.char_bytes(bpp), bpp, len(sheet_data))
+
+        profiler.begin('encode')
+        if self.bg_encoding == 'metatile':
+            metatiles = self.load_metatiles(layers)
+        else:
+            metatiles = None
+            for background, cells in layers:
+                if self.is_dense(len(cells)):
+                    background.load_dense(cells, self.width, self.height)
+                    self.version = self.VERSION_DENSE
+                    logger.info('num_tiles: %s (dense, %s words)', hex(len(cells)),
+                                hex(background.num_tiles))
+                else:
+                    background.load_sparse(cells)
+                    logger.info('num_tiles: %s', hex(background.num_tiles))
+
+        for background, _ in layers:
             # Update the sprite offset for data tracking
             self.sprite_offset += background.num_bytes()
             self.num_backgrounds += 1
@@ -197,22 +614,25 @@ class Map(Exporter):
             # Update the background data for the map
             self.append(background)
 
+        # The metatile dictionary follows the last background
+        if metatiles is not None:
+            self.sprite_offset += metatiles.num_bytes()
+            self.append(metatiles)
+        profiler.end('encode')
+
         # Update the palette offset for data tracking
         self.palette_offset = self.sprite_offset
 
         # Get the sprite sheet and load the palette.
         sprite = SpriteSheet()
         sprite.magic = bytearray(b'SPR')
-        sprite.bpp = 4
+        sprite.bpp = bpp
         sprite.width = 16
         sprite.height = 16
         sprite.num_rows = 3
         sprite.num_cols = 3
-        path = sprite_sheet.with_suffix('.bin')
-        with open(path, 'rb') as fd:
-            data_4bpp = fd.read()
-            sprite.data.extend(data_4bpp)
-            sprite.size = len(data_4bpp)
+        sprite.extend(sheet_data)
+        sprite.size = len(sheet_data)
         self.append(sprite)
 
         # Update the palette offset for data tracking
@@ -221,25 +641,41 @@ class Map(Exporter):
         # Load color data for the sprite sheet.
         palette = Palette()
         palette.magic = bytearray(b'PAL')
-        palette.num_colors = 16
+        palette.num_colors = (1 << bpp) & 0xFF     # 0 for the 256 colors of 8bpp
         path = sprite_sheet.with_suffix('.pal')
         self.object_offset = self.palette_offset
-        with open(path, 'rb') as fd:
-            data_pal = fd.read()
-            bgr555_data = self.rgb_to_bgr555(data_pal)
+        with profiler.stage('palette'):
+            if path.is_file():
+                bgr555_data = warmcache.files.load(path, self.rgb_to_bgr555, 'bgr555')
+            else:
+                palette_rgb = self.encode_sheet(sprite_sheet, path, bpp).palette
+                bgr555_data = self.rgb_to_bgr555(palette_rgb)
             palette.size = len(bgr555_data)
             print('pal', palette.size)
-            palette.data.extend(bgr555_data)
+            palette.extend(bgr555_data)
         self.append(palette)
 
         # Update the object offset for data tracking
         self.object_offset += palette.num_bytes()
 
+        if profiler.enabled:
+            profiler.count('backgrounds', len(layers))
+            profiler.count('tiles', sum(len(cells) for _, cells in layers))
+            profiler.count('sheet_chars', len(sheet_data) // snesgfx.char_bytes(bpp))
+            profiler.count('sheet_bpp', bpp)
+            profiler.count('bytes/header', self.background_offset)
+            profiler.count('bytes/backgrounds',
+                           sum(background.num_bytes() for background, _ in layers))
+            if metatiles is not None:
+                profiler.count('bytes/metatiles', metatiles.num_bytes())
+            profiler.count('bytes/sheet', sprite.num_bytes())
+            profiler.count('bytes/palette', palette.num_bytes())
+
         print(self.sprite_offset)
         print(self.palette_offset)
 
 
-def main():
+def main(argv=None):
     """
     Load a Tiled map and export it to a binary file that can be
     loaded by the game.
@@ -247,12 +683,63 @@ def main():
     args = argparse.ArgumentParser()
     args.add_argument('input')
     args.add_argument('output')
-    parsed = args.parse_args()
+    args.add_argument('--bg-encoding', choices=('sparse', 'dense', 'auto', 'metatile'),
+                      default='sparse',
+                      help='Background layer encoding, auto picks by occupancy')
+    args.add_argument('--dense-threshold', type=float, default=0.5,
+                      help='Occupancy at which auto picks a dense tilemap')
+    args.add_argument('--metatile-size', type=int, choices=(2, 4), default=2,
+                      help='Width and height of a metatile in tiles')
+    args.add_argument('--optimize-tiles', action='store_true',
+                      help='Collapse duplicate and mirrored tiles in the sheet')
+    args.add_argument('--bpp', choices=('auto', '2', '4', '8'), default='auto',
+                      help='Bits per pixel of the sheet, auto uses the depth of the BGs')
+    args.add_argument('--bg-mode', type=int, choices=sorted(snesgfx.BG_MODE_BPP), default=1,
+                      help='BG mode the map is shown in, for --bpp auto')
+    args.add_argument('--no-engine-check', dest='engine_check', action='store_false',
+                      help='Allow sheet depths other than the 4bpp the engine loads')
+    args.add_argument('--profile', nargs='?', const='-',
+                      help='Write stage timings and counters as JSON, to stdout without a file')
+    args.add_argument('--cprofile', type=str,
+                      help='Write a cProfile dump of the conversion to this file')
+    args.add_argument('-l', '--loglevel', type=str, default='INFO')
+    parsed = args.parse_args(argv)
+
+    logging.basicConfig(level=parsed.loglevel)
+
+    profiler = Profiler(enabled=bool(parsed.profile or parsed.cprofile),
+                        cprofile=bool(parsed.cprofile))
+    profiler.start()
 
     # Create the map and export it.
-    tile_map = Map(parsed.input)
-    with open(parsed.output, 'wb') as f:
-        f.write(tile_map.pack())
-    
+    with profiler.stage('load'):
+        tile_map = Map(parsed.input, bg_encoding=parsed.bg_encoding,
+                       dense_threshold=parsed.dense_threshold,
+                       metatile_size=parsed.metatile_size,
+                       optimize_tiles=parsed.optimize_tiles,
+                       bpp=parsed.bpp if parsed.bpp == 'auto' else int(parsed.bpp),
+                       bg_mode=parsed.bg_mode,
+                       engine_check=parsed.engine_check,
+                       profiler=profiler)
+    with profiler.stage('pack'):
+        data = tile_map.pack()
+    with profiler.stage('write'), open(parsed.output, 'wb') as f:
+        f.write(data)
+    profiler.stop()
+    profiler.count('bytes', len(data))
+
+    if parsed.cprofile:
+        profiler.dump(parsed.cprofile)
+    if parsed.profile == '-':
+        import sys
+        json.dump(profiler.to_dict(), sys.stdout, indent=1)
+        sys.stdout.write('\n')
+    elif parsed.profile:
+        with open(parsed.profile, 'w') as f:
+            json.dump(profiler.to_dict(), f, indent=1)
+
+    return 0
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    import sys
+    sys.exit(main(sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Minimal reader for the Tiled maps (.tmx) and tilesets (.tsx) used by the
+converters.
+
+Only what tiled2bin needs is read: the map size and properties, the
+tilesets with the path of their image, and the tile layers. The map is
+parsed incrementally and the data of every layer, CSV or base64 with
+optional zlib or gzip compression, is decoded straight into a NumPy array
+of global tile ids. Tile images are never loaded.
+
+    tmx = read_tmx('resources/maps/Skyscraper.tmx')
+    for layer in tmx.layers:
+        tile_ids = layer.tile_ids()     # height x width, flip bits cleared
+
+Infinite maps and the deprecated XML layer encoding are not supported.
+"""
+import base64
+import gzip
+import xml.etree.ElementTree as ET
+import zlib
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+GID_FLIP_H = 1 << 31
+GID_FLIP_V = 1 << 30
+GID_FLIP_D = 1 << 29
+GID_FLAGS = GID_FLIP_H | GID_FLIP_V | GID_FLIP_D
+"""Flip bits of a global tile id in the layer data."""
+
+
+@dataclass
+class TmxTileset:
+    """
+    A tileset referenced by the map, either embedded or from a .tsx file.
+    """
+    firstgid: int               # Global id of the first tile
+    name: str = ""
+    tilewidth: int = 0
+    tileheight: int = 0
+    tilecount: int = 0
+    columns: int = 0
+    source: Optional[str] = None  # .tsx file relative to the map, if external
+    image: Optional[str] = None   # Tileset image relative to the map
+
+
+@dataclass
+class TmxLayer:
+    """
+    A tile layer and its global tile ids, flip bits included.
+    """
+    id: int
+    name: str
+    width: int
+    height: int
+    gids: np.ndarray            # height x width uint32
+
+    def tile_ids(self) -> np.ndarray:
+        """
+        :return: The global tile ids without their flip bits.
+        """
+        return self.gids & ~np.uint32(GID_FLAGS)
+
+
+@dataclass
+class TmxMap:
+    """
+    The parts of a Tiled map the converters use.
+    """
+    path: Path
+    width: int = 0
+    height: int = 0
+    tilewidth: int = 0
+    tileheight: int = 0
+    properties: Dict[str, str] = field(default_factory=dict)
+    tilesets: List[TmxTileset] = field(default_factory=list)
+    layers: List[TmxLayer] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        """
+        :return: The name property of the map, or the file name without suffix.
+        """
+        return self.properties.get('name', self.path.stem)
+
+
+def decode_data(data: ET.Element, width: int, height: int) -> np.ndarray:
+    """
+    Decodes the <data> of a tile layer.
+    :param data: The <data> element.
+    :param width: Width of the layer in tiles.
+    :param height: Height of the layer in tiles.
+    :return: height x width array of global tile ids.
+    """
+    if data.find('chunk') is not None:
+        raise ValueError('Infinite maps are not supported')
+    encoding = data.get('encoding')
+    compression = data.get('compression')
+    text = (data.text or '').strip()
+
+    if encoding == 'csv':
+        gids = np.fromstring(text, dtype=np.uint32, sep=',')
+    elif encoding == 'base64':
+        raw = base64.b64decode(text)
+        if compression == 'zlib':
+            raw = zlib.decompress(raw)
+        elif compression == 'gzip':
+            raw = gzip.decompress(raw)
+        elif compression:
+            raise ValueError(f'Unsupported layer compression: {compression}')
+        gids = np.frombuffer(raw, dtype='<u4').astype(np.uint32)
+    else:
+        raise ValueError(f'Unsupported layer encoding: {encoding or "xml"}, '
+                         'save the map as CSV or base64')
+
+    if gids.size != width * height:
+        raise ValueError(f'Layer data has {gids.size} tiles, expected {width}x{height}')
+    return gids.reshape(height, width)
+
+
+def read_tileset(element: ET.Element, base: Path) -> TmxTileset:
+    """
+    :param element: A <tileset> element of the map.
+    :param base: Directory of the map.
+    :return: The tileset, read from its .tsx file if it is external.
+    """
+    tileset = TmxTileset(int(element.get('firstgid', 1)))
+    source = element.get('source')
+    if source:
+        tileset.source = source
+        element = ET.parse(base / source).getroot()
+    tileset.name = element.get('name', '')
+    for name in ('tilewidth', 'tileheight', 'tilecount', 'columns'):
+        setattr(tileset, name, int(element.get(name, 0)))
+
+    # Images of external tilesets are relative to the .tsx file
+    image = element.find('image')
+    if image is not None:
+        tileset.image = image.get('source')
+        if source:
+            tileset.image = str(Path(source).parent / tileset.image)
+    return tileset
+
+
+def read_tmx(path) -> TmxMap:
+    """
+    Reads a Tiled map, decoding every tile layer as it is parsed.
+    :param path: Path to the .tmx file.
+    :return: The map.
+    """
+    path = Path(path)
+    tmx = TmxMap(path)
+    stack = []
+    for event, element in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element.tag)
+            if element.tag == 'map' and len(stack) == 1:
+                for name in ('width', 'height', 'tilewidth', 'tileheight'):
+                    setattr(tmx, name, int(element.get(name, 0)))
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if element.tag == 'property' and stack[-2:] == ['map', 'properties']:
+            tmx.properties[element.get('name')] = element.get('value', element.text)
+        elif element.tag == 'tileset' and parent == 'map':
+            tmx.tilesets.append(read_tileset(element, path.parent))
+            element.clear()
+        elif element.tag == 'layer':
+            width, height = int(element.get('width')), int(element.get('height'))
+            tmx.layers.append(TmxLayer(int(element.get('id', 0)), element.get('name', ''),
+                                       width, height,
+                                       decode_data(element.find('data'), width, height)))
+            element.clear()
+    return tmx
@@ -0,0 +1,296 @@
+"""
+VRAM allocation planner for the converted sprites, maps and fonts.
+
+What this script plans
+======================
+docs/vram-layout.md splits VRAM into fixed regions. This script reads the
+generated assets, computes how many words of characters each of them needs
+and packs them into those regions:
+
+    obj-page0   $6000-$6FFF  Sprite sheets, OAM name table 0
+    obj-page1   $7000-$7FFF  Sprite sheets, OAM name table 1
+    bg12        $3000-$4FFF  4BPP map characters for BG1/BG2
+    bg34        $5000-$5FFF  2BPP font characters for BG3/BG4
+
+All addresses are VRAM word addresses, one 8x8 4BPP character is 16 words.
+
+Sprites
+=======
+Every sprite sheet is resident at once. A sheet is placed on a 16 character
+row (256 words) so the column of large objects wraps the same way as in the
+converted sheet, and it never crosses into the other name table since the
+name of an object only selects the table once.
+
+Maps and fonts
+==============
+Only one map is loaded at a time, so every map is planned on its own against
+the bg12 region. Fonts stay resident in bg34. The character base of a
+background (BG12NBA/BG34NBA) is set in steps of $1000 words, so map and font
+characters start on a $1000 word boundary.
+
+Inputs
+======
+Sprites and maps are read and validated with assetinspect.py. Files that do
+not validate, such as a .sprite left over from an older converter, are
+skipped with a warning instead of being planned from a broken header.
+
+Output
+======
+The chosen addresses are written as .define lines (resources/vram.i by
+default) and a report of the used, free and largest free words per region is
+logged. The script exits with status 1 when anything does not fit.
+
+    .define Sprite_Plane@VRAM                       $7000
+    .define Sprite_Plane@Name                       $100
+    .define Map_Skyscraper@CharVRAM                 $3000
+    .define Font_8x8@CharVRAM                       $5000
+
+Usage
+=====
+    python tools/vramplan.py
+    python tools/vramplan.py --report build/vram.json
+    python tools/vramplan.py --sprite plane --sprite boss --sprite names
+"""
+import json
+import logging
+import struct
+import sys
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import assetinspect
+
+
+logger = logging.getLogger('vramplan')
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+"""Root of the repository."""
+
+WORDS_PER_CHAR_4BPP = 16
+"""VRAM words of a single 8x8 4BPP character."""
+
+SHEET_ROW_WORDS = 16 * WORDS_PER_CHAR_4BPP
+"""VRAM words of a row of 16 characters."""
+
+BG_CHAR_ALIGN = 0x1000
+"""VRAM word alignment of a BG character base (BG12NBA/BG34NBA)."""
+
+OBJ_NAME_BASE = 0x6000
+"""VRAM word address of OAM name 0 (OBSEL base)."""
+
+
+@dataclass
+class Region:
+    """
+    A range of VRAM word addresses and what has been placed in it.
+    """
+    name: str
+    start: int                  # First word address
+    end: int                    # One past the last word address
+    used: List[Tuple[int, int, str]] = field(default_factory=list)
+
+    def free_spans(self) -> List[Tuple[int, int]]:
+        """
+        :return: Sorted list of (start, end) free word ranges.
+        """
+        spans = []
+        cursor = self.start
+        for start, end, _ in sorted(self.used):
+            if start > cursor:
+                spans.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < self.end:
+            spans.append((cursor, self.end))
+        return spans
+
+    def allocate(self, name: str, words: int, align: int) -> Optional[int]:
+        """
+        Places words in the first free span that fits them.
+        :return: The word address or None if the region is full.
+        """
+        for start, end in self.free_spans():
+            address = -(-start // align) * align
+            if address + words <= end:
+                self.used.append((address, address + words, name))
+                return address
+        return None
+
+    def report(self) -> dict:
+        spans = self.free_spans()
+        free = sum(end - start for start, end in spans)
+        largest = max((end - start for start, end in spans), default=0)
+        return {
+            'start': self.start,
+            'end': self.end,
+            'used': (self.end - self.start) - free,
+            'free': free,
+            'largest_free': largest,
+            'fragmentation': round(1 - largest / free, 3) if free else 0.0,
+            'items': [{'name': name, 'start': start, 'words': end - start}
+                      for start, end, name in sorted(self.used)],
+        }
+
+
+@dataclass
+class Asset:
+    """
+    Characters of a converted asset that need a place in VRAM.
+    """
+    kind: str                   # "sprite", "map" or "font"
+    name: str                   # Name used for the defines
+    path: Path                  # Generated file the size was read from
+    words: int                  # Size of the characters in words
+    address: Optional[int] = None
+
+    @property
+    def define(self) -> str:
+        return {'sprite': 'Sprite', 'map': 'Map', 'font': 'Font'}[self.kind] + f'_{self.name}'
+
+
+def sheet_words(path: Path) -> int:
+    """
+    :param path: A .sprite file or a map .bin file.
+    :return: Words of the sprite sheet or of the characters of the map.
+    :raise ValueError: When the file does not validate, see assetinspect.
+    """
+    view = assetinspect.open_asset(path)
+    view.validate()
+    return len(view.sheet) // 2
+
+
+def discover(root: Path, sprites: Optional[List[str]] = None) -> List[Asset]:
+    """
+    Finds the generated sprites, maps and fonts below the resources root.
+    :param root: The resources directory.
+    :param sprites: Directory names of the resident sprites, all if None.
+    :return: List of assets, not yet placed.
+    """
+    assets = []
+    for path in assetinspect.discover(root):
+        if path.suffix == '.sprite' and sprites is not None and path.stem not in sprites:
+            continue
+        try:
+            words = sheet_words(path)
+        except (ValueError, struct.error) as e:
+            logger.warning('Skipping %s: %s', path, e)
+            continue
+        if path.suffix == '.sprite':
+            assets.append(Asset('sprite', path.stem.title().replace('-', '_'), path, words))
+        else:
+            assets.append(Asset('map', path.stem, path, words))
+    for path in sorted((root / 'fonts').glob('*-font.bin')):
+        name = path.stem[:-len('-font')].replace('-', '_')
+        assets.append(Asset('font', name, path, path.stat().st_size // 2))
+    return assets
+
+
+def plan(assets: List[Asset]) -> Tuple[Dict[str, Region], List[Asset]]:
+    """
+    Places every asset, largest first, into the first region that fits.
+    :param assets: From discover(), updated in place with the addresses.
+    :return: (regions, assets that did not fit)
+    """
+    regions = {
+        'obj-page0': Region('obj-page0', 0x6000, 0x7000),
+        'obj-page1': Region('obj-page1', 0x7000, 0x8000),
+        'bg34': Region('bg34', 0x5000, 0x6000),
+    }
+    overflow = []
+
+    # Resident assets share their regions
+    resident = [a for a in assets if a.kind != 'map']
+    for asset in sorted(resident, key=lambda a: -a.words):
+        if asset.kind == 'sprite':
+            words = -(-asset.words // SHEET_ROW_WORDS) * SHEET_ROW_WORDS
+            candidates = [regions['obj-page0'], regions['obj-page1']]
+            align = SHEET_ROW_WORDS
+        else:
+            words = asset.words
+            candidates = [regions['bg34']]
+            align = BG_CHAR_ALIGN
+        for region in candidates:
+            asset.address = region.allocate(asset.name, words, align)
+            if asset.address is not None:
+                break
+        else:
+            overflow.append(asset)
+
+    # Maps are swapped in one at a time, each gets the whole region
+    for asset in (a for a in assets if a.kind == 'map'):
+        region = Region(f'bg12:{asset.name}', 0x3000, 0x5000)
+        asset.address = region.allocate(asset.name, asset.words, BG_CHAR_ALIGN)
+        regions[region.name] = region
+        if asset.address is None:
+            overflow.append(asset)
+
+    return regions, overflow
+
+
+def defines(assets: List[Asset]) -> str:
+    """
+    :param assets: Placed assets.
+    :return: Contents of the generated .i file.
+    """
+    lines = ['; Generated by vramplan.py']
+    for asset in assets:
+        if asset.address is None:
+            continue
+        if asset.kind == 'sprite':
+            name = (asset.address - OBJ_NAME_BASE) // WORDS_PER_CHAR_4BPP
+            lines.append(f'.define {(asset.define + "@VRAM").ljust(40)} ${asset.address:04X}')
+            lines.append(f'.define {(asset.define + "@Name").ljust(40)} ${name:03X}')
+        else:
+            lines.append(f'.define {(asset.define + "@CharVRAM").ljust(40)} ${asset.address:04X}')
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Plan the VRAM placement of sprite, map and font characters",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog="Example: python vramplan.py --report build/vram.json")
+    parser.add_argument("-r", "--resources", type=str,
+                        default=str(ROOT_DIR / "resources"))
+    parser.add_argument("-o", "--output", type=str,
+                        default=str(ROOT_DIR / "resources" / "vram.i"))
+    parser.add_argument("-s", "--sprite", type=str, action="append",
+                        help="Resident sprite, may be repeated (default: all)")
+    parser.add_argument("--report", type=str,
+                        help="Also write the report as JSON")
+    parser.add_argument("-l", "--loglevel", type=str, default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.loglevel)
+
+    assets = discover(Path(args.resources).resolve(), args.sprite)
+    regions, overflow = plan(assets)
+
+    report = {name: region.report() for name, region in regions.items()}
+    for name, region in report.items():
+        logger.info('%-24s used $%04X free $%04X largest free $%04X (%.0f%% fragmented)',
+                    name, region['used'], region['free'], region['largest_free'],
+                    region['fragmentation'] * 100)
+    for asset in assets:
+        if asset.address is not None:
+            logger.debug('%-24s $%04X %d words', asset.define, asset.address, asset.words)
+    for asset in overflow:
+        logger.error('%s does not fit (%d words)', asset.define, asset.words)
+
+    with open(args.output, 'w') as f:
+        f.write(defines(assets))
+    if args.report:
+        report = {
+            'regions': report,
+            'overflow': [asset.define for asset in overflow],
+        }
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+    return 1 if overflow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
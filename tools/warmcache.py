@@ -0,0 +1,56 @@
+"""
+In-memory cache of the parsed inputs of the converters.
+
+The converters read their JSON exports, palettes and sheets through
+files.load(), which keeps the parsed contents of every file for the life of
+the process and parses a file again only once its size or modification time
+changed. A single conversion reads every file once, so this only pays off
+when many conversions run in one process, as in assetbuild.py --watch where
+the inputs of the assets that were not saved stay warm between rebuilds.
+
+Cached values are shared between conversions and must not be modified.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+
+class FileCache:
+    """
+    Parsed file contents, memoized by (size, mtime) like the digests of
+    assetbuild.FileDigests.
+    """
+
+    def __init__(self):
+        self.entries: Dict[Tuple[str, str], Tuple[int, int, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: Path, parse: Callable[[bytes], Any], kind: str) -> Any:
+        """
+        :param path: File to read.
+        :param parse: Converts the contents of the file, e.g. json.loads.
+        :param kind: Name of what parse returns, a file is cached once per kind.
+        :return: The parsed contents, read again only if the file changed.
+        """
+        path = Path(path)
+        stat = path.stat()
+        key = (str(path.resolve()), kind)
+        entry = self.entries.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        with open(path, 'rb') as f:
+            value = parse(f.read())
+        self.entries[key] = (stat.st_size, stat.st_mtime_ns, value)
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+files = FileCache()
+"""Cache shared by every converter of the process."""